@@ -0,0 +1,82 @@
+import java.io.BufferedReader;
+import java.io.File;
+import java.io.FileDescriptor;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStreamReader;
+import java.io.PrintStream;
+
+import javax.xml.transform.stream.StreamSource;
+import javax.xml.validation.Schema;
+import javax.xml.validation.SchemaFactory;
+import javax.xml.validation.Validator;
+
+import org.xml.sax.ErrorHandler;
+import org.xml.sax.SAXException;
+import org.xml.sax.SAXParseException;
+
+/**
+ * Long lived Xerces XSD 1.1 validator. The schema is compiled once, then
+ * one file path is read per line on stdin and for each path zero or more
+ * error lines, line TAB column TAB message, are written followed by
+ * DONE TAB number_of_errors.
+ *
+ * Used by xerces_validate.py, which compiles this with javac on first use.
+ */
+public class XercesValidateWorker {
+
+    static class Reporter implements ErrorHandler {
+        PrintStream out;
+        int count = 0;
+
+        Reporter(PrintStream out) {
+            this.out = out;
+        }
+
+        public void warning(SAXParseException e) {
+        }
+
+        public void error(SAXParseException e) {
+            report(e.getLineNumber(), e.getColumnNumber(), e.getMessage());
+        }
+
+        public void fatalError(SAXParseException e) {
+            report(e.getLineNumber(), e.getColumnNumber(), e.getMessage());
+        }
+
+        void report(int line, int column, String message) {
+            count++;
+            out.println(line + "\t" + column + "\t" + String.valueOf(message).replaceAll("\\s+", " "));
+        }
+    }
+
+    public static void main(String[] args) throws Exception {
+        if (args.length != 1) {
+            System.err.println("Usage: java XercesValidateWorker <schema.xsd>");
+            System.exit(1);
+        }
+        SchemaFactory factory = SchemaFactory.newInstance("http://www.w3.org/XML/XMLSchema/v1.1");
+        Schema schema = factory.newSchema(new File(args[0]));
+        BufferedReader in = new BufferedReader(new InputStreamReader(System.in, "UTF-8"));
+        PrintStream out = new PrintStream(new FileOutputStream(FileDescriptor.out), true, "UTF-8");
+        String path;
+        while ((path = in.readLine()) != null) {
+            if (path.length() == 0) {
+                continue;
+            }
+            Reporter reporter = new Reporter(out);
+            Validator validator = schema.newValidator();
+            validator.setErrorHandler(reporter);
+            try {
+                validator.validate(new StreamSource(new File(path)));
+            } catch (SAXParseException e) {
+                // already reported to the error handler
+            } catch (SAXException e) {
+                reporter.report(-1, -1, e.getMessage());
+            } catch (IOException e) {
+                reporter.report(-1, -1, e.toString());
+            }
+            out.println("DONE\t" + reporter.count);
+        }
+    }
+}
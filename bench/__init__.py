@@ -0,0 +1,8 @@
+'''
+Benchmarks for the conversion, run from the top of the repository, ie
+
+    python -m bench.generate /tmp/benchdata --stations 100
+    python -m bench.run --scales 10,100,1000 -o results.json
+    python -m bench.compare old.json results.json
+    python -m bench.memory --stations 1000 -o mem.json
+'''
@@ -0,0 +1,73 @@
+#! /usr/bin/python
+'''
+Compare two bench/run.py result files, ie from before and after a change,
+printing the min time of each benchmark and scale in both and new/old.
+'''
+import argparse
+import json
+import sys
+
+def loadResults(filename):
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+def formatTable(headers, rows):
+    '''lines of a plain text table, columns right aligned except the first'''
+    cells = [[str(h) for h in headers]]+[[str(c) for c in row] for row in rows]
+    widths = [max(len(row[i]) for row in cells) for i in range(len(headers))]
+    lines = []
+    for n, row in enumerate(cells):
+        line = [row[0].ljust(widths[0])]+[row[i].rjust(widths[i]) for i in range(1, len(row))]
+        lines.append("  ".join(line))
+        if n == 0:
+            lines.append("  ".join("-"*w for w in widths))
+    return lines
+
+def formatRatio(old, new):
+    if old is None or new is None or old == 0:
+        return "-"
+    return "%.2f"%(new/old,)
+
+def compareResults(old, new, key='min'):
+    '''rows of benchmark, scale, old, new, new/old for the union of both results'''
+    oldByKey = dict(((r['benchmark'], r['scale']), r) for r in old['results'])
+    newByKey = dict(((r['benchmark'], r['scale']), r) for r in new['results'])
+    order = []
+    for r in old['results']+new['results']:
+        k = (r['benchmark'], r['scale'])
+        if k not in order:
+            order.append(k)
+    rows = []
+    for k in order:
+        o = oldByKey[k][key] if k in oldByKey else None
+        n = newByKey[k][key] if k in newByKey else None
+        rows.append([k[0], k[1],
+                     "%.4f"%(o,) if o is not None else "-",
+                     "%.4f"%(n,) if n is not None else "-",
+                     formatRatio(o, n)])
+    return rows
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Compare two benchmark result files.')
+  parser.add_argument('old', help="results of the baseline")
+  parser.add_argument('new', help="results to compare with the baseline")
+  parser.add_argument('--key', choices=['min', 'median'], default='min', help="which time to compare")
+  return parser.parse_args()
+
+def main():
+    parseArgs = initArgParser()
+    old = loadResults(parseArgs.old)
+    new = loadResults(parseArgs.new)
+    if old.get('params') != new.get('params'):
+        print("WARNING: results were generated with different parameters")
+        print("  old: %s"%(old.get('params'),))
+        print("  new: %s"%(new.get('params'),))
+    print("old: %s %s"%(old.get('git'), old.get('created')))
+    print("new: %s %s"%(new.get('git'), new.get('created')))
+    headers = ['benchmark', 'stations', 'old %s s'%(parseArgs.key,), 'new %s s'%(parseArgs.key,), 'new/old']
+    for line in formatTable(headers, compareResults(old, new, parseArgs.key)):
+        print(line)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+#! /usr/bin/python
+'''
+Deterministic synthetic FDSN StationXML and NRL for benchmarks. The same
+parameters and seed always give the same files.
+
+The NRL has numsensors sensor and numloggers datalogger RESP files plus the
+logger sample rate index. Each channel epoch in the StationXML uses one of a
+pool of instrument configurations, a sensor and logger pair. With sharing
+1.0 all epochs draw from as few configurations as there are NRL sensor and
+logger pairs, with 0.0 every epoch has its own. Configurations beyond the
+NRL pairs get a changed sensor gain, so they do not match the NRL and are
+written as ResponseDicts.
+'''
+import checkNRL as checkNRL
+
+import argparse
+import math
+import os
+import random
+
+CHANNEL_CODES = ['HHZ', 'HHN', 'HHE', 'BHZ', 'BHN', 'BHE', 'LHZ', 'LHN', 'LHE', 'HNZ', 'HNN', 'HNE']
+LOGGER_RATES = [1000.0, 400.0, 200.0, 500.0, 2000.0, 800.0]
+
+BASE_POLES = [(-0.037004, 0.037004), (-0.037004, -0.037004), (-251.33, 0.0), (-131.04, -467.29), (-131.04, 467.29),
+              (-6.54, 0.0), (-1.2e3, 6.1e2), (-1.2e3, -6.1e2)]
+BASE_ZEROS = [(0.0, 0.0), (0.0, 0.0), (-31.63, 0.0), (-160.0, 0.0)]
+ATOD_GAIN = 4.0e5
+
+LETTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+BASE36 = "0123456789"+LETTERS
+
+class GeneratorParams(object):
+    '''sizes and shape of the generated StationXML and NRL'''
+
+    def __init__(self, networks=1, stations=10, channels=3, epochs=1, firstages=2, firlength=16,
+                 sharing=0.9, numsensors=4, numloggers=4, numpoles=5, seed=1):
+        self.networks = networks
+        self.stations = stations
+        self.channels = channels
+        self.epochs = epochs
+        self.firstages = firstages
+        self.firlength = firlength
+        self.sharing = sharing
+        self.numsensors = numsensors
+        self.numloggers = numloggers
+        self.numpoles = numpoles
+        self.seed = seed
+
+    def numChannelEpochs(self):
+        return self.networks*self.stations*self.channels*self.epochs
+
+    def asdict(self):
+        return dict(vars(self))
+
+def firCoefficients(length, variant=0):
+    '''symmetric lowpass, Hann window normalized to unit sum, 6 significant digits'''
+    raw = [0.5-0.5*math.cos(2*math.pi*(i+1+0.1*variant)/(length+1+0.2*variant)) for i in range(length)]
+    total = sum(raw)
+    return [float("%.6g"%(c/total,)) for c in raw]
+
+class Sensor(object):
+    def __init__(self, index, numpoles):
+        scale = 1.0+0.1*index
+        self.name = "SENSOR%02d"%(index,)
+        self.poles = [(float("%.6g"%(p[0]*scale,)), float("%.6g"%(p[1]*scale,))) for p in BASE_POLES[:numpoles]]
+        self.zeros = BASE_ZEROS[:2+index%3]
+        self.a0 = float("%.6g"%(6.0077e7*scale,))
+        self.gain = float("%.6g"%(1500.0*(1+0.2*index),))
+
+class Logger(object):
+    def __init__(self, index, firstages, firlength):
+        self.name = "LOGGER%02d"%(index,)
+        self.rate = LOGGER_RATES[index%len(LOGGER_RATES)]
+        self.atodGain = ATOD_GAIN*(1+0.01*index)
+        self.preampGain = 1.0+index//len(LOGGER_RATES)
+        # alternate decimation by 2 and 5, each stage with its own FIR
+        self.firs = [(2 if i%2 == 0 else 5, firCoefficients(firlength+i, index)) for i in range(firstages)]
+        self.finalRate = self.rate
+        for factor, coefs in self.firs:
+            self.finalRate = self.finalRate/factor
+
+def sensorResp(sensor):
+    lines = ["#", "B050F03     Station:     XXXX", "#",
+             "B053F03     Transfer function type:                A [Laplace Transform (Rad/sec)]",
+             "B053F04     Stage sequence number:                 1",
+             "B053F05     Response in units lookup:              M/S - Velocity in Meters Per Second",
+             "B053F06     Response out units lookup:             V - Volts",
+             "B053F07     A0 normalization factor:               %E"%(sensor.a0,),
+             "B053F08     Normalization frequency:               +1.00000E+00",
+             "B053F09     Number of zeroes:                      %d"%(len(sensor.zeros),),
+             "B053F14     Number of poles:                       %d"%(len(sensor.poles),),
+             "#              Complex zeroes:"]
+    for i, z in enumerate(sensor.zeros):
+        lines.append("B053F10-13     %d  %+E  %+E  +0.00000E+00  +0.00000E+00"%(i, z[0], z[1]))
+    lines.append("#              Complex poles:")
+    for i, p in enumerate(sensor.poles):
+        lines.append("B053F15-18     %d  %+E  %+E  +0.00000E+00  +0.00000E+00"%(i, p[0], p[1]))
+    lines += ["#", "#                  +---------------------------------------+",
+              "B058F03     Stage sequence number:                 1",
+              "B058F04     Sensitivity:                           %E"%(sensor.gain,),
+              "B058F05     Frequency of sensitivity:              +1.00000E+00 HZ",
+              "B058F06     Number of calibrations:                0"]
+    return "\n".join(lines)+"\n"
+
+def _respDecimation(lines, stage, rate, factor):
+    lines += ["#", "#                  +---------------------------------------+",
+              "B057F03     Stage sequence number:                 %d"%(stage,),
+              "B057F04     Input sample rate:                     %E"%(rate,),
+              "B057F05     Decimation factor:                     %d"%(factor,),
+              "B057F06     Decimation offset:                     0",
+              "B057F07     Estimated delay (seconds):             +0.0000E+00",
+              "B057F08     Correction applied (seconds):          +0.0000E+00"]
+
+def _respGain(lines, stage, gain):
+    lines += ["#", "#                  +---------------------------------------+",
+              "B058F03     Stage sequence number:                 %d"%(stage,),
+              "B058F04     Sensitivity:                           %E"%(gain,),
+              "B058F05     Frequency of sensitivity:              +1.00000E+00 HZ",
+              "B058F06     Number of calibrations:                0"]
+
+def loggerResp(logger):
+    lines = ["#", "B050F03     Station:     XXXX"]
+    _respGain(lines, 2, logger.preampGain)
+    lines += ["#", "#                  +---------------------------------------+",
+              "B054F03     Transfer function type:                D",
+              "B054F04     Stage sequence number:                 3",
+              "B054F05     Response in units lookup:              V - Volts",
+              "B054F06     Response out units lookup:             COUNTS - Digital Counts",
+              "B054F07     Number of numerators:                  0",
+              "B054F10     Number of denominators:                0"]
+    _respDecimation(lines, 3, logger.rate, 1)
+    _respGain(lines, 3, logger.atodGain)
+    stage = 4
+    rate = logger.rate
+    for factor, coefs in logger.firs:
+        lines += ["#", "#                  +---------------------------------------+",
+                  "B054F03     Transfer function type:                D",
+                  "B054F04     Stage sequence number:                 %d"%(stage,),
+                  "B054F05     Response in units lookup:              COUNTS - Digital Counts",
+                  "B054F06     Response out units lookup:             COUNTS - Digital Counts",
+                  "B054F07     Number of numerators:                  %d"%(len(coefs),),
+                  "B054F10     Number of denominators:                0",
+                  "#              Numerator coefficients:"]
+        for i, c in enumerate(coefs):
+            lines.append("B054F08-09     %d  %+E  +0.00000E+00"%(i, c))
+        _respDecimation(lines, stage, rate, factor)
+        _respGain(lines, stage, 1.0)
+        rate = rate/factor
+        stage += 1
+    _respGain(lines, 0, 6.0e8)
+    return "\n".join(lines)+"\n"
+
+def generateNRL(nrlDir, params):
+    '''
+    write the sensor and logger RESP files and the sample rate index,
+    returns (list of Sensor, list of Logger)
+    '''
+    sensors = [Sensor(i, params.numpoles) for i in range(params.numsensors)]
+    loggers = [Logger(i, params.firstages, params.firlength) for i in range(params.numloggers)]
+    for sensor in sensors:
+        _write(os.path.join(nrlDir, 'sensors', 'bench', "RESP.XX.%s..BHZ.BENCH"%(sensor.name,)), sensorResp(sensor))
+    for logger in loggers:
+        _write(os.path.join(nrlDir, 'dataloggers', 'bench', "RESP.XX.%s..HHZ.BENCH.%g"%(logger.name, logger.finalRate)), loggerResp(logger))
+    checkNRL.saveFinalSampRate(nrlDir)
+    return sensors, loggers
+
+def _write(path, text):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f:
+        f.write(text)
+
+def _stageGain(parts, gain):
+    parts.append("<StageGain><Value>%g</Value><Frequency>1</Frequency></StageGain>"%(gain,))
+
+def _decimation(parts, rate, factor):
+    parts.append("<Decimation><InputSampleRate>%g</InputSampleRate><Factor>%d</Factor><Offset>0</Offset><Delay>0</Delay><Correction>0</Correction></Decimation>"%(rate, factor))
+
+def responseXML(parts, sensor, logger, gainScale):
+    sensorGain = sensor.gain*gainScale
+    parts.append("<Response><InstrumentSensitivity><Value>%g</Value><Frequency>1</Frequency><InputUnits><Name>M/S</Name></InputUnits><OutputUnits><Name>COUNTS</Name></OutputUnits></InstrumentSensitivity>"%(sensorGain*logger.preampGain*logger.atodGain,))
+    parts.append("<Stage number=\"1\"><PolesZeros><InputUnits><Name>M/S</Name></InputUnits><OutputUnits><Name>V</Name></OutputUnits>")
+    parts.append("<PzTransferFunctionType>LAPLACE (RADIANS/SECOND)</PzTransferFunctionType><NormalizationFactor>%g</NormalizationFactor><NormalizationFrequency>1</NormalizationFrequency>"%(sensor.a0,))
+    for i, z in enumerate(sensor.zeros):
+        parts.append("<Zero number=\"%d\"><Real>%g</Real><Imaginary>%g</Imaginary></Zero>"%(i, z[0], z[1]))
+    for i, p in enumerate(sensor.poles):
+        parts.append("<Pole number=\"%d\"><Real>%g</Real><Imaginary>%g</Imaginary></Pole>"%(i, p[0], p[1]))
+    parts.append("</PolesZeros>")
+    _stageGain(parts, sensorGain)
+    parts.append("</Stage><Stage number=\"2\">")
+    _stageGain(parts, logger.preampGain)
+    parts.append("</Stage><Stage number=\"3\"><Coefficients><InputUnits><Name>V</Name></InputUnits><OutputUnits><Name>COUNTS</Name></OutputUnits><CfTransferFunctionType>DIGITAL</CfTransferFunctionType></Coefficients>")
+    _decimation(parts, logger.rate, 1)
+    _stageGain(parts, logger.atodGain)
+    parts.append("</Stage>")
+    rate = logger.rate
+    for n, (factor, coefs) in enumerate(logger.firs):
+        parts.append("<Stage number=\"%d\"><Coefficients><InputUnits><Name>COUNTS</Name></InputUnits><OutputUnits><Name>COUNTS</Name></OutputUnits><CfTransferFunctionType>DIGITAL</CfTransferFunctionType>"%(n+4,))
+        parts.append("".join(["<Numerator>%g</Numerator>"%(c,) for c in coefs]))
+        parts.append("</Coefficients>")
+        _decimation(parts, rate, factor)
+        _stageGain(parts, 1.0)
+        parts.append("</Stage>")
+        rate = rate/factor
+    parts.append("</Response>")
+
+def configurations(params, sensors, loggers):
+    '''
+    list of (sensor, logger, gainScale), one per channel epoch in document
+    order, drawn from a pool sized by params.sharing
+    '''
+    numEpochs = params.numChannelEpochs()
+    numPairs = len(sensors)*len(loggers)
+    poolSize = max(1, int(round(numEpochs*(1.0-params.sharing))), min(numPairs, numEpochs))
+    pool = []
+    for i in range(poolSize):
+        pair = i%numPairs
+        # beyond the NRL pairs, change the sensor gain so it is not in the NRL
+        gainScale = 1.0+0.01*(i//numPairs)
+        pool.append((sensors[pair%len(sensors)], loggers[pair//len(sensors)], gainScale))
+    rng = random.Random(params.seed)
+    out = [pool[i%poolSize] for i in range(numEpochs)]
+    rng.shuffle(out)
+    return out
+
+def generateStationXML(filename, params, sensors, loggers):
+    configs = iter(configurations(params, sensors, loggers))
+    with open(filename, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+        f.write('<FDSNStationXML xmlns="http://www.fdsn.org/xml/station/1" schemaVersion="1.1"><Source>bench</Source><Created>2020-01-01T00:00:00</Created>\n')
+        for n in range(params.networks):
+            f.write("<Network code=\"%s\" startDate=\"2000-01-01T00:00:00\">"%(networkCode(n),))
+            for s in range(params.stations):
+                parts = ["<Station code=\"%s\" startDate=\"2000-01-01T00:00:00\"><Latitude>%.4f</Latitude><Longitude>%.4f</Longitude><Elevation>%d</Elevation><Site><Name>Site %d</Name></Site>"%(
+                         stationCode(s), 30+s%20*0.5, -120+s%40*0.5, 100+s%500, s)]
+                for c in range(params.channels):
+                    code = CHANNEL_CODES[c%len(CHANNEL_CODES)]
+                    locid = "%02d"%(c//len(CHANNEL_CODES),)
+                    for e in range(params.epochs):
+                        sensor, logger, gainScale = next(configs)
+                        start = "%04d-01-01T00:00:00"%(2000+2*e,)
+                        end = ""
+                        if e < params.epochs-1:
+                            end = " endDate=\"%04d-01-01T00:00:00\""%(2002+2*e,)
+                        parts.append("<Channel code=\"%s\" locationCode=\"%s\" startDate=\"%s\"%s><Latitude>34.0</Latitude><Longitude>-80.0</Longitude><Elevation>100</Elevation><Depth>0</Depth><Azimuth>%d</Azimuth><Dip>%d</Dip><SampleRate>%g</SampleRate>"%(
+                                     code, locid, start, end, 90 if code[2] == 'E' else 0, -90 if code[2] == 'Z' else 0, logger.finalRate))
+                        responseXML(parts, sensor, logger, gainScale)
+                        parts.append("</Channel>")
+                parts.append("</Station>")
+                f.write("".join(parts))
+            f.write("</Network>\n")
+        f.write("</FDSNStationXML>\n")
+
+def networkCode(i):
+    return LETTERS[i//26%26]+LETTERS[i%26]
+
+def stationCode(i):
+    '''S and 4 base 36 digits, unique for the first 36**4 stations'''
+    digits = ""
+    for k in range(4):
+        digits = BASE36[i%36]+digits
+        i = i//36
+    return "S"+digits
+
+def generate(outdir, params):
+    '''
+    write outdir/sta.xml and the NRL in outdir/nrl, returns the paths
+    '''
+    nrlDir = os.path.join(outdir, 'nrl')
+    staxml = os.path.join(outdir, 'sta.xml')
+    sensors, loggers = generateNRL(nrlDir, params)
+    generateStationXML(staxml, params, sensors, loggers)
+    return staxml, nrlDir
+
+def addGeneratorArgs(parser):
+  parser.add_argument('--networks', type=int, default=1, help="number of networks")
+  parser.add_argument('--stations', type=int, default=10, help="stations per network")
+  parser.add_argument('--channels', type=int, default=3, help="channels per station")
+  parser.add_argument('--epochs', type=int, default=1, help="epochs per channel")
+  parser.add_argument('--firstages', type=int, default=2, help="FIR decimation stages after the AtoD stage")
+  parser.add_argument('--firlength', type=int, default=16, help="numerator coefficients in the first FIR stage, later stages have one more each")
+  parser.add_argument('--sharing', type=float, default=0.9, help="0 to 1, how much channel epochs share responses, 0 is every epoch unique")
+  parser.add_argument('--numsensors', type=int, default=4, help="sensor RESP files in the NRL")
+  parser.add_argument('--numloggers', type=int, default=4, help="datalogger RESP files in the NRL")
+  parser.add_argument('--numpoles', type=int, default=5, help="poles per sensor, up to %d"%(len(BASE_POLES),))
+  parser.add_argument('--seed', type=int, default=1, help="random seed for assigning responses to epochs")
+
+def paramsFromArgs(parseArgs, **overrides):
+    kwargs = dict([(k, getattr(parseArgs, k)) for k in GeneratorParams().asdict().keys()])
+    kwargs.update(overrides)
+    return GeneratorParams(**kwargs)
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Generate synthetic StationXML and NRL for benchmarks.')
+  parser.add_argument('outdir', help="directory for sta.xml and nrl")
+  addGeneratorArgs(parser)
+  return parser.parse_args()
+
+def main():
+    parseArgs = initArgParser()
+    params = paramsFromArgs(parseArgs)
+    staxml, nrlDir = generate(parseArgs.outdir, params)
+    print("%s: %d channel epochs, NRL in %s"%(staxml, params.numChannelEpochs(), nrlDir))
+
+
+if __name__ == "__main__":
+    main()
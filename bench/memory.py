@@ -0,0 +1,237 @@
+#! /usr/bin/python
+'''
+Memory use of a conversion, stage by stage. The conversion runs as
+sta2extsta.py does, without java validation, with a tracemalloc snapshot
+taken as each of SNAPSHOT_STAGES ends. For each snapshot the report has the
+memory in use and the peak during the stage, the top allocation sites, the
+sites that grew most since the previous snapshot and the number of live
+objects of each SISBase subclass, ie how many FloatType and PoleZeroType
+are alive after parse.
+
+    python -m bench.memory -s sta.xml --nrl nrl -o mem.json
+    python -m bench.memory --stations 1000 --workdir /tmp/benchdata -o mem.json
+    python -m bench.memory --compare old.json mem.json
+
+Without -s the input is generated, see bench/generate.py. Tracing slows the
+conversion down a lot, use bench/run.py for times.
+'''
+import pipelineProfile as pipelineProfile
+import sisxmlparser3_0 as sisxmlparser
+import sta2extsta as sta2extsta
+from bench import compare
+from bench import generate
+from bench import run
+
+import argparse
+import collections
+import contextlib
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tracemalloc
+
+REPORT_VERSION = 1
+
+# stages run once per conversion, per channel stages like fixResponseNRL are not snapshot
+SNAPSHOT_STAGES = ['parse', 'loadNRL', 'inventoryPasses', 'checkRespListInNRL', 'hardwareResponse', 'export']
+
+# allocation sites are reported relative to this, so checkouts in different directories compare
+SOURCE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# allocations of tracemalloc and of this harness are left out of the sites,
+# filtering the statistics is much faster than filtering the traces
+IGNORED_FILES = set([tracemalloc.__file__, os.path.abspath(__file__), "<unknown>"])
+
+def siteName(frame):
+    filename = frame.filename
+    if filename.startswith(SOURCE_ROOT+os.sep):
+        filename = filename[len(SOURCE_ROOT)+1:]
+    return "%s:%d"%(filename, frame.lineno)
+
+def ownSite(stat):
+    return stat.traceback[0].filename in IGNORED_FILES
+
+def sisObjectCounts():
+    '''dict of SISBase subclass name to number of live instances'''
+    counts = collections.Counter()
+    for o in gc.get_objects():
+        if isinstance(o, sisxmlparser.SISBase):
+            counts[type(o).__name__] += 1
+    return dict(counts.most_common())
+
+class SnapshotProfile(pipelineProfile.PipelineProfile):
+    '''PipelineProfile that also snapshots memory as each of SNAPSHOT_STAGES first ends'''
+
+    def __init__(self, top=20):
+        pipelineProfile.PipelineProfile.__init__(self, traceMemory=True)
+        self.top = top
+        self.snapshots = []
+        # tracemalloc snapshots, one per entry of snapshots
+        self._raw = []
+
+    def stop(self, name):
+        pipelineProfile.PipelineProfile.stop(self, name)
+        if name in SNAPSHOT_STAGES and name not in [s['stage'] for s in self.snapshots]:
+            self.snapshot(name)
+
+    def snapshot(self, name):
+        gc.collect()
+        self.snapshots.append({'stage': name,
+                               'current': tracemalloc.get_traced_memory()[0],
+                               'peak': self.stages[name]['peakMemory'],
+                               'objects': sisObjectCounts()})
+        self._raw.append(tracemalloc.take_snapshot())
+
+    def analyze(self):
+        '''
+        add the top and grown allocation sites to the snapshots, done after
+        tracing stops as grouping the traces is much slower while tracing
+        '''
+        previous = None
+        for s, snap in zip(self.snapshots, self._raw):
+            stats = [stat for stat in snap.statistics('lineno') if not ownSite(stat)]
+            s['top'] = [{'site': siteName(stat.traceback[0]), 'size': stat.size, 'count': stat.count}
+                        for stat in stats[:self.top]]
+            s['growth'] = []
+            if previous is not None:
+                diffs = [d for d in snap.compare_to(previous, 'lineno') if d.size_diff > 0 and not ownSite(d)]
+                s['growth'] = [{'site': siteName(d.traceback[0]), 'sizeDiff': d.size_diff, 'countDiff': d.count_diff}
+                               for d in diffs[:self.top]]
+            previous = snap
+        self._raw = []
+
+def measure(staxml, nrlDir, top=20, intern=False):
+    '''convert staxml with the NRL in nrlDir, returns the SnapshotProfile and its stage report'''
+    fixture = run.Fixture(None, staxml, nrlDir, None, intern)
+    parseArgs = fixture.conversionArgs()
+    profile = SnapshotProfile(top)
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            with profile.stage('parse'):
+                rootobj = fixture.parse()
+            with profile.stage('loadNRL'):
+                state = sta2extsta.loadConversionState(parseArgs)
+            if state is None:
+                raise ValueError("can't use NRL at %s"%(nrlDir,))
+            state.profile = profile
+            sisRoot = sta2extsta.convert(rootobj, parseArgs, state)
+            if sisRoot is None:
+                raise ValueError("conversion of %s failed"%(staxml,))
+            sta2extsta.writeOutput(sisRoot, parseArgs, devnull, profile)
+    report = profile.report()
+    tracemalloc.stop()
+    profile.analyze()
+    return profile, report
+
+def memoryReport(profile, profileReport, staxml, params, intern=False):
+    return {'version': REPORT_VERSION,
+            'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'git': run.gitRevision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'input': staxml,
+            'intern': intern,
+            'params': params,
+            'snapshots': profile.snapshots,
+            'profile': profileReport}
+
+def megabytes(n):
+    if n is None:
+        return "-"
+    return "%.2f"%(n/(1024.0*1024.0),)
+
+def printReport(report, top=10):
+    headers = ['stage', 'current MB', 'peak MB', 'SISBase objects']
+    rows = [[s['stage'], megabytes(s['current']), megabytes(s['peak']), sum(s['objects'].values())] for s in report['snapshots']]
+    for line in compare.formatTable(headers, rows):
+        print(line)
+    for s in report['snapshots']:
+        print()
+        print("after %s, top allocation sites:"%(s['stage'],))
+        for line in compare.formatTable(['site', 'KB', 'blocks'], [[t['site'], "%.1f"%(t['size']/1024.0,), t['count']] for t in s['top'][:top]]):
+            print("  "+line)
+        if len(s['growth']) > 0:
+            print("grown since previous snapshot:")
+            for line in compare.formatTable(['site', 'KB', 'blocks'], [[t['site'], "%+.1f"%(t['sizeDiff']/1024.0,), "%+d"%(t['countDiff'],)] for t in s['growth'][:top]]):
+                print("  "+line)
+        print("live SISBase objects:")
+        for line in compare.formatTable(['class', 'count'], list(s['objects'].items())[:top]):
+            print("  "+line)
+
+def compareReports(old, new, stage, top=20):
+    '''print memory per stage and SISBase object counts at stage of two reports'''
+    print("old: %s %s"%(old.get('git'), old.get('input')))
+    print("new: %s %s"%(new.get('git'), new.get('input')))
+    oldByStage = dict((s['stage'], s) for s in old['snapshots'])
+    newByStage = dict((s['stage'], s) for s in new['snapshots'])
+    rows = []
+    for name in SNAPSHOT_STAGES:
+        o = oldByStage.get(name)
+        n = newByStage.get(name)
+        if o is None and n is None:
+            continue
+        oc = o['current'] if o else None
+        nc = n['current'] if n else None
+        op = o['peak'] if o else None
+        np = n['peak'] if n else None
+        rows.append([name, megabytes(oc), megabytes(nc), compare.formatRatio(oc, nc),
+                     megabytes(op), megabytes(np), compare.formatRatio(op, np)])
+    for line in compare.formatTable(['stage', 'old MB', 'new MB', 'new/old', 'old peak MB', 'new peak MB', 'new/old'], rows):
+        print(line)
+    oldObjects = oldByStage[stage]['objects'] if stage in oldByStage else {}
+    newObjects = newByStage[stage]['objects'] if stage in newByStage else {}
+    names = sorted(set(oldObjects) | set(newObjects), key=lambda c: -max(oldObjects.get(c, 0), newObjects.get(c, 0)))
+    rows = [['total', sum(oldObjects.values()), sum(newObjects.values()),
+             compare.formatRatio(sum(oldObjects.values()), sum(newObjects.values()))]]
+    for c in names[:top]:
+        rows.append([c, oldObjects.get(c, 0), newObjects.get(c, 0), compare.formatRatio(oldObjects.get(c, 0), newObjects.get(c, 0))])
+    print()
+    print("live SISBase objects after %s:"%(stage,))
+    for line in compare.formatTable(['class', 'old', 'new', 'new/old'], rows):
+        print(line)
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Memory use of each conversion stage, or compare two reports.')
+  parser.add_argument('-s', '--stationxml', help="input StationXML, generated if not given")
+  parser.add_argument('--nrl', help="NRL for --stationxml")
+  parser.add_argument('--workdir', default='bench-data', help="directory for generated input")
+  parser.add_argument('--top', type=int, default=20, help="number of allocation sites and classes to report")
+  parser.add_argument('-o', '--outfile', help="json report file")
+  parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help="compare two json reports instead of measuring")
+  parser.add_argument('--stage', default='parse', help="stage to compare object counts after, default parse")
+  parser.add_argument('--intern', action='store_true', help="parse with shared units and interned strings, see sta2extsta.py --intern")
+  generate.addGeneratorArgs(parser)
+  return parser.parse_args()
+
+def main():
+    parseArgs = initArgParser()
+    if parseArgs.compare:
+        old = compare.loadResults(parseArgs.compare[0])
+        new = compare.loadResults(parseArgs.compare[1])
+        compareReports(old, new, parseArgs.stage, parseArgs.top)
+        return
+    params = None
+    if parseArgs.stationxml:
+        if not parseArgs.nrl:
+            print("ERROR: --nrl is needed with --stationxml")
+            return 1
+        staxml, nrlDir = parseArgs.stationxml, parseArgs.nrl
+    else:
+        genParams = generate.paramsFromArgs(parseArgs)
+        fixture = run.makeFixture(parseArgs.workdir, genParams.stations, genParams)
+        staxml, nrlDir = fixture.staxml, fixture.nrlDir
+        params = genParams.asdict()
+    profile, profileReport = measure(staxml, nrlDir, parseArgs.top, parseArgs.intern)
+    report = memoryReport(profile, profileReport, staxml, params, parseArgs.intern)
+    printReport(report)
+    if parseArgs.outfile:
+        with open(parseArgs.outfile, 'w') as f:
+            json.dump(report, f, indent=2)
+        print("report written to %s"%(parseArgs.outfile,))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#! /usr/bin/python
+'''
+Time parse, cleanUnitNames, uniqueResponses, checkRespListInNRL, exportxml
+and a whole sta2extsta conversion on generated StationXML and NRL at
+several scales, and write the times as json for bench/compare.py.
+
+Scales are the number of stations, the other sizes come from the
+generator options. Each benchmark runs --repeat times, untimed setup like
+parsing the input for uniqueResponses is redone before every run. The
+whole conversion leaves out validating the input with java.
+'''
+import checkNRL as checkNRL
+import cleanUnitNames as cleanUnitNames
+import sisxmlparser3_0 as sisxmlparser
+import sta2extsta as sta2extsta
+import uniqResponses as uniqResponses
+from bench import generate
+
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RESULTS_VERSION = 1
+
+BENCHMARKS = ['parse', 'cleanUnitNames', 'uniqueResponses', 'checkRespListInNRL', 'exportxml', 'sta2extsta']
+
+class Fixture(object):
+    '''generated input for one scale'''
+
+    def __init__(self, scale, staxml, nrlDir, params, intern=False):
+        self.scale = scale
+        self.staxml = staxml
+        self.nrlDir = nrlDir
+        self.params = params
+        self.intern = intern
+
+    def parse(self):
+        return sisxmlparser.parse(self.staxml, False, intern=self.intern)
+
+    def cleanParse(self):
+        rootobj = self.parse()
+        cleanUnitNames.cleanUnitNames(rootobj)
+        return rootobj
+
+    def conversionArgs(self):
+        parser = argparse.ArgumentParser()
+        sta2extsta.addConversionArgs(parser)
+        parser.set_defaults(shardby=None, shardsuffix='.xml', exportworkers=1, compresslevel=None, state=None, profile=None, instrument=False)
+        args = ['--nrl', self.nrlDir]
+        if self.intern:
+            args.append('--intern')
+        return parser.parse_args(args)
+
+    def convert(self):
+        '''parse and convert, returns the SIS root'''
+        parseArgs = self.conversionArgs()
+        state = sta2extsta.loadConversionState(parseArgs)
+        return sta2extsta.convert(self.parse(), parseArgs, state)
+
+    def convertAll(self, ignored=None):
+        parseArgs = self.conversionArgs()
+        state = sta2extsta.loadConversionState(parseArgs)
+        sisRoot = sta2extsta.convert(self.parse(), parseArgs, state)
+        sta2extsta.writeOutput(sisRoot, parseArgs, io.StringIO())
+
+def benchmarkFunctions(fixture):
+    '''dict of benchmark name to (setup, timed function of the setup result)'''
+    def nrlInput():
+        return uniqResponses.uniqueResponses(fixture.cleanParse())
+    return {'parse': (lambda: None, lambda ignored: fixture.parse()),
+            'cleanUnitNames': (fixture.parse, cleanUnitNames.cleanUnitNames),
+            'uniqueResponses': (fixture.cleanParse, uniqResponses.uniqueResponses),
+            'checkRespListInNRL': (nrlInput, lambda uniq: checkNRL.checkRespListInNRL(fixture.nrlDir, uniq)),
+            'exportxml': (fixture.convert, lambda sisRoot: sisRoot.exportxml(io.StringIO())),
+            'sta2extsta': (lambda: None, fixture.convertAll),
+           }
+
+def timeRuns(setup, func, repeat):
+    '''seconds of each of repeat runs of func(setup())'''
+    times = []
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for i in range(repeat):
+            arg = setup()
+            start = time.perf_counter()
+            func(arg)
+            times.append(time.perf_counter()-start)
+    return times
+
+def makeFixture(workdir, scale, params, intern=False):
+    '''generate input for scale stations in workdir, reused if already there with the same params'''
+    outdir = os.path.join(workdir, "stations%d"%(scale,))
+    paramsFile = os.path.join(outdir, 'params.json')
+    if os.path.exists(paramsFile):
+        with open(paramsFile, 'r') as f:
+            if json.load(f) == params.asdict():
+                return Fixture(scale, os.path.join(outdir, 'sta.xml'), os.path.join(outdir, 'nrl'), params, intern)
+    staxml, nrlDir = generate.generate(outdir, params)
+    with open(paramsFile, 'w') as f:
+        json.dump(params.asdict(), f)
+    return Fixture(scale, staxml, nrlDir, params, intern)
+
+def gitRevision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runBenchmarks(fixtures, names, repeat):
+    results = []
+    for fixture in fixtures:
+        functions = benchmarkFunctions(fixture)
+        for name in names:
+            setup, func = functions[name]
+            times = timeRuns(setup, func, repeat)
+            result = {'benchmark': name,
+                      'scale': fixture.scale,
+                      'channelEpochs': fixture.params.numChannelEpochs(),
+                      'times': times,
+                      'min': min(times),
+                      'median': statistics.median(times)}
+            print("%-20s %8d stations %10.4f s min %10.4f s median"%(name, fixture.scale, result['min'], result['median']))
+            sys.stdout.flush()
+            results.append(result)
+    return results
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Time the conversion stages on generated StationXML at several scales.')
+  parser.add_argument('--scales', default='10,100,1000', help="comma separated numbers of stations")
+  parser.add_argument('--benchmarks', default=",".join(BENCHMARKS), help="comma separated subset of %s"%(",".join(BENCHMARKS),))
+  parser.add_argument('--repeat', type=int, default=3, help="runs of each benchmark, min and median are reported")
+  parser.add_argument('--workdir', help="directory for generated input, kept for the next run, default is a temporary directory")
+  parser.add_argument('-o', '--outfile', default='bench-results.json', help="json results file")
+  parser.add_argument('--intern', action='store_true', help="parse with shared units and interned strings, see sta2extsta.py --intern")
+  generate.addGeneratorArgs(parser)
+  return parser.parse_args()
+
+def main():
+    parseArgs = initArgParser()
+    names = [n for n in parseArgs.benchmarks.split(',') if len(n) > 0]
+    for name in names:
+        if name not in BENCHMARKS:
+            print("ERROR: unknown benchmark %s, known are %s"%(name, ",".join(BENCHMARKS)))
+            return 1
+    scales = [int(s) for s in parseArgs.scales.split(',')]
+    workdir = parseArgs.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='sta2extsta-bench-')
+    fixtures = [makeFixture(workdir, scale, generate.paramsFromArgs(parseArgs, stations=scale), parseArgs.intern) for scale in scales]
+    results = runBenchmarks(fixtures, names, parseArgs.repeat)
+    params = generate.paramsFromArgs(parseArgs).asdict()
+    del params['stations']
+    out = {'version': RESULTS_VERSION,
+           'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+           'git': gitRevision(),
+           'python': platform.python_version(),
+           'platform': platform.platform(),
+           'repeat': parseArgs.repeat,
+           'intern': parseArgs.intern,
+           'params': params,
+           'results': results}
+    with open(parseArgs.outfile, 'w') as f:
+        json.dump(out, f, indent=2)
+    print("results written to %s"%(parseArgs.outfile,))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
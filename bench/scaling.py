@@ -0,0 +1,125 @@
+#! /usr/bin/python
+'''
+End to end scaling of a whole conversion with the number of channel epochs.
+Generated networks of each size in --epochs are converted as sta2extsta.py
+does, without java validation, with the time of each stage from a
+PipelineProfile that does not trace memory. The report has the seconds per
+thousand channel epochs of the conversion and of each stage, so a stage that
+grows faster than linearly shows up as a rising column.
+
+    python -m bench.scaling --epochs-list 2500,5000,10000,20000 -o scaling.json
+
+Sizes are reached by the number of stations, the other generator options
+are the same for every size.
+'''
+import pipelineProfile as pipelineProfile
+import sta2extsta as sta2extsta
+from bench import compare
+from bench import generate
+from bench import run
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+RESULTS_VERSION = 1
+
+# stages reported per thousand epochs, in conversion order
+STAGES = ['parse', 'loadNRL', 'inventoryPasses', 'checkRespListInNRL', 'fixResponseNRL', 'hardwareResponse', 'export']
+
+def convertProfiled(fixture):
+    '''convert fixture once, returns (wall seconds, PipelineProfile report)'''
+    parseArgs = fixture.conversionArgs()
+    profile = pipelineProfile.PipelineProfile(traceMemory=False)
+    with open(os.devnull, 'w') as devnull:
+        with contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            with profile.stage('parse'):
+                rootobj = fixture.parse()
+            with profile.stage('loadNRL'):
+                state = sta2extsta.loadConversionState(parseArgs)
+            state.profile = profile
+            sisRoot = sta2extsta.convert(rootobj, parseArgs, state)
+            sta2extsta.writeOutput(sisRoot, parseArgs, devnull, profile)
+            wall = time.perf_counter()-start
+    return wall, profile.report()
+
+def measureScale(fixture, repeat):
+    '''result dict for the fastest of repeat conversions of fixture'''
+    best = None
+    for i in range(repeat):
+        wall, report = convertProfiled(fixture)
+        if best is None or wall < best[0]:
+            best = (wall, report)
+    wall, report = best
+    channelEpochs = fixture.params.numChannelEpochs()
+    stages = dict((s['name'], s['wall']) for s in report['stages'])
+    return {'channelEpochs': channelEpochs,
+            'stations': fixture.scale,
+            'wall': wall,
+            'stages': stages,
+            'counters': report['counters']}
+
+def perThousand(seconds, channelEpochs):
+    if seconds is None:
+        return "-"
+    return "%.3f"%(1000.0*seconds/channelEpochs,)
+
+def printResults(results):
+    headers = ['epochs', 'total s', 'total']+STAGES
+    rows = []
+    for r in results:
+        rows.append([r['channelEpochs'], "%.2f"%(r['wall'],), perThousand(r['wall'], r['channelEpochs'])]
+                    +[perThousand(r['stages'].get(name), r['channelEpochs']) for name in STAGES])
+    print("seconds per 1000 channel epochs")
+    for line in compare.formatTable(headers, rows):
+        print(line)
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Time a whole conversion, stage by stage, at several numbers of channel epochs.')
+  parser.add_argument('--epochs-list', dest='epochsList', default='2500,5000,10000,20000', help="comma separated numbers of channel epochs, rounded up to whole stations")
+  parser.add_argument('--repeat', type=int, default=1, help="conversions at each size, the fastest is reported")
+  parser.add_argument('--workdir', help="directory for generated input, kept for the next run, default is a temporary directory")
+  parser.add_argument('-o', '--outfile', help="json results file")
+  generate.addGeneratorArgs(parser)
+  return parser.parse_args()
+
+def main():
+    parseArgs = initArgParser()
+    workdir = parseArgs.workdir
+    if workdir is None:
+        workdir = tempfile.mkdtemp(prefix='sta2extsta-scaling-')
+    params = generate.paramsFromArgs(parseArgs)
+    perStation = params.networks*params.channels*params.epochs
+    results = []
+    for target in [int(e) for e in parseArgs.epochsList.split(',')]:
+        stations = -(-target//perStation)
+        fixture = run.makeFixture(workdir, stations, generate.paramsFromArgs(parseArgs, stations=stations))
+        result = measureScale(fixture, parseArgs.repeat)
+        print("%8d epochs %10.2f s"%(result['channelEpochs'], result['wall']))
+        sys.stdout.flush()
+        results.append(result)
+    printResults(results)
+    if parseArgs.outfile:
+        params = params.asdict()
+        del params['stations']
+        out = {'version': RESULTS_VERSION,
+               'created': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+               'git': run.gitRevision(),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'params': params,
+               'results': results}
+        with open(parseArgs.outfile, 'w') as f:
+            json.dump(out, f, indent=2)
+        print("results written to %s"%(parseArgs.outfile,))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,9 +5,12 @@ Interact with the NRL and parse RESP files.
 
 
 import sisxmlparser3_0 as sisxmlparser
+import nrlSource as nrlSource
+from instrumentation import instrumented
 
 import argparse
 import datetime
+import hashlib
 import os
 import re
 import sys
@@ -21,6 +24,12 @@ Usage: python <Parser>.py <in_xml_file>
 
 TYPE = "type"
 
+SAMP_RATE_INDEX = 'logger_sample_rate.sort'
+SAMP_RATE_STATE = 'logger_sample_rate.state'
+
+# totals for this process, reported by sta2extsta.py --profile
+COUNTERS = {'respFilesParsed': 0, 'sensorComparisons': 0, 'loggerComparisons': 0}
+
 def setVerbose(b):
     global VERBOSE
     VERBOSE = b
@@ -58,14 +67,24 @@ def _appendBlocketteField(blockette, field, value):
 
 
 
-def loadResp(filename):
+@instrumented
+def loadResp(filename, source=None):
+    '''
+    parse a RESP file, read via source if given, ie a RESP member of a zipped
+    NRL, otherwise from the file system.
+    '''
+    COUNTERS['respFilesParsed'] += 1
     resp = []
     blocketteFieldPattern = re.compile(r'^B(\d\d\d)F(\d\d)\s+(\S.+):\s+(\S.*)$')
     emptyLocationPattern = re.compile(r'^B(\d\d\d)F(\d\d)\s+(Location):\s+()$')
     poleZeroFieldPattern = re.compile(r'^B(\d\d\d)F(\d\d\-\d\d)\s+(\d+\s+\S.*)$')
     prevB = None
     blockette = None
-    with open(filename, 'r') as f:
+    if source is None:
+        infile = open(filename, 'r')
+    else:
+        infile = source.open(filename)
+    with infile as f:
         for line in f:
            if line[0] == '#':
                if "-----" in line:
@@ -175,6 +194,7 @@ def checkItem(item):
     if VERBOSE and not result[0]: print("Fail item %s -> %s"%(item, result))
     return result
 
+@instrumented
 def checkMultiple(list):
     for item in list:
       result = checkItem(item)
@@ -182,6 +202,51 @@ def checkMultiple(list):
         return result
     return (True, "ok")
 
+def canonicalRoots(roots):
+    '''
+    roots is list of (real, imag). Returns them sorted by magnitude, then
+    real, then signed imaginary part, ie conjugate pairs are negative
+    imaginary first.
+    '''
+    return sorted(roots, key=lambda root: (abs(complex(root[0], root[1])), root[0], root[1]))
+
+def pairRoots(rootsA, rootsB):
+    '''
+    list of (rootA, rootB), each root of rootsA in canonical order paired
+    with the nearest root of rootsB not already paired
+    '''
+    unpaired = list(rootsB)
+    pairs = []
+    for a in canonicalRoots(rootsA):
+        nearest = min(range(len(unpaired)), key=lambda i: abs(complex(a[0], a[1])-complex(unpaired[i][0], unpaired[i][1])))
+        pairs.append((a, unpaired.pop(nearest)))
+    return pairs
+
+def rootsChecklist(label, pairs, tol=0.001):
+    checklist = []
+    for i, (a, b) in enumerate(pairs):
+        checklist.append(("%d %s real"%(i, label), float(a[0]), float(b[0]), tol))
+        checklist.append(("%d %s imag"%(i, label), float(a[1]), float(b[1]), tol))
+    return checklist
+
+def canonicalRootsChecklist(label, rootsA, rootsB, tol=0.001):
+    '''
+    checklist comparing two lists of (real, imag) roots, caller must check
+    the lengths are equal. Roots are compared in the given order if all are
+    within tol, otherwise each root is compared with the nearest root of
+    the other list, so the order of the roots does not matter.
+    '''
+    checklist = rootsChecklist(label, list(zip(rootsA, rootsB)), tol)
+    if all(checkFloatEqual(*item)[0] for item in checklist):
+        return checklist
+    return rootsChecklist(label, pairRoots(rootsA, rootsB), tol)
+
+def staxmlRoots(pzList):
+    return [(float(pz.Real.ValueOf), float(pz.Imaginary.ValueOf)) for pz in pzList]
+
+def respRoots(pzList):
+    return [(float(pz[1]), float(pz[2])) for pz in pzList]
+
 def areSimilarStageB53(staxml, resp):
     result = (False, "can't file blockette to match %s"%(resp[TYPE],))
     if hasattr(staxml,'PolesZeros') and resp[TYPE] == '053':
@@ -194,13 +259,8 @@ def areSimilarStageB53(staxml, resp):
        ])
        if not result[0]:
          return result
-       checklist = []
-       for zi in range(len(zeros)):
-             checklist.append(("%d zero real"%(zi,), float(zeros[zi].Real.ValueOf), float(resp['10-13'][zi][1]), 0.001))
-             checklist.append(("%d zero imag"%(zi,), float(zeros[zi].Imaginary.ValueOf), float(resp['10-13'][zi][2]), 0.001))
-       for pi in range(len(poles)):
-             checklist.append(("%d pole real"%(pi,), float(poles[pi].Real.ValueOf), float(resp['15-18'][pi][1]), 0.001))
-             checklist.append(("%d pole imag"%(pi,), float(poles[pi].Imaginary.ValueOf), float(resp['15-18'][pi][2]), 0.001))
+       checklist = canonicalRootsChecklist("zero", staxmlRoots(zeros), respRoots(resp.get('10-13', [])))
+       checklist += canonicalRootsChecklist("pole", staxmlRoots(poles), respRoots(resp.get('15-18', [])))
        result = checkMultiple(checklist)
     return result
 
@@ -241,6 +301,7 @@ def areSimilarStageB58(staxml, resp):
        ])
     return result
 
+@instrumented
 def areSimilarSensor(staxmlResp, nrlResp):
     if not hasattr(staxmlResp, 'Stage'):
         return False, "no Stage in staxml"
@@ -259,6 +320,7 @@ def areSimilarSensor(staxmlResp, nrlResp):
        result = False,"blockette58 not found"
     return (result[0], result[1], 1, 1)
 
+@instrumented
 def areSimilarLogger(staxmlResp, nrlResp):
     '''
     returns (False, reason)
@@ -327,6 +389,146 @@ def areSimilarLogger(staxmlResp, nrlResp):
             return False,"more stages in staxml than in resp %d > %d"%(len(staxmlResp.Stage), loggerStageStaxml)
     return (result[0], result[1],  preampStageStaxml,  preampStageNRL, loggerStageNRL-1 )
 
+def respEquivKey(resp):
+    '''
+    structural key for a RESP, blockette types, stages and counts, only
+    fields areEquivalentResp compares exactly. Two RESP with different keys
+    can never be equivalent.
+    '''
+    key = []
+    for b in resp:
+        if b[TYPE] == '053':
+            key.append((b[TYPE], b['03'].strip()[0], b['04'], int(b['09']), int(b['14'])))
+        elif b[TYPE] == '054':
+            key.append((b[TYPE], b['04'], int(b['07']), int(b['10'])))
+        elif b[TYPE] == '057':
+            key.append((b[TYPE], b['03'], int(b['05'])))
+        elif b[TYPE] == '058':
+            key.append((b[TYPE], b['03']))
+        else:
+            key.append((b[TYPE],))
+    return tuple(key)
+
+def respCompareValues(resp):
+    '''
+    tuple of the values areSimilarSensor and areSimilarLogger compare with
+    a tolerance, in file order, see areEquivalentResp
+    '''
+    values = []
+    for b in resp:
+        if b[TYPE] == '053':
+            values.append(float(b['07']))
+            values += [root for field in ['10-13', '15-18'] for root in respRoots(b.get(field, []))]
+        elif b[TYPE] == '054':
+            for field in ['08-09', '11-12']:
+                values += [float(c[1]) for c in b.get(field, [])]
+        elif b[TYPE] == '057':
+            values.append(float(b['04']))
+        elif b[TYPE] == '058':
+            values.append(float(b['04']))
+            values.append(float(b['05'].split()[0]))
+    return tuple(values)
+
+def areEquivalentResp(respA, respB):
+    '''
+    True if the two RESP have the same structure and exactly the same values
+    used by areSimilarSensor and areSimilarLogger, so any response matching
+    one also matches the other. Values only within tolerance are not enough,
+    as being within tolerance is not transitive.
+    '''
+    if respEquivKey(respA) != respEquivKey(respB):
+        return False, "not same blockettes"
+    for i, (valA, valB) in enumerate(zip(respCompareValues(respA), respCompareValues(respB))):
+        if valA != valB:
+            return False, "value %d: %s != %s"%(i, valA, valB)
+    return True, "ok"
+
+def buildRespClasses(nrlDir, subdir):
+    '''
+    Group the RESP files below subdir into equivalence classes of files
+    with exactly equal compared values, see areEquivalentResp, so each
+    class only needs to be compared once.
+    returns list of (representative resp, [paths]), in walk order of the
+    first member, and dict of path to walk order.
+    '''
+    source = nrlSource.openNRL(nrlDir)
+    if isinstance(source, NRLIndex):
+        return source.respClasses(subdir)
+    classes = []
+    buckets = dict()
+    walkOrder = dict()
+    for path in source.walk(subdir):
+        walkOrder[path] = len(walkOrder)
+        if VERBOSE: print("try %s"%(os.path.basename(path),))
+        r = loadResp(path, source)
+        # exact values, so equivalent RESP have equal keys
+        key = (respEquivKey(r), respCompareValues(r))
+        found = buckets.get(key, None)
+        if found is None:
+            found = (r, [])
+            classes.append(found)
+            buckets[key] = found
+        found[1].append(path)
+    if VERBOSE: print("%s: %d RESP files in %d equivalence classes"%(subdir, len(walkOrder), len(classes)))
+    return classes, walkOrder
+
+class NRLIndex(object):
+    '''
+    NRL source that keeps the RESP equivalence classes and the logger sample
+    rate index once loaded, so converting many files only walks and parses
+    the NRL once. Can be passed anywhere a NRL directory or source is.
+    '''
+
+    def __init__(self, nrlDir):
+        self.source = nrlSource.openNRL(nrlDir)
+        self.classes = {}
+        self.loggerRateIndex = None
+
+    def __str__(self):
+        return str(self.source)
+
+    def exists(self):
+        return self.source.exists()
+
+    def walk(self, subdir=''):
+        return self.source.walk(subdir)
+
+    def open(self, path):
+        return self.source.open(path)
+
+    def openBinary(self, path):
+        return self.source.openBinary(path)
+
+    def stat(self, path):
+        return self.source.stat(path)
+
+    def relPath(self, path):
+        return self.source.relPath(path)
+
+    def indexFile(self, name):
+        return self.source.indexFile(name)
+
+    def openIndex(self, name):
+        return self.source.openIndex(name)
+
+    def indexStat(self, name):
+        return self.source.indexStat(name)
+
+    def close(self):
+        self.source.close()
+
+    def respClasses(self, subdir):
+        '''buildRespClasses for subdir, built on first use'''
+        if subdir not in self.classes:
+            self.classes[subdir] = buildRespClasses(self.source, subdir)
+        return self.classes[subdir]
+
+    def sampleRateIndex(self):
+        '''loadRespfileSampleRate of the index in this NRL, loaded on first use'''
+        if self.loggerRateIndex is None:
+            self.loggerRateIndex = loadSampleRateIndex(self.source)
+        return self.loggerRateIndex
+
 def printBlockettes(r):
     for b in r:
       print("Blockette %s ##########"%(b['type'],))
@@ -336,23 +538,103 @@ def printBlockettes(r):
 def getChanCodeId(n, s, c):
         return "%s.%s.%s.%s_%s"%(n.code, s.code, c.locationCode, c.code, c.startDate.isoformat())
 
-def saveFinalSampRate(nrlDir):
-    outfile = open(os.path.join(nrlDir, 'logger_sample_rate.sort'), 'w')
-    dataloggerDir = os.path.join(nrlDir, 'dataloggers')
-    for root, dirs, files in os.walk(dataloggerDir):
-      if '.svn' in dirs:
-        dirs.remove('.svn')
-      for respfile in files:
-        if respfile.startswith("RESP"):
-            if VERBOSE: print("try %s"%(respfile,))
-            r = loadResp(os.path.join(root, respfile))
-            finalSampRate = 0
-            for b in r:
-                if b['type'] == '057':
-                    sampRate = b['04']
-                    decFactor = b['05']
-                    finalSampRate = float(sampRate)/int(decFactor)
-            outfile.write("%s %s\n"%(finalSampRate, os.path.join(root, respfile)))
+def chanCodeIndex(respList):
+    '''
+    dict of chanCodeId to the record of respList whose chanCodeList holds it,
+    so a channel finds its unique response with one lookup. If a chanCodeId
+    is in more than one record the first wins.
+    '''
+    index = {}
+    for record in respList:
+        for chanCode in record[2]:
+            index.setdefault(chanCode, record)
+    return index
+
+def finalSampRateForResp(r):
+    finalSampRate = 0
+    for b in r:
+        if b['type'] == '057':
+            sampRate = b['04']
+            decFactor = b['05']
+            finalSampRate = float(sampRate)/int(decFactor)
+    return finalSampRate
+
+def hashRespFile(filename, source=None):
+    h = hashlib.sha1()
+    if source is None:
+        infile = open(filename, 'rb')
+    else:
+        infile = source.openBinary(filename)
+    with infile as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def loadSampRateState(stateFile):
+    '''
+    state file has one line per indexed RESP file:
+    finalSampRate mtime_ns size sha1 path
+    returns dict of path -> (mtime_ns, size, sha1, finalSampRate)
+    '''
+    out = dict()
+    if not os.path.exists(stateFile):
+        return out
+    for line in open(stateFile, 'r'):
+      # path is the rest of the line, it may contain spaces
+      words = line.rstrip('\r\n').split(None, 4)
+      out[words[4]] = (int(words[1]), int(words[2]), words[3], float(words[0]))
+    return out
+
+def saveFinalSampRate(nrlDir, refresh=False):
+    '''
+    Write the logger sample rate index. If refresh is True, only RESP files
+    that are new or whose mtime, size and content hash changed since the last
+    run are parsed, the rest reuse the rate recorded in the state file.
+    returns dict with lists of added, changed and removed paths and
+    count of unchanged.
+    '''
+    source = nrlSource.openNRL(nrlDir)
+    indexFile = source.indexFile(SAMP_RATE_INDEX)
+    stateFile = source.indexFile(SAMP_RATE_STATE)
+    if refresh:
+        prevState = loadSampRateState(stateFile)
+    else:
+        prevState = dict()
+    state = dict()
+    indexOrder = []
+    delta = { 'added': [], 'changed': [], 'removed': [], 'unchanged': 0 }
+    for path in source.walk('dataloggers'):
+        indexOrder.append(path)
+        mtime, size = source.stat(path)
+        prev = prevState.get(path, None)
+        if prev is not None and prev[0] == mtime and prev[1] == size:
+            state[path] = prev
+            delta['unchanged'] += 1
+            continue
+        digest = hashRespFile(path, source)
+        if prev is not None and prev[2] == digest:
+            # touched but same content
+            state[path] = (mtime, size, digest, prev[3])
+            delta['unchanged'] += 1
+            continue
+        if VERBOSE: print("try %s"%(path,))
+        r = loadResp(path, source)
+        state[path] = (mtime, size, digest, finalSampRateForResp(r))
+        if prev is None:
+            delta['added'].append(path)
+        else:
+            delta['changed'].append(path)
+    for path in prevState:
+        if path not in state:
+            delta['removed'].append(path)
+    with open(indexFile, 'w') as outfile:
+        for path in indexOrder:
+            outfile.write("%s %s\n"%(state[path][3], path))
+    with open(stateFile, 'w') as outfile:
+        for path in indexOrder:
+            mtime, size, digest, finalSampRate = state[path]
+            outfile.write("%s %d %d %s %s\n"%(finalSampRate, mtime, size, digest, path))
+    return delta
 
 def possibleSampRateMatch(respfile, staxml, loggerRateIndex):
     for n in staxml.Network:
@@ -362,16 +644,15 @@ def possibleSampRateMatch(respfile, staxml, loggerRateIndex):
                     return True
     return False
 
-def checkRespInNRL(nrlDir, staxml, areSimilarFunc, loggerRateIndex = None):
+def checkRespInNRL(nrlDir, staxml, areSimilarFunc, loggerRateIndex = None, subdir = ''):
     matchDict = dict()
-    if VERBOSE: print("walk %s"%(nrlDir,))
-    for root, dirs, files in os.walk(nrlDir):
-      if '.svn' in dirs:
-        dirs.remove('.svn')
-      for respfile in files:
-        if respfile.startswith("RESP") and (loggerRateIndex is None or possibleSampRateMatch(os.path.join(root, respfile), staxml, loggerRateIndex)):
+    source = nrlSource.openNRL(nrlDir)
+    if VERBOSE: print("walk %s %s"%(source, subdir))
+    for path in source.walk(subdir):
+        respfile = os.path.basename(path)
+        if loggerRateIndex is None or possibleSampRateMatch(path, staxml, loggerRateIndex):
             if VERBOSE: print("try %s"%(respfile,))
-            r = loadResp(os.path.join(root, respfile))
+            r = loadResp(path, source)
             for n in staxml.Network:
               for s in n.Station:
                 for c in s.Channel:
@@ -382,74 +663,104 @@ def checkRespInNRL(nrlDir, staxml, areSimilarFunc, loggerRateIndex = None):
                       if VERBOSE: print("%s found match %s"%(chanCode, respfile,))
                       if not chanCode in matchDict:
                           matchDict[chanCode] = []
-                      matchDict[chanCode].append( ( os.path.join(root, respfile), result[2], result[3] ) )
+                      matchDict[chanCode].append( ( path, result[2], result[3] ) )
                     else:
                       if VERBOSE: print("FAIL %s match %s: %s"%(chanCode, respfile, result[1]))
     return matchDict
 
-def checkRespListInNRL(nrlDir, respList, loggerRateIndex = None):
+def matchSensorsInNRL(nrlDir, outList):
+    '''
+    append sensor matches to the sss list of each item of outList,
+    returns dict of path to NRL walk order
+    '''
+    sensorClasses, sensorOrder = buildRespClasses(nrlDir, 'sensors')
+    for r, paths in sensorClasses:
+        for respTuple in outList:
+            name, chanResp, chanCodeList, sss, lll = respTuple
+            COUNTERS['sensorComparisons'] += 1
+            resultSensor = areSimilarSensor(chanResp, r)
+            if resultSensor[0]:
+              if VERBOSE: print("%s found Sensor match %s"%(name, paths,))
+              for path in paths:
+                  sss.append( ( path, resultSensor[2], resultSensor[3], paths[0] ) )
+    return sensorOrder
+
+def matchLoggersInNRL(nrlDir, outList):
+    '''
+    append logger matches to the lll list of each item of outList,
+    returns dict of path to NRL walk order
+    '''
+    loggerClasses, loggerOrder = buildRespClasses(nrlDir, 'dataloggers')
+    for r, paths in loggerClasses:
+        for respTuple in outList:
+            name, chanResp, chanCodeList, sss, lll = respTuple
+            COUNTERS['loggerComparisons'] += 1
+            resultLogger = areSimilarLogger(chanResp, r)
+            if resultLogger[0]:
+              if VERBOSE: print("%s found logger match %s"%(name, paths,))
+              for path in paths:
+                  lll.append( ( path, resultLogger[2], resultLogger[3], resultLogger[4], paths[0] ) )
+            else:
+              if VERBOSE: print("FAIL %s match %s: %s"%(name, paths[0], resultLogger[1]))
+    return loggerOrder
+
+def checkRespListInNRL(nrlDir, respList, withIndex=False):
     '''
     respList is list of tuples (name, response, chanCodeList)
     return is list of tuples (name, response, chanCodeList, sensorNrlUrl, loggerNrlUrl)
-    where NRLurl is None if not a NRL response.
+    where NRLurl is None if not a NRL response. If withIndex, return is
+    (list, chanCodeIndex of the list).
     Sensor is assumed to be stage 1, Preamp is stage 2 and logger is stage 3 to end.
+    Equivalent RESP files are only compared once and each match tuple ends
+    with the path of the first file of its equivalence class.
     '''
     outList = []
     for name, chanResp, chanCodeList in respList:
         outList.append( [ name, chanResp, chanCodeList, [], [] ] )
-    if VERBOSE: print("walk %s"%(nrlDir,))
-    for root, dirs, files in os.walk("%s/sensors"%(nrlDir,)):
-      if '.svn' in dirs:
-        dirs.remove('.svn')
-      for respfile in files:
-        if respfile.startswith("RESP"):
-            if VERBOSE: print("try %s"%(respfile,))
-            r = loadResp(os.path.join(root, respfile))
-            for respTuple in outList:
-                name, chanResp, chanCodeList, sss, lll = respTuple
-                resultSensor = areSimilarSensor(chanResp, r)
-                if resultSensor[0]:
-                  if VERBOSE: print("%s found Sensor match %s"%(name, respfile,))
-                  sss.append( ( os.path.join(root, respfile), resultSensor[2], resultSensor[3] ) )
-    for root, dirs, files in os.walk("%s/dataloggers"%(nrlDir,)):
-      if '.svn' in dirs:
-        dirs.remove('.svn')
-      for respfile in files:
-        if respfile.startswith("RESP"):
-            if VERBOSE: print("try %s"%(respfile,))
-            r = None # delay loading until a samp rate match
-            for respTuple in outList:
-                name, chanResp, chanCodeList, sss, lll = respTuple
-                if respfile not in loggerRateIndex or c.SampleRate.ValueOf == loggerRateIndex[respfile]:
-                    if r is None:
-                        r = loadResp(os.path.join(root, respfile))
-                    resultLogger = areSimilarLogger(chanResp, r)
-                    if resultLogger[0]:
-                      if VERBOSE: print("%s found logger match %s"%(name, respfile,))
-                      lll.append( ( os.path.join(root, respfile), resultLogger[2], resultLogger[3], resultLogger[4] ) )
-                    else:
-                      if VERBOSE: print("FAIL %s match %s: %s"%(chanCode, respfile, result[1]))
+    source = nrlSource.openNRL(nrlDir)
+    if VERBOSE: print("walk %s"%(source,))
+    sensorOrder = matchSensorsInNRL(source, outList)
+    loggerOrder = matchLoggersInNRL(source, outList)
+    # keep matches in NRL walk order
+    for name, chanResp, chanCodeList, sss, lll in outList:
+        sss.sort(key=lambda m: sensorOrder[m[0]])
+        lll.sort(key=lambda m: loggerOrder[m[0]])
+    if withIndex:
+        return outList, chanCodeIndex(outList)
     return outList
 
 
 def loadRespfileSampleRate(loggerSampFile):
+    with open(loggerSampFile, 'r') as f:
+        return parseRespfileSampleRate(f)
+
+def parseRespfileSampleRate(lines):
     out = dict()
-    for line in open(loggerSampFile, 'r'):
-      words = line.split()
+    for line in lines:
+      words = line.rstrip('\r\n').split(None, 1)
       out[words[1]] = float(words[0])
     return out
 
+def loadSampleRateIndex(nrlDir):
+    '''logger sample rate index of the NRL, None if it has none'''
+    f = nrlSource.openNRL(nrlDir).openIndex(SAMP_RATE_INDEX)
+    if f is None:
+        return None
+    with f:
+        return parseRespfileSampleRate(f)
+
 def checkNRL(nrlDir, staxml):
     '''
     obsolete, faster to check for unique responses first, then walk the nrl
     '''
-    loggerRateIndex = loadRespfileSampleRate(nrlDir+'/logger_sample_rate.sort')
+    source = nrlSource.openNRL(nrlDir)
+    loggerRateIndex = loadSampleRateIndex(source)
     print("loggerRateIndex has %d entries"%(len(loggerRateIndex,)))
 
     print("Sensor Check")
-    matchSensor = checkRespInNRL("%s/sensors"%(nrlDir,), staxml, areSimilarSensor)
+    matchSensor = checkRespInNRL(source, staxml, areSimilarSensor, subdir='sensors')
     print("Logger Check")
-    matchLogger = checkRespInNRL("%s/dataloggers"%(nrlDir,), staxml, areSimilarLogger, loggerRateIndex)
+    matchLogger = checkRespInNRL(source, staxml, areSimilarLogger, loggerRateIndex, subdir='dataloggers')
 #    loggerRateIndex = loadRespfileSampleRate('rt130_logger_samp_rate.sort')
 #    matchLogger = checkNRL("nrl_rt130/dataloggers", staxml, areSimilarLogger, loggerRateIndex)
     return (matchSensor, matchLogger)
@@ -460,6 +771,7 @@ def main():
     parser.add_argument('-s', '--stationxml', help="input FDSN StationXML file, often retrieved from http://service.iris.edu/fdsnws/station/1/")
     parser.add_argument('--nrl', default='nrl', help="path to NRL")
     parser.add_argument('--samplerate', action="store_true", help="Generate the sample rate index file inside the nrl directory.")
+    parser.add_argument('--refresh', action="store_true", help="With --samplerate, only reparse RESP files that are new or changed since the index was last generated.")
     parser.add_argument('-v', '--verbose', action='store_true', help="verbose output")
     parseArgs = parser.parse_args()
     if parseArgs.verbose:
@@ -470,7 +782,12 @@ def main():
         usage()
         return
     if parseArgs.samplerate:
-        saveFinalSampRate(parseArgs.nrl)
+        delta = saveFinalSampRate(parseArgs.nrl, parseArgs.refresh)
+        print("sample rate index: %d added, %d changed, %d removed, %d unchanged"%(len(delta['added']), len(delta['changed']), len(delta['removed']), delta['unchanged']))
+        if VERBOSE:
+            for k in ['added', 'changed', 'removed']:
+                for path in delta[k]:
+                    print("    %s %s"%(k, path))
         return
     if not os.path.isfile(parseArgs.stationxml):
         print("Can't find file %s"%(parseArgs.stationxml,))
@@ -3,14 +3,14 @@
 clean unit names in fdsn stationxml file
 see https://github.com/iris-edu/StationXML-Validator/wiki/Unit-name-overview-for-IRIS-StationXML-validator
 '''
-import checkNRL as checkNRL
+import compressedFile as compressedFile
+import inventoryPasses as inventoryPasses
 import sisxmlparser3_0 as sisxmlparser
 
 import argparse
 import datetime
 import os
 import re
-import sys
 
 VERBOSE=False
 
@@ -79,7 +79,8 @@ def setVerbose(b):
 def initArgParser():
   parser = argparse.ArgumentParser(description='Clean Unit Names in StationXML or ExtendedStationXML.')
   parser.add_argument('-s', '--stationxml', required=True, help="input FDSN StationXML file, often retrieved from http://service.iris.edu/fdsnws/station/1/")
-  parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'), default=sys.stdout)
+  compressedFile.addOutputArgs(parser)
+  parser.add_argument('--serializer', choices=sisxmlparser.EXPORT_BACKENDS, default='python', help="write output xml with python string formatting or with lxml")
   parser.add_argument('-v', '--verbose', action='store_true', help="verbose output")
   return parser.parse_args()
 
@@ -106,30 +107,59 @@ def cleanUnitName(inUnitName, changes):
       print("WARNING: unknown unit: %s"%(inUnitName,))
     return outUnitName
 
-def cleanUnit(inUnit, changes):
-    inUnit.Name = cleanUnitName(inUnit.Name, changes)
-
-
-def cleanBaseFilter(filter, changes):
-    cleanUnit(filter.InputUnits, changes)
-    cleanUnit(filter.OutputUnits, changes)
+def cleanUnit(inUnit, changes, cleaned=None):
+    '''
+    returns inUnit with its name cleaned. A unit shared by
+    sisxmlparser.parse(..., intern=True) is not changed, a shared copy with
+    the clean name is returned instead. cleaned maps shared units already
+    done to their result, so each distinct unit is only cleaned once.
+    '''
+    if not inUnit.isshared():
+        inUnit.Name = cleanUnitName(inUnit.Name, changes)
+        return inUnit
+    if cleaned is not None and id(inUnit) in cleaned:
+        outUnit = cleaned[id(inUnit)]
+        if outUnit is not inUnit:
+            changes['numChanges']+=1
+        return outUnit
+    outName = cleanUnitName(inUnit.Name, changes)
+    outUnit = inUnit
+    if outName != inUnit.Name:
+        outUnit = inUnit.mutable()
+        outUnit.Name = outName
+        outUnit.share()
+    if cleaned is not None:
+        cleaned[id(inUnit)] = outUnit
+    return outUnit
+
+def cleanUnitAttr(parent, attr, changes, cleaned=None):
+    '''clean the unit in parent.attr, replacing it if it was shared'''
+    inUnit = getattr(parent, attr)
+    outUnit = cleanUnit(inUnit, changes, cleaned)
+    if outUnit is not inUnit:
+        setattr(parent, attr, outUnit)
+
+
+def cleanBaseFilter(filter, changes, cleaned=None):
+    cleanUnitAttr(filter, 'InputUnits', changes, cleaned)
+    cleanUnitAttr(filter, 'OutputUnits', changes, cleaned)
     return True, "ok"
 
-def cleanPolesZeros(pz, changes):
-    cleanBaseFilter(pz, changes)
+def cleanPolesZeros(pz, changes, cleaned=None):
+    cleanBaseFilter(pz, changes, cleaned)
     return True, "ok"
 
-def cleanCoefficients(coef, changes):
-    cleanBaseFilter(coef, changes)
+def cleanCoefficients(coef, changes, cleaned=None):
+    cleanBaseFilter(coef, changes, cleaned)
     return True, "ok"
 
 
-def cleanFIR(fir, changes):
-    cleanBaseFilter(fir, changes)
+def cleanFIR(fir, changes, cleaned=None):
+    cleanBaseFilter(fir, changes, cleaned)
     return True, "ok"
 
-def cleanPolynomial(polynomial, changes):
-    cleanBaseFilter(polynomial, changes)
+def cleanPolynomial(polynomial, changes, cleaned=None):
+    cleanBaseFilter(polynomial, changes, cleaned)
     return True, "ok"
 
 
@@ -137,54 +167,70 @@ def cleanDecimation(decimation, changes):
     return True, "ok"
 
 
-def cleanStage(stage, changes):
+def cleanStage(stage, changes, cleaned=None):
     if hasattr(stage, 'PolesZeros'):
-        cleanPolesZeros(stage.PolesZeros, changes)
+        cleanPolesZeros(stage.PolesZeros, changes, cleaned)
     elif hasattr(stage, 'Coefficients'):
-        cleanCoefficients(stage.Coefficients, changes)
+        cleanCoefficients(stage.Coefficients, changes, cleaned)
     elif hasattr(stage, 'FIR'):
-        cleanFIR(stage.FIR, changes)
+        cleanFIR(stage.FIR, changes, cleaned)
     elif hasattr(stage, 'Polynomial'):
-        cleanPolynomial(stage.Polynomial, changes)
+        cleanPolynomial(stage.Polynomial, changes, cleaned)
     if hasattr(stage, 'Decimation'):
         cleanDecimation(stage.Decimation, changes)
 
 
-def cleanResponse(resp, changes):
+def cleanResponse(resp, changes, cleaned=None):
     if hasattr(resp, 'InstrumentSensitivity'):
-      cleanUnit(resp.InstrumentSensitivity.InputUnits, changes)
-      cleanUnit(resp.InstrumentSensitivity.OutputUnits, changes)
+      cleanUnitAttr(resp.InstrumentSensitivity, 'InputUnits', changes, cleaned)
+      cleanUnitAttr(resp.InstrumentSensitivity, 'OutputUnits', changes, cleaned)
     if hasattr(resp, 'SubResponse') and hasattr(resp.SubResponse, 'ResponseDetail'):
-      cleanStage(resp.SubResponse.ResponseDetail, changes)
+      cleanStage(resp.SubResponse.ResponseDetail, changes, cleaned)
     if hasattr(resp, 'Stage'):
         stage = getattr(resp, 'Stage', [])
         for i in range(0, len(stage)):
-            cleanStage(resp.Stage[i], changes)
+            cleanStage(resp.Stage[i], changes, cleaned)
     return True, "ok"
 
+class CleanUnitNamesPass(inventoryPasses.InventoryPass):
+    '''
+    cleans channel and response units, and the ResponseDicts of an extended
+    StationXML once the walk is done. changes maps old to new unit names.
+    '''
+    name = 'cleanUnitNames'
+
+    def __init__(self, changes=None):
+        inventoryPasses.InventoryPass.__init__(self, changes)
+        # shared units already cleaned, see cleanUnit
+        self.cleaned = {}
+
+    def visitChannel(self, n, s, c, chanCode):
+        changes = self.changes
+        if VERBOSE: print("clean chanCode %s "%(chanCode, ))
+        if hasattr(c, 'SignalUnits'):
+            cleanUnitAttr(c, 'SignalUnits', changes, self.cleaned)
+        if hasattr(c, 'CalibrationUnits'):
+            cleanUnitAttr(c, 'CalibrationUnits', changes, self.cleaned)
+        cleanResponse(c.Response, changes, self.cleaned)
+
+    def finish(self, staxml):
+        changes = self.changes
+        cleaned = self.cleaned
+        if hasattr(staxml, 'HardwareResponse'):
+
+          if hasattr(staxml.HardwareResponse, 'ResponseDictGroup'):
+            respDict = getattr(staxml.HardwareResponse.ResponseDictGroup, 'ResponseDict', [])
+            for i in range(0, len(respDict)):
+                cleanStage(respDict[i], changes, cleaned)
+                if hasattr(respDict[i], 'FilterSequence'):
+                  filterStage = getattr(respDict[i].FilterSequence, 'FilterStage', [])
+                  for i in range(0, len(filterStage)):
+                     cleanStage(filterStage[i], changes, cleaned)
+
 def cleanUnitNames(staxml):
-    changes = { 'numChanges': 0 }
-    for n in staxml.Network:
-      for s in n.Station:
-        for c in s.Channel:
-          chanCode = checkNRL.getChanCodeId(n, s, c)
-          if VERBOSE: print("clean chanCode %s "%(chanCode, ))
-          if hasattr(c, 'SignalUnits'):
-              cleanUnit(c.SignalUnits, changes)
-          if hasattr(c, 'CalibrationUnits'):
-              cleanUnit(c.CalibrationUnits, changes)
-          result = cleanResponse(c.Response, changes)
-    if hasattr(staxml, 'HardwareResponse'):
-
-      if hasattr(staxml.HardwareResponse, 'ResponseDictGroup'):
-        respDict = getattr(staxml.HardwareResponse.ResponseDictGroup, 'ResponseDict', [])
-        for i in range(0, len(respDict)):
-            cleanStage(respDict[i], changes)
-            if hasattr(respDict[i], 'FilterSequence'):
-              filterStage = getattr(respDict[i].FilterSequence, 'FilterStage', [])
-              for i in range(0, len(filterStage)):
-                 cleanStage(filterStage[i], changes)
-    return changes
+    cleanPass = CleanUnitNamesPass()
+    inventoryPasses.runPasses(staxml, [cleanPass])
+    return cleanPass.changes
 
 def usage():
     print("python cleanUnitNames <staxml>")
@@ -209,7 +255,11 @@ def main():
         for k, v in changes.items():
             if k != 'numChanges':
                 print("    %s => %s"%(k, v))
-    staxml.exportxml(parseArgs.outfile)
+    outfile = compressedFile.openOutput(parseArgs.outfile, parseArgs.compresslevel)
+    try:
+        staxml.exportxml(outfile, backend=parseArgs.serializer)
+    finally:
+        compressedFile.closeOutput(outfile)
 
 if __name__ == '__main__':
     main()
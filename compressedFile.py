@@ -0,0 +1,102 @@
+#! /usr/bin/python
+'''
+Transparent compression for StationXML files. Compressed input is
+recognized by its magic bytes, so gzip, bzip2 and xz files are parsed
+directly by streaming the decompressed bytes into lxml. Output is
+compressed on the fly when the output file name ends in .gz, .bz2 or .xz.
+'''
+
+import bz2
+import contextlib
+import gzip
+import lzma
+import sys
+
+# name, magic bytes at start of file, output file extension
+COMPRESSIONS = (('gzip', b'\x1f\x8b', '.gz'),
+                ('bzip2', b'BZh', '.bz2'),
+                ('xz', b'\xfd7zXZ\x00', '.xz'),
+               )
+
+# gzip and bzip2 levels are 1-9, xz presets 0-9, --compresslevel takes 1-9 for all
+DEFAULT_LEVEL = {'gzip': 6, 'bzip2': 9, 'xz': 6}
+
+def sniffCompression(filename):
+    '''returns compression name for filename from its magic bytes, None if not compressed'''
+    with open(filename, 'rb') as f:
+        head = f.read(6)
+    for name, magic, ext in COMPRESSIONS:
+        if head.startswith(magic):
+            return name
+    return None
+
+def compressionForExtension(filename):
+    '''returns compression name for an output filename from its extension, None if not compressed'''
+    for name, magic, ext in COMPRESSIONS:
+        if filename.endswith(ext):
+            return name
+    return None
+
+def openCompressed(filename, compression, mode, level=None):
+    if level is None:
+        level = DEFAULT_LEVEL[compression]
+    if compression == 'gzip':
+        if 'r' in mode:
+            return gzip.open(filename, mode)
+        return gzip.open(filename, mode, compresslevel=level)
+    elif compression == 'bzip2':
+        if 'r' in mode:
+            return bz2.open(filename, mode)
+        return bz2.open(filename, mode, compresslevel=level)
+    elif compression == 'xz':
+        if 'r' in mode:
+            return lzma.open(filename, mode)
+        return lzma.open(filename, mode, preset=level)
+    raise Exception("unknown compression %s"%(compression,))
+
+@contextlib.contextmanager
+def xmlSource(filename):
+    '''
+    yields something lxml can parse for filename, the filename itself if not
+    compressed so libxml2 reads it directly, otherwise a decompressing stream.
+    File objects are passed through unchanged.
+    '''
+    if not isinstance(filename, str):
+        yield filename
+        return
+    compression = sniffCompression(filename)
+    if compression is None:
+        yield filename
+    else:
+        with openCompressed(filename, compression, 'rb') as f:
+            yield f
+
+def openInput(filename):
+    '''open filename for reading text, decompressing if needed'''
+    compression = sniffCompression(filename)
+    if compression is None:
+        return open(filename, 'r')
+    return openCompressed(filename, compression, 'rt')
+
+def openOutput(filename, level=None):
+    '''
+    open filename for writing text, compressed if the name ends in .gz, .bz2
+    or .xz. None or - is stdout. Close it with closeOutput, a compressed
+    stream is only finished when the file is closed.
+    '''
+    if filename is None or filename == '-':
+        return sys.stdout
+    compression = compressionForExtension(filename)
+    if compression is None:
+        return open(filename, 'w')
+    return openCompressed(filename, compression, 'wt', level)
+
+def closeOutput(outfile):
+    '''close a file from openOutput, finishing any compressed stream, stdout is left open'''
+    if outfile is not sys.stdout:
+        outfile.close()
+
+def addOutputArgs(parser):
+    '''add -o/--outfile and --compresslevel to an argparse parser, see openOutput'''
+    parser.add_argument('-o', '--outfile', nargs='?', default='-', help="output file, compressed if it ends in .gz, .bz2 or .xz, default stdout")
+    parser.add_argument('--compresslevel', type=int, choices=range(1, 10), metavar='1-9', help="compression level for compressed output, default gzip %d, bzip2 %d, xz %d"%(DEFAULT_LEVEL['gzip'], DEFAULT_LEVEL['bzip2'], DEFAULT_LEVEL['xz']))
@@ -0,0 +1,163 @@
+#! /usr/bin/python
+'''
+Match sensor responses against the NRL by comparing complex frequency
+responses instead of individual poles and zeros, so pole/zero order does not
+matter. The NRL sensors are evaluated once on a shared log spaced frequency
+grid into a matrix and every candidate is scored in one vectorized step.
+
+Requires numpy.
+'''
+import checkNRL as checkNRL
+import nrlSource as nrlSource
+
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+VERBOSE = False
+
+# default grid, 1000 s to 100 Hz
+MIN_FREQ = 0.001
+MAX_FREQ = 100.0
+NUM_FREQ = 100
+# max relative difference at any frequency on the grid, same as the
+# pole/zero matcher in checkNRL
+DEFAULT_TOL = 0.001
+# sensor is stage 1 in both StationXML and NRL RESP
+SENSOR_STAGE = 1
+
+def setVerbose(b):
+    global VERBOSE
+    VERBOSE = b
+
+def _requireNumpy():
+    if numpy is None:
+        raise Exception("frequency response matching requires numpy, pip install numpy")
+
+def freqGrid(minFreq=MIN_FREQ, maxFreq=MAX_FREQ, num=NUM_FREQ):
+    _requireNumpy()
+    return numpy.logspace(math.log10(minFreq), math.log10(maxFreq), num)
+
+def pzResponse(zeros, poles, a0, gain, isHertz, freqs):
+    '''
+    complex response of gain * a0 * prod(s-z)/prod(s-p) at each frequency,
+    s is 2 pi i f for Laplace radians/second or i f for Laplace hertz
+    '''
+    if isHertz:
+        s = 1j*freqs
+    else:
+        s = 2j*math.pi*freqs
+    h = numpy.full(len(freqs), gain*a0, dtype=complex)
+    if len(zeros) > 0:
+        h *= numpy.prod(s[:, None] - numpy.array(zeros)[None, :], axis=1)
+    if len(poles) > 0:
+        h /= numpy.prod(s[:, None] - numpy.array(poles)[None, :], axis=1)
+    return h
+
+def staxmlSensorResponse(chanResp, freqs):
+    '''frequency response of stage 1 of a StationXML response, None if not analog PolesZeros'''
+    if not hasattr(chanResp, 'Stage') or len(chanResp.Stage) == 0:
+        return None
+    stage = chanResp.Stage[0]
+    if not hasattr(stage, 'PolesZeros') or not hasattr(stage, 'StageGain'):
+        return None
+    pz = stage.PolesZeros
+    tfType = pz.PzTransferFunctionType.upper()
+    if not tfType.startswith('LAPLACE'):
+        return None
+    zeros = [complex(z.Real.ValueOf, z.Imaginary.ValueOf) for z in getattr(pz, 'Zero', [])]
+    poles = [complex(p.Real.ValueOf, p.Imaginary.ValueOf) for p in getattr(pz, 'Pole', [])]
+    return pzResponse(zeros, poles, float(pz.NormalizationFactor), float(stage.StageGain.Value), 'HERTZ' in tfType, freqs)
+
+def respSensorResponse(nrlResp, freqs):
+    '''frequency response of stage 1 of a parsed RESP file, None if not analog b53'''
+    b53 = checkNRL.findRespBlockette(nrlResp, 1, '053')
+    b58 = checkNRL.findRespBlockette(nrlResp, 1, '058')
+    if b53 is None or b58 is None:
+        return None
+    tfType = b53['03'].strip()[0]
+    if tfType not in ('A', 'B'):
+        return None
+    zeros = [complex(z[1], z[2]) for z in b53.get('10-13', [])]
+    poles = [complex(p[1], p[2]) for p in b53.get('15-18', [])]
+    return pzResponse(zeros, poles, float(b53['07']), float(b58['04']), tfType == 'B', freqs)
+
+class SensorMatrix(object):
+    '''
+    NRL sensor responses on a shared frequency grid, one row per
+    equivalence class of RESP files.
+    '''
+    def __init__(self, freqs, classPaths, matrix):
+        self.freqs = freqs
+        self.classPaths = classPaths
+        self.matrix = matrix
+
+def buildSensorMatrix(nrlDir, freqs=None):
+    _requireNumpy()
+    if freqs is None:
+        freqs = freqGrid()
+    source = nrlSource.openNRL(nrlDir)
+    sensorClasses, sensorOrder = checkNRL.buildRespClasses(source, 'sensors')
+    rows = []
+    classPaths = []
+    for r, paths in sensorClasses:
+        h = respSensorResponse(r, freqs)
+        if h is not None:
+            rows.append(h)
+            classPaths.append(paths)
+    if len(rows) > 0:
+        matrix = numpy.vstack(rows)
+    else:
+        matrix = numpy.zeros((0, len(freqs)), dtype=complex)
+    if VERBOSE: print("sensor matrix %d classes x %d freqs"%matrix.shape)
+    return SensorMatrix(freqs, classPaths, matrix)
+
+def rankSensorMatches(chanResp, sensorMatrix, tol=DEFAULT_TOL):
+    '''
+    returns list of (distance, paths) for the NRL sensors whose response is
+    within tol of the sensor stage of chanResp, best first. Distance is the
+    max relative difference over the frequency grid and must be less than tol.
+    '''
+    h = staxmlSensorResponse(chanResp, sensorMatrix.freqs)
+    if h is None or sensorMatrix.matrix.shape[0] == 0:
+        return []
+    dist = numpy.max(numpy.abs(sensorMatrix.matrix - h[None, :]) / numpy.abs(h)[None, :], axis=1)
+    ranked = numpy.argsort(dist, kind='stable')
+    out = []
+    for i in ranked:
+        if dist[i] >= tol:
+            break
+        out.append((float(dist[i]), sensorMatrix.classPaths[i]))
+    return out
+
+def checkRespListInNRL(nrlDir, respList, tol=DEFAULT_TOL, sensorMatrix=None, withIndex=False):
+    '''
+    same as checkNRL.checkRespListInNRL, but sensors are matched by
+    frequency response and sensor matches are ranked best first.
+    Loggers are matched as in checkNRL.
+    Sensor match tuples are (path, staxml stage, nrl stage, first path of the
+    equivalence class), the same as checkNRL.areSimilarSensor gives, the
+    sensor is always stage 1 of both.
+    '''
+    _requireNumpy()
+    source = nrlSource.openNRL(nrlDir)
+    if sensorMatrix is None:
+        sensorMatrix = buildSensorMatrix(source)
+    outList = []
+    for name, chanResp, chanCodeList in respList:
+        outList.append( [ name, chanResp, chanCodeList, [], [] ] )
+    for name, chanResp, chanCodeList, sss, lll in outList:
+        checkNRL.COUNTERS['sensorComparisons'] += sensorMatrix.matrix.shape[0]
+        for dist, paths in rankSensorMatches(chanResp, sensorMatrix, tol):
+            if VERBOSE: print("%s found Sensor match %s  %g"%(name, paths, dist))
+            for path in paths:
+                sss.append( ( path, SENSOR_STAGE, SENSOR_STAGE, paths[0] ) )
+    loggerOrder = checkNRL.matchLoggersInNRL(source, outList)
+    for name, chanResp, chanCodeList, sss, lll in outList:
+        lll.sort(key=lambda m: loggerOrder[m[0]])
+    if withIndex:
+        return outList, checkNRL.chanCodeIndex(outList)
+    return outList
@@ -0,0 +1,136 @@
+#! /usr/bin/python
+'''
+State for incremental re-conversion with sta2extsta.py --state. The state
+file records, for each converted channel epoch, a sha256 of its input
+StationXML, the converted SIS xml of the channel and the names of the
+ResponseDict entries it uses, plus the xml of those ResponseDicts. On the
+next run channel epochs whose hash is unchanged are written from the state
+as is, and only new or changed epochs are converted.
+
+The state is only used if the options that change the converted channels,
+and the NRL, are the same as when it was written. It is json, compressed if
+the file name ends in .gz, .bz2 or .xz.
+'''
+import checkNRL as checkNRL
+import compressedFile as compressedFile
+import shardOutput as shardOutput
+import sisxmlparser3_0 as sisxmlparser
+
+import copy
+import hashlib
+import io
+import json
+import os
+
+VERBOSE = False
+
+STATE_VERSION = 1
+
+# Channel and ResponseDict are both written at this level below the root
+FRAGMENT_LEVEL = 3
+
+def setVerbose(b):
+    global VERBOSE
+    VERBOSE = b
+
+def fragmentXML(obj, nstag, compact=False):
+    '''xml of obj as exportxml writes it at FRAGMENT_LEVEL'''
+    buf = io.StringIO()
+    writer = sisxmlparser.XMLWriter(buf, compact)
+    obj.writexml(writer, nstag, FRAGMENT_LEVEL, True)
+    writer.flush()
+    return buf.getvalue()
+
+def channelHashes(rootobj):
+    '''
+    dict of chanCodeId to sha256 of the channel xml in the input. Channel
+    epochs whose chanCodeId is not unique map to None, they are always
+    converted.
+    '''
+    hashes = {}
+    for n in rootobj.Network:
+        for s in n.Station:
+            for c in getattr(s, 'Channel', []):
+                chanCodeId = checkNRL.getChanCodeId(n, s, c)
+                if chanCodeId in hashes:
+                    hashes[chanCodeId] = None
+                else:
+                    hashes[chanCodeId] = hashlib.sha256(fragmentXML(c, 'Channel', True).encode('utf-8')).hexdigest()
+    return hashes
+
+def optionsKey(parseArgs, nrl):
+    '''the options and NRL the converted channels depend on, as a json friendly dict'''
+    nrlIndex = nrl.indexStat(checkNRL.SAMP_RATE_INDEX)
+    if nrlIndex is not None:
+        nrlIndex = list(nrlIndex)
+    return {'namespace': parseArgs.namespace,
+            'matcher': parseArgs.matcher,
+            'freqtol': parseArgs.freqtol,
+            'onlychan': parseArgs.onlychan,
+            'onlysta': parseArgs.onlysta,
+            'delcurrent': parseArgs.delcurrent,
+            'compact': parseArgs.compact,
+            'nrl': str(nrl),
+            'nrlIndex': nrlIndex,
+           }
+
+def emptyState(options):
+    return {'version': STATE_VERSION, 'options': options, 'channels': {}, 'responseDicts': {}}
+
+def loadState(stateFile, options):
+    '''
+    state from stateFile, or an empty state if there is none or it was
+    written with other options
+    '''
+    if not os.path.exists(stateFile):
+        return emptyState(options)
+    with compressedFile.openInput(stateFile) as f:
+        state = json.load(f)
+    if state.get('version') != STATE_VERSION:
+        print("state file %s is version %s, converting everything"%(stateFile, state.get('version')))
+        return emptyState(options)
+    if state.get('options') != options:
+        print("state file %s was written with other options or NRL, converting everything"%(stateFile,))
+        return emptyState(options)
+    return state
+
+def saveState(stateFile, state):
+    '''write state to stateFile through a temporary file, so a failed write keeps the old state'''
+    tmpFile = stateFile+'.tmp'
+    compression = compressedFile.compressionForExtension(stateFile)
+    if compression is None:
+        f = open(tmpFile, 'w')
+    else:
+        f = compressedFile.openCompressed(tmpFile, compression, 'wt')
+    try:
+        json.dump(state, f)
+    finally:
+        f.close()
+    os.replace(tmpFile, stateFile)
+
+def reducedRoot(rootobj, reuseIds):
+    '''
+    shallow copy of rootobj without the channel epochs in reuseIds, the
+    input is not changed
+    '''
+    root = copy.copy(rootobj)
+    root.Network = []
+    for n in rootobj.Network:
+        netCopy = copy.copy(n)
+        netCopy.Station = []
+        for s in n.Station:
+            staCopy = copy.copy(s)
+            staCopy.Channel = [c for c in getattr(s, 'Channel', []) if checkNRL.getChanCodeId(n, s, c) not in reuseIds]
+            netCopy.Station.append(staCopy)
+        root.Network.append(netCopy)
+    return root
+
+def renameResponseDict(rd, newName, sisRoot):
+    '''rename rd and every reference to it below sisRoot'''
+    oldName = shardOutput.responseDictName(rd)
+    for k in ('PolesZeros', 'Coefficients', 'FIR', 'Polynomial', 'FilterSequence'):
+        if hasattr(rd, k):
+            getattr(rd, k).name = newName
+    for node in shardOutput.walk(sisRoot):
+        if isinstance(node, (sisxmlparser.ResponseDictLinkType, sisxmlparser.FilterIDType)) and node.Name == oldName:
+            node.Name = newName
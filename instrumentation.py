@@ -0,0 +1,119 @@
+#! /usr/bin/python
+'''
+Opt-in call counters and timers for the hot comparison and RESP parsing
+functions, to see where matching spends its time and which check rejects
+most candidates, ie which prefilter would pay off.
+
+Functions are marked with the @instrumented decorator. Unless enabled,
+by setting the environment variable STA2EXTSTA_INSTRUMENT=1 before the
+modules are imported or by calling enable(), the decorator returns the
+function unchanged so there is no overhead. enable() rebinds the module
+attributes to timing wrappers and disable() puts the originals back.
+
+For functions returning a (False, reason) tuple the reasons are counted
+with the values taken out, so "num poles: 5!=4" and "num poles: 3!=4" both
+count as "num poles".
+'''
+import functools
+import os
+import re
+import sys
+import time
+
+ENV_VAR = 'STA2EXTSTA_INSTRUMENT'
+
+_enabled = os.environ.get(ENV_VAR, '').lower() not in ('', '0', 'false', 'no')
+
+# qualified name to (module name, function name, original, wrapper)
+_hooks = {}
+# qualified name to stats dict
+_stats = {}
+
+NUMBER_PATTERN = re.compile(r"(?<![A-Za-z_\d.])[-+]?\d+(\.\d*)?([eE][-+]?\d+)?")
+QUOTED_PATTERN = re.compile(r"'[^']*'")
+# values and separators left at the end once cut at !=
+TRAILING_PATTERN = re.compile(r"[\s:]*((N|'\?')[\s:]*)*$")
+
+def reasonKey(reason):
+    '''reason with numbers and quoted values removed, cut at the first !='''
+    key = QUOTED_PATTERN.sub("'?'", str(reason))
+    key = NUMBER_PATTERN.sub('N', key)
+    if '!=' in key:
+        key = key[:key.index('!=')]
+    return TRAILING_PATTERN.sub('', key)
+
+def _record(name, elapsed, result):
+    stats = _stats.get(name)
+    if stats is None:
+        stats = {'calls': 0, 'seconds': 0.0, 'true': 0, 'false': 0, 'reasons': {}}
+        _stats[name] = stats
+    stats['calls'] += 1
+    stats['seconds'] += elapsed
+    if isinstance(result, tuple) and len(result) > 1:
+        if result[0]:
+            stats['true'] += 1
+        else:
+            stats['false'] += 1
+            key = reasonKey(result[1])
+            stats['reasons'][key] = stats['reasons'].get(key, 0) + 1
+
+def instrumented(func):
+    '''
+    decorator registering func, returns func itself unless instrumentation
+    is enabled
+    '''
+    name = "%s.%s"%(func.__module__, func.__name__)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            _record(name, time.perf_counter()-start, result)
+
+    _hooks[name] = (func.__module__, func.__name__, func, wrapper)
+    if _enabled:
+        return wrapper
+    return func
+
+def _install(useWrapper):
+    for name, (moduleName, funcName, func, wrapper) in _hooks.items():
+        module = sys.modules.get(moduleName)
+        if module is not None:
+            setattr(module, funcName, wrapper if useWrapper else func)
+
+def enable():
+    global _enabled
+    _enabled = True
+    _install(True)
+
+def disable():
+    global _enabled
+    _enabled = False
+    _install(False)
+
+def isEnabled():
+    return _enabled
+
+def reset():
+    _stats.clear()
+
+def report():
+    '''dict of qualified function name to calls, seconds, true, false and reasons counts'''
+    out = {}
+    for name, stats in _stats.items():
+        s = dict(stats)
+        s['reasons'] = dict(sorted(stats['reasons'].items(), key=lambda r: -r[1]))
+        out[name] = s
+    return out
+
+def printReport(out=None):
+    if out is None:
+        out = sys.stdout
+    for name, stats in sorted(report().items(), key=lambda s: -s[1]['seconds']):
+        out.write("%-40s %10d calls %10.3f s  %d true %d false\n"%(name, stats['calls'], stats['seconds'], stats['true'], stats['false']))
+        for reason, count in stats['reasons'].items():
+            out.write("    %10d  %s\n"%(count, reason))
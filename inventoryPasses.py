@@ -0,0 +1,71 @@
+#! /usr/bin/python
+'''
+Passes over the networks, stations and channels of a parsed StationXML,
+run fused in a single walk of the tree. Each pass subclasses InventoryPass
+and overrides the visit methods it needs, runPasses calls them in order
+for each node, so a pass sees every earlier pass already applied to the
+node, and the chanCodeId of a channel is only computed once.
+
+visitNetwork and visitStation are called before the stations or channels
+below are walked, so a pass may filter n.Station or s.Channel there.
+Each pass keeps its own change log in changes, with numChanges plus
+messages by chanCodeId from logChange.
+'''
+import checkNRL as checkNRL
+
+class InventoryPass(object):
+    '''a pass run by runPasses, name must be unique among the passes of one run'''
+    name = 'pass'
+
+    def __init__(self, changes=None):
+        if changes is None:
+            changes = { 'numChanges': 0 }
+        self.changes = changes
+
+    def visitNetwork(self, n):
+        pass
+
+    def visitStation(self, n, s):
+        pass
+
+    def visitChannel(self, n, s, c, chanCode):
+        pass
+
+    def finish(self, staxml):
+        '''called once after the walk'''
+        pass
+
+    def logChange(self, chanCode, message):
+        self.changes['numChanges'] += 1
+        if not chanCode in self.changes:
+            self.changes[chanCode] = []
+        self.changes[chanCode].append(message)
+
+def _overridden(passes, method):
+    '''bound methods of passes overriding InventoryPass.method, the others are not called'''
+    base = getattr(InventoryPass, method)
+    return [getattr(p, method) for p in passes if getattr(type(p), method) is not base]
+
+def runPasses(staxml, passes):
+    '''
+    run passes in one walk of staxml, returns dict of pass name to its
+    change log
+    '''
+    networkVisits = _overridden(passes, 'visitNetwork')
+    stationVisits = _overridden(passes, 'visitStation')
+    channelVisits = _overridden(passes, 'visitChannel')
+    for n in staxml.Network:
+        for visit in networkVisits:
+            visit(n)
+        for s in n.Station:
+            for visit in stationVisits:
+                visit(n, s)
+            if len(channelVisits) == 0:
+                continue
+            for c in getattr(s, 'Channel', []):
+                chanCode = checkNRL.getChanCodeId(n, s, c)
+                for visit in channelVisits:
+                    visit(n, s, c, chanCode)
+    for p in passes:
+        p.finish(staxml)
+    return dict((p.name, p.changes) for p in passes)
@@ -3,6 +3,7 @@
 check if single channel sensor response in NRL
 '''
 import checkNRL as checkNRL
+import nrlSource as nrlSource
 import sisxmlparser3_0 as sisxmlparser
 import uniqResponses as uniqResponses
 from xerces_validate import xerces_validate, SCHEMA_FILE
@@ -26,7 +27,7 @@ def initArgParser():
   parser = argparse.ArgumentParser(description='Check one channel in StationXML to see if same as NRL.')
   parser.add_argument('-s', '--stationxml', required=True, help="input FDSN StationXML file, often retrieved from http://service.iris.edu/fdsnws/station/1/")
   parser.add_argument('-c', '--channel', required=True, help="channel code to compare")
-  parser.add_argument('--nrl', help="replace matching responses with links to NRL")
+  parser.add_argument('--nrl', default='nrl', help="replace matching responses with links to NRL, either a directory or a zip archive of the NRL")
   parser.add_argument('--sensordir', help="Sensor manufacturor subdir of NRL, to limit number of files parsed.")
   parser.add_argument('--loggerdir', help="Logger manufacturor subdir of NRL, to limit number of files parsed.")
   parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'), default=sys.stdout)
@@ -75,38 +76,37 @@ def main():
           if cCode == parseArgs.channel:
               chanA = c
 
+    if not os.path.exists(parseArgs.nrl):
+        print("ERROR: can't find nrl %s"%(parseArgs.nrl,))
+        return
+    source = nrlSource.openNRL(parseArgs.nrl)
+
     if parseArgs.sensordir:
-        nrlSubdir = "%s/sensors/%s"%(parseArgs.nrl, parseArgs.sensordir)
-        if VERBOSE: print("walk %s"%(nrlSubdir,))
-        for root, dirs, files in os.walk(nrlSubdir):
-          if '.svn' in dirs:
-            dirs.remove('.svn')
-          for respfile in files:
-            if respfile.startswith("RESP"):
-                if VERBOSE: print("try %s"%(respfile,))
-                r = checkNRL.loadResp(os.path.join(root, respfile))
-                result = checkNRL.areSimilarSensor(c.Response, r)
-                if result[0]:
-                    print("MATCH %s match %s"%(chanCode, respfile,))
-                else:
-                    print("FAIL %s match %s: %s"%(chanCode, respfile, result[1]))
+        nrlSubdir = "sensors/%s"%(parseArgs.sensordir,)
+        if VERBOSE: print("walk %s %s"%(source, nrlSubdir))
+        for path in source.walk(nrlSubdir):
+            respfile = os.path.basename(path)
+            if VERBOSE: print("try %s"%(respfile,))
+            r = checkNRL.loadResp(path, source)
+            result = checkNRL.areSimilarSensor(c.Response, r)
+            if result[0]:
+                print("MATCH %s match %s"%(chanCode, respfile,))
+            else:
+                print("FAIL %s match %s: %s"%(chanCode, respfile, result[1]))
 
 
     if parseArgs.loggerdir:
-        nrlSubdir = "%s/dataloggers/%s"%(parseArgs.nrl, parseArgs.loggerdir)
-        if VERBOSE: print("walk %s"%(nrlSubdir,))
-        for root, dirs, files in os.walk(nrlSubdir):
-          if '.svn' in dirs:
-            dirs.remove('.svn')
-          for respfile in files:
-            if respfile.startswith("RESP"):
-                if VERBOSE: print("try %s"%(respfile,))
-                r = checkNRL.loadResp(os.path.join(root, respfile))
-                result = checkNRL.areSimilarLogger(c.Response, r)
-                if result[0]:
-                    print("MATCH %s match %s"%(chanCode, respfile,))
-                else:
-                    print("FAIL %s match %s: %s"%(chanCode, respfile, result[1]))
+        nrlSubdir = "dataloggers/%s"%(parseArgs.loggerdir,)
+        if VERBOSE: print("walk %s %s"%(source, nrlSubdir))
+        for path in source.walk(nrlSubdir):
+            respfile = os.path.basename(path)
+            if VERBOSE: print("try %s"%(respfile,))
+            r = checkNRL.loadResp(path, source)
+            result = checkNRL.areSimilarLogger(c.Response, r)
+            if result[0]:
+                print("MATCH %s match %s"%(chanCode, respfile,))
+            else:
+                print("FAIL %s match %s: %s"%(chanCode, respfile, result[1]))
 
 if __name__ == "__main__":
     sys.exit(main())
@@ -0,0 +1,197 @@
+#! /usr/bin/python
+'''
+Access the RESP files of a local NRL copy, either as an unpacked directory
+or directly from a zip archive of the old svn NRL.
+
+Both backends walk directories top down in sorted order and report paths as
+they would appear in the unpacked directory, ie nrl/sensors/..., so matches
+are the same whichever backend is used.
+'''
+
+import io
+import os
+import zipfile
+
+class NRLDirSource(object):
+    '''NRL unpacked into a directory, the traditional layout.'''
+
+    def __init__(self, nrlDir):
+        self.root = nrlDir
+
+    def __str__(self):
+        return self.root
+
+    def exists(self):
+        return os.path.isdir(self.root)
+
+    def walk(self, subdir=''):
+        '''yield path of each RESP file below subdir of the NRL'''
+        top = os.path.join(self.root, subdir) if subdir else self.root
+        for root, dirs, files in os.walk(top):
+            if '.svn' in dirs:
+                dirs.remove('.svn')
+            dirs.sort()
+            for respfile in sorted(files):
+                if respfile.startswith("RESP"):
+                    yield os.path.join(root, respfile)
+
+    def open(self, path):
+        return open(path, 'r')
+
+    def openBinary(self, path):
+        return open(path, 'rb')
+
+    def stat(self, path):
+        '''returns (mtime_ns, size) for path'''
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def relPath(self, path):
+        '''path of a RESP file relative to the top of the NRL, ie sensors/...'''
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def indexFile(self, name):
+        '''path for an index file, like logger_sample_rate.sort, for this NRL'''
+        return os.path.join(self.root, name)
+
+    def openIndex(self, name):
+        '''open index file name for reading, None if there is none'''
+        path = self.indexFile(name)
+        if not os.path.exists(path):
+            return None
+        return open(path, 'r')
+
+    def indexStat(self, name):
+        '''(mtime_ns, size) of index file name, None if there is none'''
+        path = self.indexFile(name)
+        if not os.path.exists(path):
+            return None
+        return self.stat(path)
+
+    def close(self):
+        pass
+
+
+class NRLZipSource(object):
+    '''
+    NRL read from a zip archive without extracting. The central directory is
+    read once when opened and RESP members are streamed as needed.
+    The archive may contain the sensors and dataloggers directories at the
+    top level or inside a single top level directory like nrl/. Paths are
+    below that directory, or below nrl if there is none, whatever the
+    archive is named. Index files in the NRL directory of the archive are
+    read when there is none beside the archive.
+    '''
+
+    def __init__(self, zipPath, root=None):
+        self.zipPath = zipPath
+        self.zipfile = zipfile.ZipFile(zipPath, 'r')
+        self.members = {}
+        self.indexMembers = {}
+        self.dirs = {}
+        names = [i.filename for i in self.zipfile.infolist()]
+        stripPrefix = ''
+        topLevel = set([n.split('/')[0] for n in names])
+        if len(topLevel) == 1 and not ('sensors' in topLevel or 'dataloggers' in topLevel):
+            stripPrefix = topLevel.pop()+'/'
+        if root is None:
+            root = stripPrefix.rstrip('/') or 'nrl'
+        self.root = root
+        for info in self.zipfile.infolist():
+            if info.is_dir() or not info.filename.startswith(stripPrefix):
+                continue
+            relpath = info.filename[len(stripPrefix):]
+            parts = relpath.split('/')
+            if '.svn' in parts[:-1]:
+                continue
+            if len(parts) == 1:
+                self.indexMembers[parts[0]] = info
+            path = os.path.join(self.root, *parts)
+            self.members[path] = info
+            dirpath = self.root
+            for p in parts[:-1]:
+                subdirs, files = self.dirs.setdefault(dirpath, (set(), []))
+                subdirs.add(p)
+                dirpath = os.path.join(dirpath, p)
+            subdirs, files = self.dirs.setdefault(dirpath, (set(), []))
+            files.append(parts[-1])
+
+    def __str__(self):
+        return self.zipPath
+
+    def exists(self):
+        return True
+
+    def walk(self, subdir=''):
+        '''yield path of each RESP file below subdir of the NRL'''
+        top = os.path.join(self.root, subdir) if subdir else self.root
+        top = os.path.normpath(top)
+        if top not in self.dirs:
+            return
+        stack = [top]
+        while len(stack) > 0:
+            root = stack.pop()
+            subdirs, files = self.dirs[root]
+            for respfile in sorted(files):
+                if respfile.startswith("RESP"):
+                    yield os.path.join(root, respfile)
+            for d in sorted(subdirs, reverse=True):
+                stack.append(os.path.join(root, d))
+
+    def open(self, path):
+        return io.TextIOWrapper(self.zipfile.open(self.members[path], 'r'))
+
+    def openBinary(self, path):
+        return self.zipfile.open(self.members[path], 'r')
+
+    def stat(self, path):
+        '''returns (mtime, size) for path, mtime from the zip entry date_time'''
+        info = self.members[path]
+        mtime = int("%04d%02d%02d%02d%02d%02d"%info.date_time)
+        return mtime, info.file_size
+
+    def relPath(self, path):
+        '''path of a RESP file relative to the top of the NRL, ie sensors/...'''
+        return os.path.relpath(path, self.root).replace(os.sep, '/')
+
+    def indexFile(self, name):
+        '''index files can't be written inside the archive, so keep them beside it'''
+        return "%s_%s"%(os.path.splitext(self.zipPath)[0], name)
+
+    def openIndex(self, name):
+        '''
+        open index file name for reading, the one beside the archive if there
+        is one, else the one in the archive, None if neither
+        '''
+        path = self.indexFile(name)
+        if os.path.exists(path):
+            return open(path, 'r')
+        if name in self.indexMembers:
+            return io.TextIOWrapper(self.zipfile.open(self.indexMembers[name], 'r'))
+        return None
+
+    def indexStat(self, name):
+        '''(mtime, size) of the index file openIndex reads, None if there is none'''
+        path = self.indexFile(name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size
+        if name in self.indexMembers:
+            info = self.indexMembers[name]
+            return int("%04d%02d%02d%02d%02d%02d"%info.date_time), info.file_size
+        return None
+
+    def close(self):
+        self.zipfile.close()
+
+
+def openNRL(nrl):
+    '''
+    returns a NRL source for nrl, which may be a directory, a zip archive
+    or an already opened source, which is returned unchanged.
+    '''
+    if hasattr(nrl, 'walk'):
+        return nrl
+    if not os.path.isdir(nrl) and zipfile.is_zipfile(nrl):
+        return NRLZipSource(nrl)
+    return NRLDirSource(nrl)
@@ -0,0 +1,142 @@
+#! /usr/bin/python
+'''
+Wall time, CPU time and peak memory for each stage of a conversion, plus
+counters like channels converted or NRL files parsed, written as a json
+report by sta2extsta.py --profile FILE to compare releases.
+
+Stages may run many times, ie fixResponseNRL once per channel, times are
+summed and the peak is the largest of any run. Peak memory is measured
+with tracemalloc, which slows the conversion down, as bytes allocated
+above what was in use when the stage started. The total peak is the most
+memory in use at any time while profiling.
+'''
+import contextlib
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+REPORT_VERSION = 1
+
+class PipelineProfile(object):
+    enabled = True
+
+    def __init__(self, traceMemory=True):
+        self.traceMemory = traceMemory
+        self.stages = {}
+        self.counters = {}
+        # other named reports to include, ie instrumentation
+        self.sections = {}
+        # name to [wall, cpu, memory at start, peak memory while running]
+        self._running = {}
+        self.peakMemory = 0
+        self.created = datetime.datetime.now(datetime.timezone.utc)
+        self._start = (time.perf_counter(), time.process_time())
+        if traceMemory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def _foldPeak(self):
+        '''
+        fold the tracemalloc peak since the last reset into the total and
+        the running stages, so reset_peak for a stage loses neither
+        '''
+        peak = tracemalloc.get_traced_memory()[1]
+        self.peakMemory = max(self.peakMemory, peak)
+        for running in self._running.values():
+            running[3] = max(running[3], peak)
+
+    def start(self, name):
+        mem = 0
+        if self.traceMemory:
+            self._foldPeak()
+            tracemalloc.reset_peak()
+            mem = tracemalloc.get_traced_memory()[0]
+        self._running[name] = [time.perf_counter(), time.process_time(), mem, mem]
+
+    def stop(self, name):
+        if self.traceMemory:
+            self._foldPeak()
+        wall, cpu, mem, peak = self._running.pop(name)
+        wall = time.perf_counter() - wall
+        cpu = time.process_time() - cpu
+        if name not in self.stages:
+            self.stages[name] = {'calls': 0, 'wall': 0.0, 'cpu': 0.0, 'peakMemory': None}
+        stats = self.stages[name]
+        stats['calls'] += 1
+        stats['wall'] += wall
+        stats['cpu'] += cpu
+        if self.traceMemory:
+            peak = peak - mem
+            if stats['peakMemory'] is None or peak > stats['peakMemory']:
+                stats['peakMemory'] = peak
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.start(name)
+        try:
+            yield
+        finally:
+            self.stop(name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def addSection(self, name, data):
+        self.sections[name] = data
+
+    def report(self):
+        stages = []
+        for name, stats in self.stages.items():
+            s = {'name': name}
+            s.update(stats)
+            stages.append(s)
+        total = {'wall': time.perf_counter() - self._start[0],
+                 'cpu': time.process_time() - self._start[1],
+                 'peakMemory': max(self.peakMemory, tracemalloc.get_traced_memory()[1]) if self.traceMemory else None}
+        out = {'version': REPORT_VERSION,
+               'created': self.created.isoformat(),
+               'python': platform.python_version(),
+               'argv': sys.argv,
+               'stages': stages,
+               'total': total,
+               'counters': self.counters}
+        out.update(self.sections)
+        return out
+
+    def write(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+class NullProfile(object):
+    '''does nothing, used when not profiling'''
+    enabled = False
+
+    def start(self, name):
+        pass
+
+    def stop(self, name):
+        pass
+
+    def stage(self, name):
+        return contextlib.nullcontext()
+
+    def count(self, name, n=1):
+        pass
+
+NULL_PROFILE = NullProfile()
+
+class CountingWriter(object):
+    '''wraps a text output, counting the utf-8 bytes written to it'''
+
+    def __init__(self, out):
+        self.out = out
+        self.numBytes = 0
+
+    def write(self, text):
+        self.numBytes += len(text.encode('utf-8'))
+        return self.out.write(text)
+
+    def flush(self):
+        self.out.flush()
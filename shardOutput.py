@@ -0,0 +1,219 @@
+#! /usr/bin/python
+'''
+Split an ExtStationXML document into one document per network or per
+station for upload to SIS station by station. Each shard carries only the
+ResponseDict entries its channels reference, directly by ResponseDictLink
+or through the FilterStage of a referenced FilterSequence.
+
+A JSON manifest lists the shards with their channel counts and a sha256 of
+the content, without the Created time, so a rerun only rewrites shards that
+changed.
+'''
+import compressedFile as compressedFile
+import sisxmlparser3_0 as sisxmlparser
+
+import concurrent.futures
+import copy
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import re
+
+VERBOSE = False
+
+SHARD_BY = ('network', 'station')
+MANIFEST_FILE = 'manifest.json'
+
+CREATED_PATTERN = re.compile(r'<Created>[^<]*</Created>')
+
+# shards shared with forked workers, set before the workers fork
+_forkshards = []
+
+def setVerbose(b):
+    global VERBOSE
+    VERBOSE = b
+
+def walk(node):
+    '''yield node and every SISBase node below it'''
+    stack = [node]
+    while stack:
+        n = stack.pop()
+        yield n
+        for k, datatype, isreqd, ismulti, nsk in n.elemtags():
+            v = n.__dict__.get(k)
+            if v is None or isinstance(datatype, str):
+                continue
+            if ismulti:
+                stack.extend([c for c in v if c is not None])
+            else:
+                stack.append(v)
+
+def responseDictName(rd):
+    for k in ('PolesZeros', 'Coefficients', 'FIR', 'Polynomial', 'FilterSequence'):
+        if hasattr(rd, k):
+            return getattr(getattr(rd, k), 'name', None)
+    return None
+
+def referencedNames(node):
+    '''names of ResponseDict and filters referenced below node'''
+    names = set()
+    for n in walk(node):
+        if isinstance(n, (sisxmlparser.ResponseDictLinkType, sisxmlparser.FilterIDType)):
+            names.add(n.Name)
+    return names
+
+def referencedResponseDictNames(node, byName):
+    '''
+    names of the ResponseDict entries in byName referenced below node,
+    following references from FilterSequences to their filter stages
+    '''
+    needed = set()
+    todo = list(referencedNames(node))
+    while todo:
+        name = todo.pop()
+        if name in needed or name not in byName:
+            continue
+        needed.add(name)
+        todo.extend(referencedNames(byName[name]))
+    return needed
+
+def numChannels(sisRoot):
+    return sum([len(getattr(s, 'Channel', [])) for n in sisRoot.Network for s in n.Station])
+
+class Shard(object):
+    def __init__(self, name, root):
+        self.name = name
+        self.root = root
+
+def splitShards(sisRoot, shardBy):
+    '''
+    returns list of Shard, one per network or station code in document order.
+    Shard roots are shallow copies, the input document is not changed.
+    '''
+    if shardBy not in SHARD_BY:
+        raise Exception("shardBy must be one of %s: %s"%(SHARD_BY, shardBy))
+    groups = {}
+    order = []
+    for n in sisRoot.Network:
+        if shardBy == 'network':
+            keys = [(n.code, n.Station)]
+        else:
+            keys = [("%s.%s"%(n.code, s.code), [s]) for s in n.Station]
+        for key, stations in keys:
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            netCopy = copy.copy(n)
+            netCopy.Station = list(stations)
+            groups[key].append(netCopy)
+    respDictList = []
+    if hasattr(sisRoot, 'HardwareResponse') and hasattr(sisRoot.HardwareResponse, 'ResponseDictGroup'):
+        respDictList = sisRoot.HardwareResponse.ResponseDictGroup.ResponseDict
+    byName = dict([(responseDictName(rd), rd) for rd in respDictList])
+    out = []
+    for key in order:
+        root = copy.copy(sisRoot)
+        root.Network = groups[key]
+        if hasattr(sisRoot, 'HardwareResponse'):
+            hr = copy.copy(sisRoot.HardwareResponse)
+            if hasattr(hr, 'ResponseDictGroup'):
+                names = set()
+                for netCopy in root.Network:
+                    names.update(referencedResponseDictNames(netCopy, byName))
+                used = [rd for rd in respDictList if responseDictName(rd) in names]
+                if len(used) > 0:
+                    group = copy.copy(hr.ResponseDictGroup)
+                    group.ResponseDict = used
+                    hr.ResponseDictGroup = group
+                else:
+                    del hr.ResponseDictGroup
+            if len([k for k, dt, r, m in hr.ELEMS if hasattr(hr, k)]) > 0:
+                root.HardwareResponse = hr
+            else:
+                del root.HardwareResponse
+        out.append(Shard(key, root))
+    return out
+
+def contentHash(xml):
+    '''sha256 of the xml text without the Created time, which changes every run'''
+    return hashlib.sha256(CREATED_PATTERN.sub('', xml, count=1).encode('utf-8')).hexdigest()
+
+def shardFilename(outdir, name, suffix):
+    return os.path.join(outdir, name+suffix)
+
+def writeShard(shard, filename, oldHash, ignorewarning=False, compact=False, compresslevel=None):
+    '''
+    serialize shard, write it to filename unless its content hash is oldHash
+    and the file exists. Returns (name, filename, numChannels, hash, written)
+    The shard is not validated, writeShards validates the whole document.
+    '''
+    if isinstance(shard, int):
+        shard = _forkshards[shard]
+    buf = io.StringIO()
+    shard.root.exportxml(buf, ignorewarning=ignorewarning, compact=compact, validate=False)
+    xml = buf.getvalue()
+    digest = contentHash(xml)
+    written = False
+    if digest != oldHash or not os.path.exists(filename):
+        outfile = compressedFile.openOutput(filename, compresslevel)
+        try:
+            outfile.write(xml)
+        finally:
+            outfile.close()
+        written = True
+    return shard.name, filename, numChannels(shard.root), digest, written
+
+def loadManifest(outdir):
+    manifestFile = os.path.join(outdir, MANIFEST_FILE)
+    if not os.path.exists(manifestFile):
+        return {}
+    with open(manifestFile, 'r') as f:
+        manifest = json.load(f)
+    return dict([(s['name'], s) for s in manifest.get('shards', [])])
+
+def writeShards(sisRoot, shardBy, outdir, suffix='.xml', workers=1, ignorewarning=False, compact=False, compresslevel=None):
+    '''
+    write one document per shard into outdir plus the manifest, using up to
+    workers processes. Shards whose content hash matches the previous
+    manifest are not rewritten. Returns the manifest dict and the list of
+    writeShard results.
+    '''
+    global _forkshards
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+    shards = splitShards(sisRoot, shardBy)
+    # validate once here, the shards are copies holding these same nodes
+    sisRoot.checktree(ignorewarning)
+    oldShards = loadManifest(outdir)
+    jobs = []
+    for i, shard in enumerate(shards):
+        filename = shardFilename(outdir, shard.name, suffix)
+        oldHash = oldShards[shard.name]['sha256'] if shard.name in oldShards else None
+        jobs.append((i, shard, filename, oldHash))
+    if workers is None or workers <= 1:
+        results = [writeShard(shard, filename, oldHash, ignorewarning, compact, compresslevel) for i, shard, filename, oldHash in jobs]
+    else:
+        context = None
+        if 'fork' in multiprocessing.get_all_start_methods():
+            # forked workers share the shards, so send an index, not the pickled tree
+            _forkshards = shards
+            context = multiprocessing.get_context('fork')
+        try:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+                futures = [executor.submit(writeShard, i if context is not None else shard, filename, oldHash, ignorewarning, compact, compresslevel)
+                           for i, shard, filename, oldHash in jobs]
+                results = [f.result() for f in futures]
+        finally:
+            _forkshards = []
+    manifest = {'shardBy': shardBy, 'shards': []}
+    for name, filename, numChan, digest, written in results:
+        if VERBOSE: print("%s %s %d channels %s"%("write" if written else "unchanged", filename, numChan, digest))
+        manifest['shards'].append({'name': name,
+                                   'file': os.path.basename(filename),
+                                   'channels': numChan,
+                                   'sha256': digest})
+    with open(os.path.join(outdir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest, results
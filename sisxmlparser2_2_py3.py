@@ -79,6 +79,8 @@ import base64
 import datetime as datetime_
 from lxml import etree as etree_
 
+import compressedFile
+
 
 def parsexml_(*args, **kwargs):
     kwargs['parser'] = etree_.ETCompatXMLParser()
@@ -1444,7 +1446,9 @@ class SISRootType(RootType):
 
 def parse(inFileName, rootType = SISRootType):
     global docnsmap, docnsprefixmap
-    doc = parsexml_(inFileName)
+    # gzip, bzip2 or xz input is decompressed while parsing
+    with compressedFile.xmlSource(inFileName) as source:
+        doc = parsexml_(source)
     root = doc.getroot()
     docnsmap = root.nsmap
     for k, uri in list(docnsmap.items()):
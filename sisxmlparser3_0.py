@@ -16,6 +16,10 @@ Email: sis-help@gps.caltech.edu
 '''
 
 import argparse
+import concurrent.futures
+import copy
+import io
+import multiprocessing
 import sys
 import re as re_
 import base64
@@ -24,6 +28,8 @@ from lxml import etree as etree_
 import html
 import os
 
+import compressedFile
+
 
 def parsexml_(*args, **kwargs):
     kwargs['parser'] = etree_.ETCompatXMLParser()
@@ -58,8 +64,33 @@ datatype_map = dict(text=str,
 
 docnsprefixmap = {}     #value is set when parsing the document.
 
+# Interner of the parse in progress, only set by parse(..., intern=True)
+_interner = None
+
+# text elements and attributes with few distinct values, interned by parse(..., intern=True)
+INTERNED_TEXT = frozenset(['Name', 'Description', 'PzTransferFunctionType', 'CfTransferFunctionType',
+    'Symmetry', 'SISNamespace', 'unit', 'measurementMethod', 'code', 'locationCode', 'restrictedStatus'])
+
 INDENT = '  '
 
+# exportxml backends, python string formatting or lxml elements serialized by libxml2
+EXPORT_BACKENDS = ('python', 'lxml')
+
+_lxmlnames = {}
+
+def get_lxml_name(nsname, defaultns='fsx'):
+    ''' Convert a prefixed name like sis:Logger or xsi:type to lxml {uri}name form '''
+    if nsname not in _lxmlnames:
+        if ':' in nsname:
+            prefix, name = nsname.split(':', 1)
+        else:
+            prefix, name = defaultns, nsname
+        if prefix:
+            _lxmlnames[nsname] = '{%s}%s' % (nsd[prefix][0], name)
+        else:
+            _lxmlnames[nsname] = name
+    return _lxmlnames[nsname]
+
 
 def get_ns_nodename(node):
     [nsuri, nodename] = Namespace_extract_pat_.match(node.tag).groups()
@@ -165,6 +196,173 @@ FMT_DEC_1 = '{0:.1f}'
 FMT_DEC_6 = '{0:.6f}'
 FMT_EXP_6 = '{0:.6e}'
 
+class XMLWriter(object):
+    '''
+    Collects the xml fragments written by exportxml in a list and writes them
+    to the output file joined in large blocks, one per Station and the rest at
+    the end, instead of one write per element. In compact mode elements are
+    not indented and there are no line separators.
+    '''
+    FLUSH_TAGS = ('Station',)
+    # subtrees with these tags are handed to defer instead of written inline
+    DEFER_TAGS = ()
+
+    def __init__(self, outfile, compact=False):
+        self.outfile = outfile
+        self.parts = []
+        self.append = self.parts.append
+        self.compact = compact
+        self.linesep = '' if compact else os.linesep
+        self.indents = ['']
+
+    def indent(self, level):
+        if self.compact:
+            return ''
+        while len(self.indents) <= level:
+            self.indents.append(INDENT*len(self.indents))
+        return self.indents[level]
+
+    def flush(self):
+        if self.parts:
+            self.outfile.write(''.join(self.parts))
+            self.parts.clear()
+
+# subtrees shared with forked ParallelXMLWriter workers, set before the workers fork
+_forksubtrees = []
+
+def _writexml_fragment(obj, nstag, level, ignorewarning, compact):
+    '''serialize one subtree to a string, run in a ParallelXMLWriter worker process'''
+    buf = io.StringIO()
+    writer = XMLWriter(buf, compact)
+    obj.writexml(writer, nstag, level, ignorewarning)
+    writer.flush()
+    return buf.getvalue()
+
+def _writexml_forked(start, end, ignorewarning, compact):
+    '''serialize _forksubtrees[start:end] in a forked ParallelXMLWriter worker'''
+    return [_writexml_fragment(obj, nstag, level, ignorewarning, compact) for obj, nstag, level in _forksubtrees[start:end]]
+
+class ParallelXMLWriter(XMLWriter):
+    '''
+    XMLWriter that serializes each Station and the HardwareResponse subtree
+    in worker processes. The fragments are spliced back in document order
+    when flushed, so the output is identical to XMLWriter.
+
+    Where processes can fork, workers share the tree and are given ranges of
+    subtrees, as pickling a subtree costs more than writing it. Otherwise
+    each subtree is pickled to a worker.
+    '''
+    FLUSH_TAGS = ()
+    DEFER_TAGS = ('Station', 'sis:HardwareResponse')
+    CHUNKS_PER_WORKER = 4
+
+    def __init__(self, outfile, root, level, workers, ignorewarning=False, compact=False):
+        super(ParallelXMLWriter, self).__init__(outfile, compact)
+        global _forksubtrees
+        self.fragments = {}
+        if 'fork' in multiprocessing.get_all_start_methods():
+            _forksubtrees = self.findsubtrees(root, level)
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('fork'))
+            chunk = max(1, -(-len(_forksubtrees) // (workers*self.CHUNKS_PER_WORKER)))
+            for start in range(0, len(_forksubtrees), chunk):
+                end = min(start+chunk, len(_forksubtrees))
+                future = self.executor.submit(_writexml_forked, start, end, ignorewarning, compact)
+                for i in range(start, end):
+                    self.fragments[id(_forksubtrees[i][0])] = (future, i-start)
+        else:
+            self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+    def findsubtrees(self, root, level):
+        '''(subtree, tag, level) for the subtrees below root that will be deferred, in document order'''
+        out = []
+        stack = [(root, level)]
+        while stack:
+            node, nodelevel = stack.pop()
+            children = []
+            for k, datatype, isreqd, ismulti, nsk in node.elemtags():
+                v = node.__dict__.get(k)
+                if v is None or isinstance(datatype, str):
+                    continue
+                for item in (v if ismulti else [v]):
+                    if item is None:
+                        continue
+                    if nsk in self.DEFER_TAGS:
+                        out.append((item, nsk, nodelevel+1))
+                    else:
+                        children.append((item, nodelevel+1))
+            stack.extend(reversed(children))
+        return out
+
+    def defer(self, obj, nstag, level, ignorewarning):
+        if id(obj) in self.fragments:
+            self.append(self.fragments[id(obj)])
+        else:
+            self.append((self.executor.submit(_writexml_fragment, obj, nstag, level, ignorewarning, self.compact), None))
+
+    def flush(self):
+        if self.parts:
+            out = []
+            for p in self.parts:
+                if isinstance(p, str):
+                    out.append(p)
+                elif p[1] is None:
+                    out.append(p[0].result())
+                else:
+                    out.append(p[0].result()[p[1]])
+            self.outfile.write(''.join(out))
+            self.parts.clear()
+
+    def close(self):
+        global _forksubtrees
+        self.executor.shutdown()
+        _forksubtrees = []
+
+class SharedNode(object):
+    '''
+    Base of the frozen subclasses share() switches a node to, so only shared
+    nodes pay for the check on every change and the rest keep the plain
+    object.__setattr__.
+    '''
+    UNSHARED = None
+
+    def __setattr__(self, name, value):
+        raise SISError(f'{self.__class__.__name__} is shared by interning, change the copy from mutable() instead')
+
+    def __delattr__(self, name):
+        raise SISError(f'{self.__class__.__name__} is shared by interning, change the copy from mutable() instead')
+
+def sharedClass(cls):
+    '''
+    frozen subclass of cls for shared nodes, made once per class. It keeps the
+    name of cls and is a global of this module so its instances pickle.
+    '''
+    qualname = '_Shared'+cls.__name__
+    shared = globals().get(qualname)
+    if shared is None:
+        shared = type(cls.__name__, (SharedNode, cls), {'__qualname__': qualname, '__module__': __name__, 'UNSHARED': cls})
+        globals()[qualname] = shared
+    return shared
+
+class Interner(object):
+    '''
+    Flyweights for one parse. Nodes of INTERNED_TYPES with the same values are
+    replaced by the first one seen, which is marked shared so it can not be
+    changed, a pass changing one must set a copy from mutable() on the parent.
+    '''
+    def __init__(self):
+        self.nodes = {}
+        self.numNodes = 0
+
+    def node(self, val):
+        '''the shared node equal to val'''
+        self.numNodes += 1
+        key = (type(val),) + tuple([val.__dict__.get(k) for k in val.allowed_attrs])
+        shared = self.nodes.get(key)
+        if shared is None:
+            shared = val.share()
+            self.nodes[key] = shared
+        return shared
+
 class SISBase(object):
     '''Base class for the extended FDSN StationXML.'''
     ELEMS = () #for each element create a tuple with name, datatype, isrequired, ismultivalue
@@ -214,6 +412,22 @@ class SISBase(object):
         if kw:
             raise SISError(f'Unexpected keys {kw}')
 
+    def share(self):
+        '''mark this node as shared by several parents, it can not be changed after'''
+        self.__class__ = sharedClass(self.__class__)
+        return self
+
+    def isshared(self):
+        return isinstance(self, SharedNode)
+
+    def mutable(self):
+        '''this node, or a changeable copy of it if it is shared'''
+        if not isinstance(self, SharedNode):
+            return self
+        out = copy.copy(self)
+        object.__setattr__(out, '__class__', self.__class__.UNSHARED)
+        return out
+
     def settype(self, type):
         setattr(self, 'xsi:type', type)
 
@@ -232,8 +446,10 @@ class SISBase(object):
                 else:
                     datatype, isreqd, ismulti = self.attribdict[k]
                     val = cast_to_datatype(datatype, v, k)
+                    if _interner is not None and k in INTERNED_TEXT:
+                        val = sys.intern(val)
 
-                setattr(self, k, val)
+                self.__dict__[k] = val
 
         for child in node:
             self.buildchildren(child, node)
@@ -251,6 +467,8 @@ class SISBase(object):
             if isinstance(datatype, str):
                 v = child.text.strip() if child.text else ''
                 val = cast_to_datatype(datatype, v, cname)
+                if _interner is not None and cname in INTERNED_TEXT:
+                    val = sys.intern(val)
 
             #handle the objects
             else:
@@ -260,14 +478,17 @@ class SISBase(object):
                 if ctype and ctype != val.extnstype:
                     print (f'Warning: Type defined in xml {ctype}, expected {val.extnstype}')
                 val.build(child)
+                if _interner is not None and datatype in INTERNED_TYPES:
+                    val = _interner.node(val)
 
             # Note that val might contain a simple value or an object. If this element can have multiple values make a list.
+            # set in __dict__ directly, skips the interning check in __setattr__
             if ismulti:
-                if not hasattr(self, cname):
-                    setattr(self, cname, [])
+                if cname not in self.__dict__:
+                    self.__dict__[cname] = []
                 self.__dict__[cname].append(val)
             else:
-                setattr(self, cname, val)
+                self.__dict__[cname] = val
         else:
             #unknown or unexpected element. raise error.
             raise SISError (f'Unknown element {cname} under node {self.nodename}')
@@ -281,6 +502,52 @@ class SISBase(object):
                 elem = '' if k == 'ValueOf' else f' > {k}'
                 raise SISError(f'Missing required element or attribute or value: "{self.__class__.__name__}{elem}"')
 
+    def checkvalid(self, ignorewarning=False):
+        '''Validate this node. Raises SISError, or prints a warning if ignorewarning.'''
+        try:
+            self.validate()
+        except SISError as e:
+            if not ignorewarning:
+                raise
+            else:
+                print ("Warning:", e)
+
+    def validatetree(self, ignorewarning=False):
+        '''
+        Validate this node and every node below it in a single pass and return
+        the list of SISError found, in document order. Warnings are printed
+        if ignorewarning. Nothing is remembered, the tree may change after.
+        '''
+        errors = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            try:
+                node.validate()
+            except SISError as e:
+                errors.append(e)
+                if ignorewarning:
+                    print ("Warning:", e)
+            children = []
+            for k, datatype, isreqd, ismulti in node.ELEMS:
+                if isinstance(datatype, str):
+                    continue
+                v = node.__dict__.get(k)
+                if v is None:
+                    continue
+                if ismulti:
+                    children.extend([c for c in v if c is not None])
+                else:
+                    children.append(v)
+            stack.extend(reversed(children))
+        return errors
+
+    def checktree(self, ignorewarning=False):
+        '''validatetree, raising the first SISError found unless ignorewarning'''
+        errors = self.validatetree(ignorewarning)
+        if len(errors) > 0 and not ignorewarning:
+            raise errors[0]
+
     # defined as functions so individual classes can override if an element or type needs a special format
     def format_string(self, input_data):
         return html.escape(input_data.strip())
@@ -322,16 +589,12 @@ class SISBase(object):
 
     def exportdict(self, ignorewarning=False):
         '''Return a python dictionary of this object's elements '''
+        #validate the whole subtree once, before any of it is exported
+        self.checktree(ignorewarning)
+        return self._exportdict()
 
+    def _exportdict(self):
         exp ={}
-        #validate the content of this object
-        try:
-            self.validate()
-        except SISError as e:
-            if not ignorewarning:
-                raise
-            else:
-                print ("Warning:", e)
         for contentdict in [self.elemdict, self.attribdict]:
             for k, v in contentdict.items():
                 datatype, isreqd, ismulti = v
@@ -347,9 +610,9 @@ class SISBase(object):
                             # Multivalue possible, stored as a list. Export a list of dictionaries
                             exp[k] = []
                             for o in val:
-                                exp[k].append(o.exportdict(ignorewarning))
+                                exp[k].append(o._exportdict())
                         else:
-                            exp[k] = val.exportdict(ignorewarning)
+                            exp[k] = val._exportdict()
 
         return exp
     def getattrxml (self):
@@ -366,69 +629,158 @@ class SISBase(object):
         axml = ' ' + ' '.join(alist) if alist else ''
         return axml
 
-    def exportxml(self, outfile, nstag='FDSNStationXML', level=0, ignorewarning=False):
-        '''Write the xml for this object and its subelements. '''
-        #validate the content of this object
-        try:
-            self.validate()
-        except SISError as e:
-            if not ignorewarning:
-                raise
-            else:
-                print ("Warning:", e)
-                
-        # Get an xml string with attributes formatted as key='val'
-        axml = self.getattrxml()
+    @classmethod
+    def elemtags(cls):
+        '''
+        ELEMS with the namespace prefixed tag name appended to each tuple,
+        computed once per class instead of for every element written.
+        '''
+        tags = cls.__dict__.get('_ELEMTAGS')
+        if tags is None:
+            tags = []
+            for k, datatype, isreqd, ismulti in cls.ELEMS:
+                # in case the extended type is in a different namespace then cls.EXTNS has been set
+                ns = cls.NS
+                if cls.EXTNS:
+                    sup = cls.SUPERCLASS
+                    #if element is not in the superclass then use cls.EXTNS as the namespace prefix
+                    if k not in [e[0] for e in sup.ELEMS]:
+                        ns = cls.EXTNS
+
+                if ns is None or ns == 'fsx':
+                    nsk = k
+                else:
+                    nsk = f'{ns}:{k}'
+                tags.append((k, datatype, isreqd, ismulti, nsk))
+            tags = tuple(tags)
+            cls._ELEMTAGS = tags
+        return tags
+
+    def exportxml(self, outfile, nstag='FDSNStationXML', level=0, ignorewarning=False, compact=False, backend='python', workers=None, validate=True):
+        '''
+        Write the xml for this object and its subelements. With workers > 1
+        stations are serialized in that many processes, output is the same.
+        The tree is validated first unless validate is False, ie the caller
+        just ran validatetree on it.
+        '''
+        if validate:
+            self.checktree(ignorewarning)
+        if backend == 'lxml':
+            self.exportxml_lxml(outfile, nstag, ignorewarning, compact)
+            return
+        if workers is not None and workers > 1:
+            writer = ParallelXMLWriter(outfile, self, level, workers, ignorewarning, compact)
+            try:
+                self._exportxml(writer, nstag, level, ignorewarning)
+            finally:
+                writer.close()
+        else:
+            self._exportxml(XMLWriter(outfile, compact), nstag, level, ignorewarning)
+
+    def _exportxml(self, writer, nstag, level, ignorewarning):
         if level == 0:
             #write the xxml doctype
-            outfile.write('<?xml version="1.0" encoding="UTF-8"?>' + os.linesep)
+            writer.append('<?xml version="1.0" encoding="UTF-8"?>' + writer.linesep)
+        self.writexml(writer, nstag, level, ignorewarning)
+        writer.flush()
 
-        outfile.write('{0}<{1}{2}>{3}'.format(INDENT*level, nstag, axml, os.linesep))
+    def writexml(self, writer, nstag, level, ignorewarning=False):
+        '''Append the xml for this object and its subelements to an XMLWriter, validated already by exportxml. '''
+        # Get an xml string with attributes formatted as key='val'
+        axml = self.getattrxml()
+        append = writer.append
+        linesep = writer.linesep
+        indent = writer.indent(level)
+        append(f'{indent}<{nstag}{axml}>{linesep}')
         sublevel = level + 1
+        subindent = writer.indent(sublevel)
 
         #use the tuple self.ELEMS because the order is important
-        for k, datatype, isreqd, ismulti in self.ELEMS:
-            # in case the extended type is in a different namespace then self.EXTNS has been set
-            ns = self.NS
-            if self.EXTNS:
-                sup = self.SUPERCLASS
-                #if element is not in the superclass then use self.EXTNS as the namespace prefix
-                if k not in [e[0] for e in sup.ELEMS]:
-                    ns = self.EXTNS
-
-            if ns is None or ns == 'fsx':
-                nsk = k
-            else:
-                nsk = f'{ns}:{k}'
-
-            if getattr(self, k, None) is not None:
+        for k, datatype, isreqd, ismulti, nsk in self.elemtags():
+            v = getattr(self, k, None)
+            if v is not None:
                 #Python has only one builtin type named float that is equivalent to a c style double.
                 if not ismulti:
-                    v = getattr(self, k)
                     if isinstance(datatype, str):
-                        outfile.write(self.enclosetag(datatype, sublevel, nsk, v))
+                        append(f'{subindent}<{nsk}>{self.formatval(datatype, v)}</{nsk}>{linesep}')
+                    elif nsk in writer.DEFER_TAGS:
+                        writer.defer(v, nsk, sublevel, ignorewarning)
                     else:
-                        v.exportxml(outfile, nsk, sublevel, ignorewarning)
+                        v.writexml(writer, nsk, sublevel, ignorewarning)
                 else:
-                    vlist = getattr(self, k)
-                    for v in vlist:
-                        if v is None:
+                    for item in v:
+                        if item is None:
                              print("Warning: found None in list for {0}, skipping".format(k))
                         elif isinstance(datatype, str):
-                            outfile.write(self.enclosetag(datatype, sublevel, nsk, v))
+                            append(f'{subindent}<{nsk}>{self.formatval(datatype, item)}</{nsk}>{linesep}')
+                        elif nsk in writer.DEFER_TAGS:
+                            writer.defer(item, nsk, sublevel, ignorewarning)
                         else:
-                            v.exportxml(outfile, nsk, sublevel, ignorewarning)
-        outfile.write('{0}</{1}>{2}'.format(INDENT*level, nstag, os.linesep))
+                            item.writexml(writer, nsk, sublevel, ignorewarning)
+        append(f'{indent}</{nstag}>{linesep}')
+        if nstag in writer.FLUSH_TAGS:
+            writer.flush()
+
+    def exportxml_lxml(self, outfile, nstag='FDSNStationXML', ignorewarning=False, compact=False):
+        '''
+        Write the xml for this object and its subelements by building lxml
+        elements and letting libxml2 serialize them. Element prefixes follow
+        the same NS/EXTNS/SUPERCLASS rules as exportxml and xsi:type values are
+        written as is. Escaping of quotes in text and empty elements may differ
+        from exportxml, the xml content is the same.
+        '''
+        nsmap = {}
+        for k, datatype, isreqd, ismulti in self.ATTRIBS:
+            uri = getattr(self, k, None)
+            if k == 'xmlns' and uri is not None:
+                nsmap[None] = uri
+            elif k.startswith('xmlns:') and uri is not None:
+                nsmap[k[len('xmlns:'):]] = uri
+        if len(nsmap) == 0:
+            # exporting a subtree, declare the usual namespaces on it
+            nsmap = {None: nsd['fsx'][0], 'xsi': nsd['xsi'][0], 'sis': nsd['sis'][0]}
+        root = self.toelement(nstag, None, ignorewarning, nsmap)
+        outfile.write('<?xml version="1.0" encoding="UTF-8"?>' + os.linesep)
+        outfile.write(etree_.tostring(root, encoding='unicode', pretty_print=not compact))
+
+    def lxmlval(self, datatype, v):
+        ''' Like formatval, but text is not escaped as lxml does that when serializing '''
+        if datatype == 'text':
+            return v.strip()
+        return self.formatval(datatype, v)
+
+    def toelement(self, nstag, parent=None, ignorewarning=False, nsmap=None):
+        '''Return a lxml element for this object and its subelements, appended to parent if given. '''
+        if parent is None:
+            el = etree_.Element(get_lxml_name(nstag), nsmap=nsmap)
+        else:
+            el = etree_.SubElement(parent, get_lxml_name(nstag))
+        for k, datatype, isreqd, ismulti in self.ATTRIBS:
+            if k == 'xmlns' or k.startswith('xmlns:'):
+                # namespace declarations are in nsmap
+                continue
+            v = getattr(self, k, None)
+            if v is not None:
+                el.set(get_lxml_name(k, None), self.lxmlval(datatype, v))
+
+        for k, datatype, isreqd, ismulti, nsk in self.elemtags():
+            v = getattr(self, k, None)
+            if v is None:
+                continue
+            if not ismulti:
+                v = [v]
+            for item in v:
+                if item is None:
+                     print("Warning: found None in list for {0}, skipping".format(k))
+                elif isinstance(datatype, str):
+                    etree_.SubElement(el, get_lxml_name(nsk)).text = self.lxmlval(datatype, item)
+                else:
+                    item.toelement(nsk, el, ignorewarning)
+        return el
 
     def exportobj(self, outfile, level=0, ignorewarning=False):
         '''Write out a python object representation. '''
-        try:
-            self.validate()
-        except SISError as e:
-            if not ignorewarning:
-                raise
-            else:
-                print ("Warning:", e)
+        self.checkvalid(ignorewarning)
  
         if level == 0:
             #For the outer most class add its name
@@ -461,6 +813,40 @@ class SISBase(object):
             #close the outer most class
             outfile.write('){0}'.format(os.linesep))
 
+class XMLFragment(object):
+    '''
+    Already serialized xml of one element, written out as is in place of an
+    object, ie to reuse the output of an earlier run. The text must have
+    been written at the same level and compact setting it is written with.
+    '''
+    ELEMS = ()
+
+    def __init__(self, text):
+        self.text = text
+
+    @classmethod
+    def elemtags(cls):
+        return ()
+
+    def validate(self):
+        pass
+
+    def checkvalid(self, ignorewarning=False):
+        pass
+
+    def validatetree(self, ignorewarning=False):
+        return []
+
+    def writexml(self, writer, nstag, level, ignorewarning=False):
+        writer.append(self.text)
+
+    def toelement(self, nstag, parent=None, ignorewarning=False, nsmap=None):
+        wrapper = '<w xmlns="{0}" xmlns:xsi="{1}" xmlns:sis="{2}">{3}</w>'.format(nsd['fsx'][0], nsd['xsi'][0], nsd['sis'][0], self.text)
+        el = etree_.fromstring(wrapper, etree_.XMLParser(remove_blank_text=True))[0]
+        if parent is not None:
+            parent.append(el)
+        return el
+
 class SISSimpleType(SISBase):
     '''
     Use this class for simple types that have no sub-elements, but have attributes.
@@ -473,32 +859,45 @@ class SISSimpleType(SISBase):
         self.ns, self.nodename = get_ns_nodename(node)
         ndatatype = self.ELEMS[0][1]
         v = node.text.strip() if node.text else ''
-        self.ValueOf = cast_to_datatype(ndatatype, v, self.nodename)
+        self.__dict__['ValueOf'] = cast_to_datatype(ndatatype, v, self.nodename)
 
         for k, v in node.attrib.items():
             if k in self.attribdict:
                 datatype, isreqd, ismulti = self.attribdict[k]
                 val = cast_to_datatype(datatype, v, k)
-                setattr(self, k, val)
+                if _interner is not None and k in INTERNED_TEXT:
+                    val = sys.intern(val)
+                self.__dict__[k] = val
             else:
                 raise SISError (f'Unexpected attribute {k}={v} in {self.nodename}')
 
     def buildchildren(self, child, node):
         pass
 
-    def exportxml(self, outfile, nstag, level, ignorewarning=False):
+    def exportxml(self, outfile, nstag, level, ignorewarning=False, compact=False):
         '''Export the value in ValueOf as the content of the passed in tag. '''
-        try:
-            self.validate()
-        except SISError as e:
-            if not ignorewarning:
-                raise
-            else:
-                print ("Warning:", e)
+        self.checkvalid(ignorewarning)
+        writer = XMLWriter(outfile, compact)
+        self.writexml(writer, nstag, level, ignorewarning)
+        writer.flush()
+
+    def writexml(self, writer, nstag, level, ignorewarning=False):
         axml = self.getattrxml()
         ndatatype = self.ELEMS[0][1]
+        val = self.formatval(ndatatype, self.ValueOf)
+        writer.append(f'{writer.indent(level)}<{nstag}{axml}>{val}</{nstag}>{writer.linesep}')
 
-        outfile.write(self.enclosetag(ndatatype, level, nstag, self.ValueOf, axml))
+    def toelement(self, nstag, parent=None, ignorewarning=False, nsmap=None):
+        if parent is None:
+            el = etree_.Element(get_lxml_name(nstag), nsmap=nsmap)
+        else:
+            el = etree_.SubElement(parent, get_lxml_name(nstag))
+        for k, datatype, isreqd, ismulti in self.ATTRIBS:
+            v = getattr(self, k, None)
+            if v is not None:
+                el.set(get_lxml_name(k, None), self.lxmlval(datatype, v))
+        el.text = self.lxmlval(self.ELEMS[0][1], self.ValueOf)
+        return el
 
 
 class UnitsType(SISBase):
@@ -508,6 +907,9 @@ class UnitsType(SISBase):
 
     NS = 'fsx'
 
+# node types shared by parse(..., intern=True)
+INTERNED_TYPES = (UnitsType,)
+
 class FloatNoUnitType(SISSimpleType):
     '''
     This is a SimpleType node.
@@ -1391,11 +1793,15 @@ def parseFdsnStaXml(inFileName):
 def parseExtStaXml(inFileName):
     return parse(inFileName, isExtStaXml = True)
 
-def parse(inFileName, isExtStaXml = True):
+def parse(inFileName, isExtStaXml = True, intern = False):
     ''' Inputs: xmlfile to be parsed and indicate whether it is ExtStaXML or FDSNStatioNXML
-    Returns a python object with data from the xmlfile'''
+    Returns a python object with data from the xmlfile
+    If intern, equal UnitsType nodes are one shared instance, see Interner'''
     global docnsprefixmap
-    doc = parsexml_(inFileName)
+    global _interner
+    # gzip, bzip2 or xz input is decompressed while parsing
+    with compressedFile.xmlSource(inFileName) as source:
+        doc = parsexml_(source)
     root = doc.getroot()
     docnsmap = root.nsmap
     for k, uri in docnsmap.items():
@@ -1410,7 +1816,12 @@ def parse(inFileName, isExtStaXml = True):
     else:
         obj = RootType()
 
-    obj.build(root)
+    if intern:
+        _interner = Interner()
+    try:
+        obj.build(root)
+    finally:
+        _interner = None
     obj.validate()
     return obj
 
@@ -1424,6 +1835,10 @@ def main():
                         help='Use "sis" for ExtStationXML and "fdsn" for FDSNStationXML')
 
     parser.add_argument('--ignorewarning', action='store_true', default=False)
+    parser.add_argument('--compact', action='store_true', default=False,
+                        help='Export xml without indentation or line breaks')
+    parser.add_argument('--serializer', choices=EXPORT_BACKENDS, default='python',
+                        help='Export with python string formatting or with lxml')
 
     options = parser.parse_args()
     if options.xmltype == 'sis' :
@@ -1434,7 +1849,7 @@ def main():
     obj = parse(options.xmlfile, isExt)
 
     # Export xml
-    obj.exportxml(sys.stdout, ignorewarning=options.ignorewarning)
+    obj.exportxml(sys.stdout, ignorewarning=options.ignorewarning, compact=options.compact, backend=options.serializer)
 
     ## Export the python object representation
     #obj.exportobj(sys.stdout, ignorewarning=options.ignorewarning)
@@ -2,14 +2,14 @@
 '''
 add soh response in fdsn stationxml file
 '''
-import checkNRL as checkNRL
+import compressedFile as compressedFile
+import inventoryPasses as inventoryPasses
 import sisxmlparser2_2_py3 as sisxmlparser
 
 import argparse
 import datetime
 import os
 import re
-import sys
 
 VERBOSE=False
 
@@ -224,31 +224,41 @@ def makeDecimationStage(c, chanCode, changes):
         changes[chanCode] = []
     changes[chanCode].append("unity Decimation Stage")
 
+class SohResponsePass(inventoryPasses.InventoryPass):
+    name = 'sohResponse'
+
+    def __init__(self, inunitsDict, changes=None):
+        inventoryPasses.InventoryPass.__init__(self, changes)
+        self.inunitsDict = inunitsDict
+
+    def visitChannel(self, n, s, c, chanCode):
+        if VERBOSE: print("soh response chanCode %s "%(chanCode, ))
+        makeUnityResponse(c, chanCode, self.changes, self.inunitsDict)
+
+class StageGainPass(inventoryPasses.InventoryPass):
+    name = 'stageGain'
+
+    def visitChannel(self, n, s, c, chanCode):
+        if VERBOSE: print("stageGain response chanCode %s "%(chanCode, ))
+        makeUnityStageGain(c, chanCode, self.changes)
+
+class DecimationStagePass(inventoryPasses.InventoryPass):
+    name = 'decimationStage'
+
+    def visitChannel(self, n, s, c, chanCode):
+        if VERBOSE: print("decimation stage chanCode %s "%(chanCode, ))
+        makeDecimationStage(c, chanCode, self.changes)
+
 def addSohResponse(staxml, inunitsDict, changes):
-    for n in staxml.Network:
-      for s in n.Station:
-        for c in s.Channel:
-          chanCode = checkNRL.getChanCodeId(n, s, c)
-          if VERBOSE: print("soh response chanCode %s "%(chanCode, ))
-          makeUnityResponse(c, chanCode, changes, inunitsDict)
+    inventoryPasses.runPasses(staxml, [SohResponsePass(inunitsDict, changes)])
     return changes
 
 def addStageGain(staxml, changes):
-    for n in staxml.Network:
-      for s in n.Station:
-        for c in s.Channel:
-          chanCode = checkNRL.getChanCodeId(n, s, c)
-          if VERBOSE: print("stageGain response chanCode %s "%(chanCode, ))
-          makeUnityStageGain(c, chanCode, changes)
+    inventoryPasses.runPasses(staxml, [StageGainPass(changes)])
     return changes
 
 def addDecimationStage(staxml, changes):
-    for n in staxml.Network:
-      for s in n.Station:
-        for c in s.Channel:
-          chanCode = checkNRL.getChanCodeId(n, s, c)
-          if VERBOSE: print("stageGain response chanCode %s "%(chanCode, ))
-          makeDecimationStage(c, chanCode, changes)
+    inventoryPasses.runPasses(staxml, [DecimationStagePass(changes)])
     return changes
 
 def parseUnitsFile(unitsFile):
@@ -266,7 +276,7 @@ def initArgParser():
   parser.add_argument('-u', '--units', type=argparse.FileType('r'), help="channel input units file, lines like 'VMU,VMV,VMW volt'")
   parser.add_argument('-g', '--gainstage', action="store_true", help="add unity stage gain to polezero stage without a gain")
   parser.add_argument('-d', '--decimationstage', action="store_true", help="add unity decimation stage gain to end of stages for response without a decimation")
-  parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'), default=sys.stdout)
+  compressedFile.addOutputArgs(parser)
   parser.add_argument('-v', '--verbose', action='store_true', help="verbose output")
   return parser.parse_args()
 
@@ -292,17 +302,23 @@ def main():
 
     changes = { 'numChanges': 0 }
     staxml = sisxmlparser.parse(parseArgs.stationxml)
-    addSohResponse(staxml, inunits, changes)
+    # all in one walk, each channel gets its soh response before the others
+    passes = [ SohResponsePass(inunits, changes) ]
     if parseArgs.gainstage:
-        addStageGain(staxml, changes)
+        passes.append(StageGainPass(changes))
     if parseArgs.decimationstage:
-        addDecimationStage(staxml, changes)
+        passes.append(DecimationStagePass(changes))
+    inventoryPasses.runPasses(staxml, passes)
     print("ok (%d changes)"%(changes['numChanges'],))
     if VERBOSE:
         for k, v in changes.items():
             if k != 'numChanges':
                 print("    %s => %s"%(k, v))
-    staxml.exportxml(parseArgs.outfile, 'FDSNStationXML', 'fsx', 0)
+    outfile = compressedFile.openOutput(parseArgs.outfile, parseArgs.compresslevel)
+    try:
+        staxml.exportxml(outfile, 'FDSNStationXML', 'fsx', 0)
+    finally:
+        compressedFile.closeOutput(outfile)
 
 if __name__ == '__main__':
     main()
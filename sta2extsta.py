@@ -3,12 +3,21 @@
 use the classes in sisxmlparser2_2 to generate an ExtStationXML file from regular stationxml.
 '''
 import checkNRL as checkNRL
+import compressedFile as compressedFile
+import freqResponse as freqResponse
+import incrementalState as incrementalState
+import instrumentation as instrumentation
+import inventoryPasses as inventoryPasses
+import pipelineProfile as pipelineProfile
+import shardOutput as shardOutput
 import sisxmlparser3_0 as sisxmlparser
 import uniqResponses as uniqResponses
 import cleanUnitNames as cleanUnitNames
-from xerces_validate import xerces_validate, SCHEMA_FILE
+from xerces_validate import xerces_validate, xerces_validate_async, SCHEMA_FILE
 
 import argparse
+import collections
+import copy
 import datetime
 import dateutil.parser
 import os
@@ -25,6 +34,9 @@ Usage: python <Parser>.py <in_xml_file>
 
 NRL_PREFIX = "http://ds.iris.edu/NRL"
 
+# unique responses kept in the NRL match cache of a ConversionState
+DEFAULT_MAX_CACHE = 10000
+
 
 def usage():
     initArgParser()
@@ -34,18 +46,35 @@ def usage():
 def getStartDate(channel):
   return channel.startDate
 
-def initArgParser():
-  parser = argparse.ArgumentParser(description='Convert StationXML to ExtendedStationXML.')
-  parser.add_argument('-s', '--stationxml', required=True, help="input FDSN StationXML file, often retrieved from http://service.iris.edu/fdsnws/station/1/")
-  parser.add_argument('--nrl', default='nrl', help="replace matching responses with links to NRL")
+def addConversionArgs(parser):
+  '''arguments controlling the conversion, shared with sta2extstaBatch'''
+  parser.add_argument('--nrl', default='nrl', help="replace matching responses with links to NRL, either a directory or a zip archive of the NRL")
+  parser.add_argument('--matcher', choices=['pz', 'freq'], default='pz', help="match sensors to NRL by comparing poles and zeros, or by frequency response (needs numpy)")
+  parser.add_argument('--freqtol', type=float, default=freqResponse.DEFAULT_TOL, help="sensor frequency response must differ by less than this relative amount for --matcher freq")
+  parser.add_argument('--maxcache', type=int, default=DEFAULT_MAX_CACHE, help="max unique responses whose NRL match is kept for later files, least recently used are dropped first, 0 for no limit")
   parser.add_argument('--namespace', default='Testing', help="SIS namespace to use for named responses, see http://anss-sis.scsn.org/sis/master/namespace/")
   parser.add_argument('--operator', default='Testing', help="SIS operator to use for stations, see http://anss-sis.scsn.org/sis/master/org/")
   parser.add_argument('--delcurrent', action="store_true", help="remove channels that are currently operating. Only do this if you want to go back and manually via the web interface add hardware for current epochs.")
   parser.add_argument('--onlychan', default=False, help="only channels with codes matching regular expression, ie BH. for all broadband. Can also match locid like '00\.HH.' Empty loc ids for filtering as '--'")
   parser.add_argument('--onlysta', default=False, help="only stations with codes matching regular expression, ie ABC. ")
-  parser.add_argument('-o', '--outfile', nargs='?', type=argparse.FileType('w'), default=sys.stdout)
   parser.add_argument('-v', '--verbose', action='store_true', help="verbose output")
   parser.add_argument('--ignorewarning', action='store_true', default=False)
+  parser.add_argument('--compact', action='store_true', help="write output xml without indentation or line breaks")
+  parser.add_argument('--serializer', choices=sisxmlparser.EXPORT_BACKENDS, default='python', help="write output xml with python string formatting or with lxml")
+  parser.add_argument('--intern', action='store_true', help="share one object for each distinct unit and intern repeated strings when parsing, uses less memory for big inventories")
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Convert StationXML to ExtendedStationXML.')
+  parser.add_argument('-s', '--stationxml', required=True, help="input FDSN StationXML file, often retrieved from http://service.iris.edu/fdsnws/station/1/")
+  addConversionArgs(parser)
+  compressedFile.addOutputArgs(parser)
+  parser.add_argument('--exportworkers', type=int, default=1, help="serialize stations in this many processes when writing output, output is the same")
+  parser.add_argument('--shard-by', dest='shardby', choices=shardOutput.SHARD_BY, help="write one ExtStationXML per network or station into the directory given by -o, with a manifest.json, unchanged shards are not rewritten")
+  parser.add_argument('--shardsuffix', default='.xml', help="file name suffix for shards, ie .xml.gz to compress")
+  parser.add_argument('--state', help="incremental state file, channel epochs unchanged since the run that wrote it are not converted again, the file is updated after output is written")
+  parser.add_argument('--profile', help="write a json report of time, cpu and peak memory per conversion stage, plus counters, to this file. Tracing memory slows the conversion down.")
+  parser.add_argument('--instrument', action='store_true', help="count calls, time and rejection reasons of the NRL and response comparisons and print them at the end, same as setting %s=1"%(instrumentation.ENV_VAR,))
+  parser.add_argument('--overlapvalidate', action='store_true', help="validate input in the background while parsing, conversion stops before any output if invalid")
   return parser.parse_args()
 
 def convertToResponseDict(fdsnResponse):
@@ -145,7 +174,19 @@ def isOnlyGainStage(namedResponse, sNum):
     else:
         return True
 
-def fixResponseNRL(n, s, c, oldResponse, uniqResponse, namespace):
+def nrlUrl(nrl, path):
+    '''RESPFile url of the RESP file at path in the nrl source'''
+    return "%s/%s"%(NRL_PREFIX, nrl.relPath(path))
+
+def numEquivClasses(nrlMatches):
+    '''number of distinct NRL equivalence classes, last item of each match'''
+    return len(set([m[-1] for m in nrlMatches]))
+
+def fixResponseNRL(n, s, c, oldResponse, chanIndex, namespace, nrl):
+    '''
+    chanIndex is the dict of chanCodeId to unique response record from
+    checkNRL.checkRespListInNRL(..., withIndex=True)
+    '''
 
     chanCodeId = checkNRL.getChanCodeId(n, s, c)
 
@@ -184,167 +225,174 @@ def fixResponseNRL(n, s, c, oldResponse, uniqResponse, namespace):
     atodSubResponse.sequenceNumber = 3
     loggerSubResponse = sisxmlparser.SubResponseType()
     loggerSubResponse.sequenceNumber = 4
-    for prototypeChan, namedResponse, chanCodeList, sss, lll in uniqResponse:
-        for xcode in chanCodeList:
-            if xcode == chanCodeId:
-                # sensor ######
-                # but SOH channels sometimes have only 1 stage, so no logger
-                if len(sss) == 0:
-                    if VERBOSE: print("        sensor not NRL, use named resp: %s"%(xcode,))
-                    # not nrl, so use named response
-
-                    if isSimpleSOHSingleStage(namedResponse):
-                        # but SOH channels sometimes have only 1 stage, so no sensor, only atod
-                        sensorSubResponse = None
-                        preampSubResponse.sequenceNumber -= 1
-                        atodSubResponse.sequenceNumber -= 1
-                        loggerSubResponse.sequenceNumber -= 1
-
-                    elif not hasattr(oldResponse.Stage[0], 'Polynomial') and hasattr(oldResponse.Stage[0], 'Coefficients'):
-                        # ResponseDictLink cannot do Coefficients, so use ResponseDetail
-                        if VERBOSE: print("         sensor has no PolesZeros in stage, use Coefficients: {}".format(xcode))
-                        if not hasattr(oldResponse.Stage[0], 'StageGain'):
-                            raise Exception("         sensor has no StageGain in stage 0: {}".format(xcode))
-                        if hasattr(oldResponse.Stage[0], 'Decimation'):
-                            if oldResponse.Stage[0].Decimation.Factor == 1:
-                                print("       WARNING: {} stage {} has Decimation with Coefficients with factor 1, skipping ".format(chanCodeId, 0))
-                            else:
-                                raise Exception("         sensor has Decimation in stage 0: {}".format(xcode))
-                        sensorSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
-                        sensorSubResponse.ResponseDetail.Coefficients = toSISCoefficients(oldResponse.Stage[0].Coefficients, namespace)
-                        sensorSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
-                        sensorSubResponse.ResponseDetail.Gain.Value = oldResponse.Stage[0].StageGain.Value
-                        sensorSubResponse.ResponseDetail.Gain.Frequency = oldResponse.Stage[0].StageGain.Frequency
-                        sensorSubResponse.ResponseDetail.Gain.InputUnits = oldResponse.Stage[0].Coefficients.InputUnits
-                        sensorSubResponse.ResponseDetail.Gain.OutputUnits = oldResponse.Stage[0].Coefficients.OutputUnits
+    record = chanIndex.get(chanCodeId)
+    if record is not None:
+        prototypeChan, namedResponse, chanCodeList, sss, lll = record
+        xcode = chanCodeId
+        # sensor ######
+        # but SOH channels sometimes have only 1 stage, so no logger
+        if len(sss) == 0:
+            if VERBOSE: print("        sensor not NRL, use named resp: %s"%(xcode,))
+            # not nrl, so use named response
+
+            if isSimpleSOHSingleStage(namedResponse):
+                # but SOH channels sometimes have only 1 stage, so no sensor, only atod
+                sensorSubResponse = None
+                preampSubResponse.sequenceNumber -= 1
+                atodSubResponse.sequenceNumber -= 1
+                loggerSubResponse.sequenceNumber -= 1
+
+            elif not hasattr(oldResponse.Stage[0], 'Polynomial') and hasattr(oldResponse.Stage[0], 'Coefficients'):
+                # ResponseDictLink cannot do Coefficients, so use ResponseDetail
+                if VERBOSE: print("         sensor has no PolesZeros in stage, use Coefficients: {}".format(xcode))
+                if not hasattr(oldResponse.Stage[0], 'StageGain'):
+                    raise Exception("         sensor has no StageGain in stage 0: {}".format(xcode))
+                if hasattr(oldResponse.Stage[0], 'Decimation'):
+                    if oldResponse.Stage[0].Decimation.Factor == 1:
+                        print("       WARNING: {} stage {} has Decimation with Coefficients with factor 1, skipping ".format(chanCodeId, 0))
                     else:
-                        sensorSubResponse.ResponseDictLink = sisxmlparser.ResponseDictLinkType2()
-                        sensorSubResponse.ResponseDictLink.Name = "S_"+prototypeChan
-                        sensorSubResponse.ResponseDictLink.SISNamespace = namespace
-
-                        if hasattr(oldResponse.Stage[0], 'Polynomial'):
-                            # polynomial doesn't use Gain
-                            sensorSubResponse.ResponseDictLink.Type = 'Polynomial'
-                        else:
-                            if not hasattr(oldResponse.Stage[0], 'StageGain'):
-                                raise Exception("         sensor has no StageGain in stage 0: {}".format(xcode))
-                            sensorSubResponse.ResponseDictLink.Gain = sisxmlparser.SISGainType()
-                            sensorSubResponse.ResponseDictLink.Gain.Value = oldResponse.Stage[0].StageGain.Value
-                            sensorSubResponse.ResponseDictLink.Gain.Frequency = oldResponse.Stage[0].StageGain.Frequency
-                            if hasattr(oldResponse.Stage[0], 'PolesZeros'):
-                                sensorSubResponse.ResponseDictLink.Type = 'PolesZeros'
-                                sensorSubResponse.ResponseDictLink.Gain.InputUnits = oldResponse.Stage[0].PolesZeros.InputUnits
-                                sensorSubResponse.ResponseDictLink.Gain.OutputUnits = oldResponse.Stage[0].PolesZeros.OutputUnits
-                            else:
-                                if VERBOSE: print("         WARNING: sensor has no PolesZeros, Coefficients or Polynomial in stage: {}".format(xcode))
-
+                        raise Exception("         sensor has Decimation in stage 0: {}".format(xcode))
+                sensorSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
+                sensorSubResponse.ResponseDetail.Coefficients = toSISCoefficients(oldResponse.Stage[0].Coefficients, namespace)
+                sensorSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
+                sensorSubResponse.ResponseDetail.Gain.Value = oldResponse.Stage[0].StageGain.Value
+                sensorSubResponse.ResponseDetail.Gain.Frequency = oldResponse.Stage[0].StageGain.Frequency
+                sensorSubResponse.ResponseDetail.Gain.InputUnits = oldResponse.Stage[0].Coefficients.InputUnits
+                sensorSubResponse.ResponseDetail.Gain.OutputUnits = oldResponse.Stage[0].Coefficients.OutputUnits
+            else:
+                sensorSubResponse.ResponseDictLink = sisxmlparser.ResponseDictLinkType2()
+                sensorSubResponse.ResponseDictLink.Name = "S_"+prototypeChan
+                sensorSubResponse.ResponseDictLink.SISNamespace = namespace
 
+                if hasattr(oldResponse.Stage[0], 'Polynomial'):
+                    # polynomial doesn't use Gain
+                    sensorSubResponse.ResponseDictLink.Type = 'Polynomial'
                 else:
-                    if len(sss) > 1:
-                        print("       WARNING: %s has more than one matching sensor response in NRL, using first"%(chanCodeId,))
-                    for temps in sss:
-                        print("         %s"%(temps[0],))
-                    if VERBOSE: print("        sensor in NRL: %s"%(xcode,))
-                    sensorSubResponse.RESPFile = sisxmlparser.RESPFileType()
-                    sensorSubResponse.RESPFile.ValueOf = sss[0][0].replace("nrl", NRL_PREFIX)
-                    # stage To/From not required for NRL responses, use SIS rules
-                    #sensorSubResponse.RESPFile.stageFrom = 1
-                    #sensorSubResponse.RESPFile.stageTo = 1
-                # datalogger #######
-                if len(lll) == 0:
-                    if VERBOSE: print("        logger not NRL, use named resp: %s"%(xcode,))
-                    atodStageInOrig = 1
-                    loggerStageInOrig = 2
-                    # not nrl, so use named response
-                    if isSimpleSOHSingleStage(namedResponse):
-                        # simple 1 stage, coeff count->count stage
-                        preampSubResponse = None
-                        atodSubResponse.sequenceNumber = 1
-                        atodStageInOrig = 1
-                        loggerSubResponse = None
-                        loggerStageInOrig = 999
-                        atodSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
-                        atodSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
-                        atodOld = namedResponse.Stage[atodStageInOrig-1]
-                        atodSubResponse.ResponseDetail.Gain.Value = atodOld.StageGain.Value
-                        atodSubResponse.ResponseDetail.Gain.Frequency = atodOld.StageGain.Frequency
-                        atodSubResponse.ResponseDetail.Gain.InputUnits = atodOld.Coefficients.InputUnits
-                        atodSubResponse.ResponseDetail.Gain.OutputUnits = atodOld.Coefficients.OutputUnits
+                    if not hasattr(oldResponse.Stage[0], 'StageGain'):
+                        raise Exception("         sensor has no StageGain in stage 0: {}".format(xcode))
+                    sensorSubResponse.ResponseDictLink.Gain = sisxmlparser.SISGainType()
+                    sensorSubResponse.ResponseDictLink.Gain.Value = oldResponse.Stage[0].StageGain.Value
+                    sensorSubResponse.ResponseDictLink.Gain.Frequency = oldResponse.Stage[0].StageGain.Frequency
+                    if hasattr(oldResponse.Stage[0], 'PolesZeros'):
+                        sensorSubResponse.ResponseDictLink.Type = 'PolesZeros'
+                        sensorSubResponse.ResponseDictLink.Gain.InputUnits = oldResponse.Stage[0].PolesZeros.InputUnits
+                        sensorSubResponse.ResponseDictLink.Gain.OutputUnits = oldResponse.Stage[0].PolesZeros.OutputUnits
                     else:
-                        preampStage = findPreampStage(namedResponse)
-                        atodStageInOrig = findAtoDStage(namedResponse)
-                        loggerStageInOrig = atodStageInOrig+1
-                        if preampStage > 0:
-                            preampSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
-                            preampSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
-                            preampSubResponse.ResponseDetail.Gain.Value = namedResponse.Stage[preampStage-1].StageGain.Value
-                            preampSubResponse.ResponseDetail.Gain.Frequency = namedResponse.Stage[preampStage-1].StageGain.Frequency
-                            preampSubResponse.ResponseDetail.Gain.InputUnits = sisxmlparser.UnitsType
-                            preampSubResponse.ResponseDetail.Gain.InputUnits.Name = "None Specified"
-                            preampSubResponse.ResponseDetail.Gain.OutputUnits = sisxmlparser.UnitsType
-                            preampSubResponse.ResponseDetail.Gain.OutputUnits.Name = "None Specified"
-                            if hasattr(namedResponse.Stage[preampStage-1], 'PolesZeros'):
-                                preampSubResponse.ResponseDetail.PolesZeros = namedResponse.Stage[preampStage-1].PolesZeros
-                            else:
-                                # try to find input units for StageGain-only stage from prev and next stages
-                                # and store in sis style Gain
-                                if hasattr(namedResponse.Stage[preampStage-2], 'PolesZeros'):
-                                    preampSubResponse.ResponseDetail.Gain.InputUnits = namedResponse.Stage[preampStage-2].PolesZeros.OutputUnits
-                                else:
-                                    raise Exception("can't get prior units for gain only stage: {}  prev: {}".format(s.exportdict(ignorewarning=True), namedResponse.Stage[preampStage-2].exportdict(ignorewarning=True)))
-                                if hasattr(namedResponse.Stage[preampStage], 'Coefficients'):
-                                    preampSubResponse.ResponseDetail.Gain.OutputUnits = namedResponse.Stage[preampStage].Coefficients.InputUnits
-                                elif hasattr(namedResponse.Stage[preampStage], "FIR"):
-                                    preampSubResponse.ResponseDetail.Gain.OutputUnits = namedResponse.Stage[logpreampStagegerStartStage].FIR.InputUnits
-                                else:
-                                    raise Exception("can't get next units for gain only stage: {}  next: {}".format(s.exportdict(ignorewarning=True), namedResponse.Stage[preampStage].exportdict(ignorewarning=True)))
+                        if VERBOSE: print("         WARNING: sensor has no PolesZeros, Coefficients or Polynomial in stage: {}".format(xcode))
 
+
+        else:
+            if numEquivClasses(sss) > 1:
+                print("       WARNING: %s has more than one matching sensor response in NRL, using first"%(chanCodeId,))
+                for temps in sss:
+                    print("         %s"%(temps[0],))
+            else:
+                print("         %s"%(sss[0][0],))
+                if VERBOSE and len(sss) > 1:
+                    print("        %s matches %d equivalent sensor responses in NRL, using first"%(chanCodeId, len(sss)))
+            if VERBOSE: print("        sensor in NRL: %s"%(xcode,))
+            sensorSubResponse.RESPFile = sisxmlparser.RESPFileType()
+            sensorSubResponse.RESPFile.ValueOf = nrlUrl(nrl, sss[0][0])
+            # stage To/From not required for NRL responses, use SIS rules
+            #sensorSubResponse.RESPFile.stageFrom = 1
+            #sensorSubResponse.RESPFile.stageTo = 1
+        # datalogger #######
+        if len(lll) == 0:
+            if VERBOSE: print("        logger not NRL, use named resp: %s"%(xcode,))
+            atodStageInOrig = 1
+            loggerStageInOrig = 2
+            # not nrl, so use named response
+            if isSimpleSOHSingleStage(namedResponse):
+                # simple 1 stage, coeff count->count stage
+                preampSubResponse = None
+                atodSubResponse.sequenceNumber = 1
+                atodStageInOrig = 1
+                loggerSubResponse = None
+                loggerStageInOrig = 999
+                atodSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
+                atodSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
+                atodOld = namedResponse.Stage[atodStageInOrig-1]
+                atodSubResponse.ResponseDetail.Gain.Value = atodOld.StageGain.Value
+                atodSubResponse.ResponseDetail.Gain.Frequency = atodOld.StageGain.Frequency
+                atodSubResponse.ResponseDetail.Gain.InputUnits = atodOld.Coefficients.InputUnits
+                atodSubResponse.ResponseDetail.Gain.OutputUnits = atodOld.Coefficients.OutputUnits
+            else:
+                preampStage = findPreampStage(namedResponse)
+                atodStageInOrig = findAtoDStage(namedResponse)
+                loggerStageInOrig = atodStageInOrig+1
+                if preampStage > 0:
+                    preampSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
+                    preampSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
+                    preampSubResponse.ResponseDetail.Gain.Value = namedResponse.Stage[preampStage-1].StageGain.Value
+                    preampSubResponse.ResponseDetail.Gain.Frequency = namedResponse.Stage[preampStage-1].StageGain.Frequency
+                    preampSubResponse.ResponseDetail.Gain.InputUnits = sisxmlparser.UnitsType
+                    preampSubResponse.ResponseDetail.Gain.InputUnits.Name = "None Specified"
+                    preampSubResponse.ResponseDetail.Gain.OutputUnits = sisxmlparser.UnitsType
+                    preampSubResponse.ResponseDetail.Gain.OutputUnits.Name = "None Specified"
+                    if hasattr(namedResponse.Stage[preampStage-1], 'PolesZeros'):
+                        preampSubResponse.ResponseDetail.PolesZeros = namedResponse.Stage[preampStage-1].PolesZeros
+                    else:
+                        # try to find input units for StageGain-only stage from prev and next stages
+                        # and store in sis style Gain
+                        if hasattr(namedResponse.Stage[preampStage-2], 'PolesZeros'):
+                            preampSubResponse.ResponseDetail.Gain.InputUnits = namedResponse.Stage[preampStage-2].PolesZeros.OutputUnits
                         else:
-                            preampSubResponse = None
-                            atodSubResponse.sequenceNumber -= 1
-                            loggerSubResponse.sequenceNumber = atodSubResponse.sequenceNumber +1
-
-                        if atodStageInOrig < 0:
-                            # print reason for each stage failing
-                            outReason = ""
-                            for stage in namedResponse.Stage:
-                                isAtoD, isAtoDReason = isAtoDStage(namedResponse, stage.number)
-                                outReason += f"isAtoDStage {stage.number}: {isAtoD}: {isAtoDReason}/n"
-                            raise Exception('Cannot find AtoD stage for {}, \n{}'.format(xcode, outReason))
-
-                        isAtoD, isAtoDReason = isAtoDStage(namedResponse, atodStageInOrig)
-                        if not isAtoD:
-                            raise Exception('Expected AtoD stage as {}, but does not look like V to count Coefficients: {}, {}'.format(atodStageInOrig, chanCodeId, isAtoDReason))
-                        atodSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
-                        atodSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
-                        atodOld = namedResponse.Stage[atodStageInOrig-1]
-                        atodSubResponse.ResponseDetail.Gain.Value = atodOld.StageGain.Value
-                        atodSubResponse.ResponseDetail.Gain.Frequency = atodOld.StageGain.Frequency
-                        atodSubResponse.ResponseDetail.Gain.InputUnits = atodOld.Coefficients.InputUnits
-                        atodSubResponse.ResponseDetail.Gain.OutputUnits = atodOld.Coefficients.OutputUnits
-                        # check make sure there are more stages
-                        if loggerSubResponse is None or len(namedResponse.Stage) < loggerStageInOrig:
-                            loggerSubResponse = None
+                            raise Exception("can't get prior units for gain only stage: {}  prev: {}".format(s.exportdict(ignorewarning=True), namedResponse.Stage[preampStage-2].exportdict(ignorewarning=True)))
+                        if hasattr(namedResponse.Stage[preampStage], 'Coefficients'):
+                            preampSubResponse.ResponseDetail.Gain.OutputUnits = namedResponse.Stage[preampStage].Coefficients.InputUnits
+                        elif hasattr(namedResponse.Stage[preampStage], "FIR"):
+                            preampSubResponse.ResponseDetail.Gain.OutputUnits = namedResponse.Stage[logpreampStagegerStartStage].FIR.InputUnits
                         else:
-                            loggerSubResponse.ResponseDictLink = sisxmlparser.ResponseDictLinkType()
-                            loggerSubResponse.ResponseDictLink.Name = "L_"+prototypeChan
-                            loggerSubResponse.ResponseDictLink.SISNamespace = namespace
-                            loggerSubResponse.ResponseDictLink.Type = 'FilterSequence'
+                            raise Exception("can't get next units for gain only stage: {}  next: {}".format(s.exportdict(ignorewarning=True), namedResponse.Stage[preampStage].exportdict(ignorewarning=True)))
+
                 else:
-                    if len(lll) > 1:
-                        print("       WARNING: %s has more than one matching logger response in NRL, using first"%(chanCodeId,))
-                        for templ in lll:
-                            print("         %s"%(templ[0],))
-                    if VERBOSE: print("        logger in NRL: %s"%(xcode,))
-                    loggerSubResponse.RESPFile = sisxmlparser.RESPFileType()
-                    loggerSubResponse.RESPFile.ValueOf = lll[0][0].replace("nrl", NRL_PREFIX)
-                    # don't need these if logger came from NRL
                     preampSubResponse = None
-                    atodSubResponse = None
-                    loggerSubResponse.sequenceNumber -= 2
-                    # stage To/From not required for NRL responses, use SIS rules
-                    #loggerSubResponse.RESPFile.stageFrom = lll[0][2]
-                    #loggerSubResponse.RESPFile.stageTo = lll[0][3]
+                    atodSubResponse.sequenceNumber -= 1
+                    loggerSubResponse.sequenceNumber = atodSubResponse.sequenceNumber +1
+
+                if atodStageInOrig < 0:
+                    # print reason for each stage failing
+                    outReason = ""
+                    for stage in namedResponse.Stage:
+                        isAtoD, isAtoDReason = isAtoDStage(namedResponse, stage.number)
+                        outReason += f"isAtoDStage {stage.number}: {isAtoD}: {isAtoDReason}/n"
+                    raise Exception('Cannot find AtoD stage for {}, \n{}'.format(xcode, outReason))
+
+                isAtoD, isAtoDReason = isAtoDStage(namedResponse, atodStageInOrig)
+                if not isAtoD:
+                    raise Exception('Expected AtoD stage as {}, but does not look like V to count Coefficients: {}, {}'.format(atodStageInOrig, chanCodeId, isAtoDReason))
+                atodSubResponse.ResponseDetail = sisxmlparser.SubResponseDetailType()
+                atodSubResponse.ResponseDetail.Gain = sisxmlparser.SISGainType()
+                atodOld = namedResponse.Stage[atodStageInOrig-1]
+                atodSubResponse.ResponseDetail.Gain.Value = atodOld.StageGain.Value
+                atodSubResponse.ResponseDetail.Gain.Frequency = atodOld.StageGain.Frequency
+                atodSubResponse.ResponseDetail.Gain.InputUnits = atodOld.Coefficients.InputUnits
+                atodSubResponse.ResponseDetail.Gain.OutputUnits = atodOld.Coefficients.OutputUnits
+                # check make sure there are more stages
+                if loggerSubResponse is None or len(namedResponse.Stage) < loggerStageInOrig:
+                    loggerSubResponse = None
+                else:
+                    loggerSubResponse.ResponseDictLink = sisxmlparser.ResponseDictLinkType()
+                    loggerSubResponse.ResponseDictLink.Name = "L_"+prototypeChan
+                    loggerSubResponse.ResponseDictLink.SISNamespace = namespace
+                    loggerSubResponse.ResponseDictLink.Type = 'FilterSequence'
+        else:
+            if numEquivClasses(lll) > 1:
+                print("       WARNING: %s has more than one matching logger response in NRL, using first"%(chanCodeId,))
+                for templ in lll:
+                    print("         %s"%(templ[0],))
+            elif VERBOSE and len(lll) > 1:
+                print("        %s matches %d equivalent logger responses in NRL, using first"%(chanCodeId, len(lll)))
+            if VERBOSE: print("        logger in NRL: %s"%(xcode,))
+            loggerSubResponse.RESPFile = sisxmlparser.RESPFileType()
+            loggerSubResponse.RESPFile.ValueOf = nrlUrl(nrl, lll[0][0])
+            # don't need these if logger came from NRL
+            preampSubResponse = None
+            atodSubResponse = None
+            loggerSubResponse.sequenceNumber -= 2
+            # stage To/From not required for NRL responses, use SIS rules
+            #loggerSubResponse.RESPFile.stageFrom = lll[0][2]
+            #loggerSubResponse.RESPFile.stageTo = lll[0][3]
 
     c.Response.SubResponse = []
     if sensorSubResponse is not  None:
@@ -360,14 +408,22 @@ def fixResponseNRL(n, s, c, oldResponse, uniqResponse, namespace):
 
 
 def toSISNetwork(n):
-    elemDict = n.exportdict(ignorewarning=False)
+    elemDict = n._exportdict()
     sisNet = sisxmlparser.SISNetworkType(**elemDict)
     sisNet.Station = []
     return sisNet
 
 
+def setDefaultOperator(s, operator):
+    '''SIS requires an Operator, use operator as the Agency if the station has none'''
+    if not hasattr(s, 'Operator'):
+        s.Operator = []
+        sOp = sisxmlparser.OperatorType()
+        sOp.Agency = operator
+        s.Operator.append(sOp)
+
 def toSISStation(s):
-    elemDict = s.exportdict(ignorewarning=False)
+    elemDict = s._exportdict()
     sisSta = sisxmlparser.SISStationType(**elemDict)
     sisSta.Channel = []
     return sisSta
@@ -379,25 +435,25 @@ def toSISChannel(ch):
     '''
     savedResponse = ch.Response
     ch.Response = None
-    elemDict = ch.exportdict(ignorewarning=False)
+    elemDict = ch._exportdict()
     sisCh = sisxmlparser.SISChannelType(**elemDict)
     ch.Response = savedResponse
     return sisCh
 
 def toSISPolesZeros(pz, sisNamespace):
-    elemDict = pz.exportdict(ignorewarning=False)
+    elemDict = pz._exportdict()
     sisPZ = sisxmlparser.SISPolesZerosType(**elemDict)
     sisPZ.SISNamespace = sisNamespace
     return sisPZ
 
 def toSISCoefficients(coef, sisNamespace):
-    elemDict = coef.exportdict(ignorewarning=False)
+    elemDict = coef._exportdict()
     sisCoef = sisxmlparser.SISCoefficientsType(**elemDict)
     sisCoef.SISNamespace = sisNamespace
     return sisCoef
 
 def toSISPolynomial(poly, sisNamespace):
-    elemDict = poly.exportdict(ignorewarning=False)
+    elemDict = poly._exportdict()
     sisPoly = sisxmlparser.SISPolynomialType(**elemDict)
     sisPoly.SISNamespace = sisNamespace
     return sisPoly
@@ -409,7 +465,7 @@ def createResponseDict(prototypeChan, s, sisNamespace):
         rd.PolesZeros = toSISPolesZeros(s.PolesZeros, sisNamespace)
         rd.PolesZeros.name = "FS_%d_%s"%(s.number, prototypeChan)
     elif hasattr(s, "FIR"):
-        elemDict = s.FIR.exportdict()
+        elemDict = s.FIR._exportdict()
         rd.FIR = sisxmlparser.SISFIRType(**elemDict)
         rd.FIR.name = "FS_%d_%s"%(s.number, prototypeChan)
         rd.FIR.SISNamespace = sisNamespace
@@ -424,274 +480,658 @@ def createResponseDict(prototypeChan, s, sisNamespace):
     return rd
 
 
-def main():
-    global VERBOSE
-    sisNamespace = "TESTING"
-    parseArgs = initArgParser()
-    if parseArgs.verbose:
-        VERBOSE=True
-        for k, v in vars(parseArgs).items():
-            print("    Args: %s %s"%(k, v))
-    sisNamespace = parseArgs.namespace
-    if parseArgs.stationxml:
-        if not xerces_validate(parseArgs.stationxml):
-            return
-
-        # Parse an xml file
-        isExtStaXml = False
-        rootobj = sisxmlparser.parse(parseArgs.stationxml, isExtStaXml)
-        if hasattr(rootobj, 'comments'):
-            origModuleURI = rootobj.ModuleURI
-        else:
-            origModuleURI = ""
-        sisRoot = sisxmlparser.SISRootType()
-        sisRoot.schemaVersion='3.0'
-        sisRoot.Source=parseArgs.namespace
-        sisRoot.Sender=parseArgs.namespace
-        sisRoot.Module='sta2extsta.py'
-        sisRoot.ModuleURI='https://github.com/crotwell/2extStationXML'
-        sisRoot.Created=datetime.datetime.now()
-
-        if not hasattr(rootobj, 'comments'):
-            sisRoot.comments = []
-        else:
-            sisRoot.comments = rootobj.comments
-        sisRoot.comments.append("From: "+origModuleURI)
-
-        if parseArgs.onlysta:
-            pattern = re.compile(parseArgs.onlysta)
-            for n in rootobj.Network:
-                tempSta = []
-                for s in n.Station:
-                    if pattern.match(s.code):
-                        tempSta.append(s)
-                n.Station = tempSta
 
-        # del non-matching channels
-        if parseArgs.onlychan:
-            pattern = re.compile(parseArgs.onlychan)
-            for n in rootobj.Network:
-                for s in n.Station:
-                    tempChan = []
-                    for c in s.Channel:
-                        locid = c.locationCode
-                        if locid is None or len(locid) == 0:
-                            locid = "--"
-                        if pattern.match(c.code):
-                            tempChan.append(c)
-                        elif pattern.match("%s.%s"%(locid, c.code)):
-                            tempChan.append(c)
-                        else:
-                            if VERBOSE:
-                                print("Skip %s as doesn't match --onlychan"%(checkNRL.getChanCodeId(n, s, c),))
-                    s.Channel = tempChan
+class ConversionState(object):
+    '''
+    NRL index and match cache shared by every file converted in one
+    process. Unique responses already matched against the NRL in an earlier
+    file reuse those matches instead of walking the NRL again. The cache
+    holds at most maxCache responses, dropping the least recently used
+    responseKey bucket when full, so a long running daemon doesn't grow
+    without bound.
+    '''
 
-        for n in rootobj.Network:
+    def __init__(self, nrl, matcher='pz', freqtol=freqResponse.DEFAULT_TOL, maxCache=DEFAULT_MAX_CACHE):
+        self.nrl = checkNRL.NRLIndex(nrl)
+        self.matcher = matcher
+        self.freqtol = freqtol
+        self.maxCache = maxCache
+        self.sensorMatrix = None
+        # responseKey to list of matched [name, response, chanCodeList, sss, lll], least recently used first
+        self.matchCache = collections.OrderedDict()
+        self.numCached = 0
+        self.numCacheHits = 0
+        self.numCacheEvictions = 0
+        # stage timing and counters, see --profile
+        self.profile = pipelineProfile.NULL_PROFILE
+
+    def loggerRateIndex(self):
+        return self.nrl.sampleRateIndex()
+
+    def warm(self):
+        '''load everything from the NRL now, ie before forking workers that share it'''
+        self.loggerRateIndex()
+        self.nrl.respClasses('sensors')
+        self.nrl.respClasses('dataloggers')
+        if self.matcher == 'freq' and self.sensorMatrix is None:
+            self.sensorMatrix = freqResponse.buildSensorMatrix(self.nrl)
+
+    def cachedMatch(self, chanResp):
+        key = uniqResponses.responseKey(chanResp)
+        for record in self.matchCache.get(key, []):
+            if uniqResponses.areSameResponse(chanResp, record[1])[0]:
+                self.matchCache.move_to_end(key)
+                return record
+        return None
+
+    def addMatch(self, record):
+        '''cache a matched unique response, dropping least recently used buckets over maxCache'''
+        key = uniqResponses.responseKey(record[1])
+        self.matchCache.setdefault(key, []).append(record)
+        self.matchCache.move_to_end(key)
+        self.numCached += 1
+        while self.maxCache > 0 and self.numCached > self.maxCache:
+            if len(self.matchCache) > 1:
+                oldKey, oldRecords = self.matchCache.popitem(last=False)
+            else:
+                # one bucket over the limit, drop its oldest records
+                records = self.matchCache[key]
+                oldRecords = records[:self.numCached-self.maxCache]
+                del records[:len(oldRecords)]
+            self.numCached -= len(oldRecords)
+            self.numCacheEvictions += len(oldRecords)
+
+    def matchNRL(self, uniqResponse):
+        '''
+        same as checkNRL.checkRespListInNRL(..., withIndex=True) for the
+        configured matcher, but only unique responses not seen before are
+        compared to the NRL
+        '''
+        outList = []
+        todo = []
+        for name, chanResp, chanCodeList in uniqResponse:
+            cached = self.cachedMatch(chanResp)
+            if cached is None:
+                todo.append( ( name, chanResp, chanCodeList ) )
+                outList.append(None)
+            else:
+                self.numCacheHits += 1
+                outList.append( [ name, chanResp, chanCodeList, list(cached[3]), list(cached[4]) ] )
+        if len(todo) > 0:
+            if self.matcher == 'freq':
+                if self.sensorMatrix is None:
+                    self.sensorMatrix = freqResponse.buildSensorMatrix(self.nrl)
+                matched = freqResponse.checkRespListInNRL(self.nrl, todo, tol=self.freqtol, sensorMatrix=self.sensorMatrix)
+            else:
+                matched = checkNRL.checkRespListInNRL(self.nrl, todo)
+            matched = iter(matched)
+            for i in range(len(outList)):
+                if outList[i] is None:
+                    outList[i] = next(matched)
+                    self.addMatch(outList[i])
+        if VERBOSE: print("NRL match cache: %d of %d unique responses already matched"%(len(uniqResponse)-len(todo), len(uniqResponse)))
+        return outList, checkNRL.chanCodeIndex(outList)
+
+def loadConversionState(parseArgs):
+    '''ConversionState for the --nrl and --matcher args, None after printing why if the NRL is not usable'''
+    if not os.path.exists(parseArgs.nrl):
+        print("ERROR: can't find nrl dir at '%s', get with 'svn checkout http://seiscode.iris.washington.edu/svn/nrl/trunk nrl"%(parseArgs.nrl,))
+        return None
+    state = ConversionState(parseArgs.nrl, parseArgs.matcher, parseArgs.freqtol, parseArgs.maxcache)
+    if state.nrl.indexStat(checkNRL.SAMP_RATE_INDEX) is None:
+        print("ERROR: can't fine sps index file for NRL. Should be logger_sample_rate.sort inside NRL directory")
+        print("python checkNRL.py --samplerate --nrl <path_to_nrl>")
+        return None
+# load logger response by sample rate index file, speeds search
+    if VERBOSE: print("load NRL sample rate index")
+    state.loggerRateIndex()
+    return state
+
+class SelectChannelsPass(inventoryPasses.InventoryPass):
+    '''removes stations and channels not matching --onlysta and --onlychan'''
+    name = 'filter'
+
+    def __init__(self, parseArgs, changes=None):
+        inventoryPasses.InventoryPass.__init__(self, changes)
+        self.staPattern = re.compile(parseArgs.onlysta) if parseArgs.onlysta else None
+        self.chanPattern = re.compile(parseArgs.onlychan) if parseArgs.onlychan else None
+
+    def visitNetwork(self, n):
+        if self.staPattern:
+            tempSta = []
             for s in n.Station:
-                tempChan = []
-                for c in s.Channel:
-                    if hasattr(c, 'Response') and hasattr(c.Response, 'Stage') and isOnlyGainStage(c.Response, 1):
-                         # for weird case of gain channels for gain-ranged channels
-                         # input and output units should be volts and we will
-                         # insert a fake unity sensor for this.
-                         if c.Response.InstrumentSensitivity.InputUnits.Name == 'V' and c.Response.Stage[1].Coefficients.InputUnits.Name == 'V':
-                             print("INFO: adding unity V to V polezero to stage 1 for %s.%s.%s.%s"%(n.code, s.code, c.locationCode, c.code))
-                             pzTemp = sisxmlparser.PolesZerosType()
-                             pzTemp.InputUnits = c.Response.InstrumentSensitivity.InputUnits
-                             pzTemp.OutputUnits = c.Response.Stage[1].Coefficients.InputUnits
-                             pzTemp.PzTransferFunctionType = "LAPLACE (RADIANS/SECOND)"
-                             pzTemp.NormalizationFactor = 1
-                             pzTemp.NormalizationFrequency = 1
-                             pzTemp.Zero = []
-                             pzTemp.Pole = []
-                             c.Response.Stage[0].PolesZeros = pzTemp
-                         else:
-                             print("WARNING: can't fix stage 1, no poleszeros for %s.%s.%s.%s"%(n.code, s.code, c.locationCode, c.code))
-
-
-        if not os.path.exists(parseArgs.nrl):
-            print("ERROR: can't find nrl dir at '%s', get with 'svn checkout http://seiscode.iris.washington.edu/svn/nrl/trunk nrl"%(parseArgs.nrl,))
-            return
-        spsIndex = os.path.join(parseArgs.nrl, "logger_sample_rate.sort")
-        if not os.path.exists(spsIndex):
-            print("ERROR: can't fine sps index file for NRL. Should be logger_sample_rate.sort inside NRL directory")
-            print("python checkNRL.py --samplerate --nrl <path_to_nrl>")
-            return
+                if self.staPattern.match(s.code):
+                    tempSta.append(s)
+                else:
+                    self.changes['numChanges'] += 1
+            n.Station = tempSta
 
-# load logger response by sample rate index file, speeds search
-        if VERBOSE: print("load NRL sample rate index")
-        loggerRateIndex = checkNRL.loadRespfileSampleRate(spsIndex)
-# clean unit names (ie count instead of COUNTS)
-        cleanChanges = cleanUnitNames.cleanUnitNames(rootobj)
-        if VERBOSE:
-          print("check units: %d changes"%(cleanChanges['numChanges'],))
-          for k, v in cleanChanges.items():
-            if k != 'numChanges':
-                print("Rename unit: %s => %s"%(k, v))
-# find all unique responses so only check identical channels once
-        if VERBOSE: print("find unique responses in xml")
-        uniqResponse = uniqResponses.uniqueResponses(rootobj)
-# for each unique response, see if it is in the NRL so we use NRL instead of
-# a in file named response
-        if VERBOSE: print("look for responses in NRL...this could take a while")
-        uniqWithNRL = checkNRL.checkRespListInNRL(parseArgs.nrl, uniqResponse, loggerRateIndex=loggerRateIndex)
-
-
-        for n in rootobj.Network:
-          print("%s "%(n.code,))
-          sisNet = None
-          for s in n.Station:
-            print("    %s   "%(s.code, ))
-            if not hasattr(s, 'Operator'):
-                s.Operator = []
-                sOp = sisxmlparser.OperatorType()
-                sOp.Agency = parseArgs.operator
-                s.Operator.append(sOp)
-            allChanCodes = {}
-            staChanToProcess = []
+    def visitStation(self, n, s):
+        # del non-matching channels
+        if self.chanPattern:
+            pattern = self.chanPattern
+            tempChan = []
             for c in s.Channel:
-              if parseArgs.delcurrent and (not hasattr(c, 'endDate') or
-              c.endDate > datetime.datetime.now(datetime.timezone.utc) ):
-                 print("        %s.%s --delcurrent: delete channel ends after now %s "%(c.locationCode, c.code, checkNRL.getChanCodeId(n,s,c),))
-              else:
-                 staChanToProcess.append(c)
+                locid = c.locationCode
+                if locid is None or len(locid) == 0:
+                    locid = "--"
+                if pattern.match(c.code):
+                    tempChan.append(c)
+                elif pattern.match("%s.%s"%(locid, c.code)):
+                    tempChan.append(c)
+                else:
+                    chanCode = checkNRL.getChanCodeId(n, s, c)
+                    if VERBOSE:
+                        print("Skip %s as doesn't match --onlychan"%(chanCode,))
+                    self.logChange(chanCode, "doesn't match --onlychan")
+            s.Channel = tempChan
 
-            tempChan = []
-            for c in staChanToProcess:
-                print("        %s.%s "%(c.locationCode, c.code,))
-                sisChan = toSISChannel(c)
-                key = "%s.%s"%(c.locationCode, c.code)
-                if not key in allChanCodes:
-                    allChanCodes[key] = []
-                allChanCodes[key].append(sisChan)
-                fixResponseNRL(n, s, sisChan, c.Response, uniqWithNRL, sisNamespace)
-                tempChan.append(sisChan)
-            if len(tempChan) > 0:
-                if sisNet is None:
-                    sisNet = toSISNetwork(n)
-                    sisNet.Station = [] # to be added later
-                    if not hasattr(sisRoot, 'Network'):
-                        sisRoot.Network = []
-                    sisRoot.Network.append(sisNet)
-                sisSta = toSISStation(s)
-                sisNet.Station.append(sisSta)
-                sisSta.Channel = tempChan
-
-            for key, epochList in allChanCodes.items():
-              epochList.sort(key=getStartDate)
-
-
-
-        # save old stage as named and added so only add each unique stage once
-        # this is only for logger stages as sensor is taken care of in fixResponseNRL
-        prevAddedFilterStage = {}
-
-        respGroup = sisxmlparser.ResponseDictGroupType()
-        respGroup.ResponseDict = []
-        for prototypeChan, namedResponse, chanCodeList, sss, lll in uniqWithNRL:
-            if not hasattr(namedResponse, 'Stage'):
-                # no stages, so do not need to add
-                continue
-            if VERBOSE: print("add to hardware, prototype: "+prototypeChan)
-            if len(sss) == 0:
-                # add stage 1 as sensor
-                sensor = sisxmlparser.ResponseDictType()
-                if hasattr(namedResponse.Stage[0], "PolesZeros"):
-                    sensor.PolesZeros = toSISPolesZeros(namedResponse.Stage[0].PolesZeros, sisNamespace)
-                    sensor.PolesZeros.name = "S_"+prototypeChan
-                elif hasattr(namedResponse.Stage[0], "Coefficients"):
-                    sensor.Coefficients = toSISCoefficients(namedResponse.Stage[0].Coefficients, sisNamespace)
-                    sensor.Coefficients.name = "S_"+prototypeChan
-                elif isSimpleSOHSingleStage(namedResponse):
-                    sensor = None
-                elif hasattr(namedResponse.Stage[0], "Polynomial"):
-                    sensor.Polynomial = toSISPolynomial(namedResponse.Stage[0].Polynomial, sisNamespace)
-                    sensor.Polynomial.name = "S_"+prototypeChan
+class GainStageFixupPass(inventoryPasses.InventoryPass):
+    '''
+    for weird case of gain channels for gain-ranged channels, input and
+    output units should be volts and we will insert a fake unity sensor
+    '''
+    name = 'gainStageFixup'
+
+    def visitChannel(self, n, s, c, chanCode):
+        if hasattr(c, 'Response') and hasattr(c.Response, 'Stage') and isOnlyGainStage(c.Response, 1):
+             if c.Response.InstrumentSensitivity.InputUnits.Name == 'V' and c.Response.Stage[1].Coefficients.InputUnits.Name == 'V':
+                 print("INFO: adding unity V to V polezero to stage 1 for %s.%s.%s.%s"%(n.code, s.code, c.locationCode, c.code))
+                 pzTemp = sisxmlparser.PolesZerosType()
+                 pzTemp.InputUnits = c.Response.InstrumentSensitivity.InputUnits
+                 pzTemp.OutputUnits = c.Response.Stage[1].Coefficients.InputUnits
+                 pzTemp.PzTransferFunctionType = "LAPLACE (RADIANS/SECOND)"
+                 pzTemp.NormalizationFactor = 1
+                 pzTemp.NormalizationFrequency = 1
+                 pzTemp.Zero = []
+                 pzTemp.Pole = []
+                 c.Response.Stage[0].PolesZeros = pzTemp
+                 self.logChange(chanCode, "unity V to V polezero in stage 1")
+             else:
+                 print("WARNING: can't fix stage 1, no poleszeros for %s.%s.%s.%s"%(n.code, s.code, c.locationCode, c.code))
+
+def selectChannels(rootobj, parseArgs):
+    '''remove stations and channels not matching --onlysta and --onlychan from rootobj'''
+    inventoryPasses.runPasses(rootobj, [SelectChannelsPass(parseArgs)])
+
+def isCurrent(c):
+    '''true if channel epoch c is open or ends after now'''
+    return not hasattr(c, 'endDate') or c.endDate > datetime.datetime.now(datetime.timezone.utc)
+
+def convert(rootobj, parseArgs, state):
+    '''
+    convert parsed FDSN StationXML rootobj to a SIS root, matching responses
+    with the NRL of state, a ConversionState. Returns None if it can't.
+    '''
+    sisNamespace = parseArgs.namespace
+    if hasattr(rootobj, 'comments'):
+        origModuleURI = rootobj.ModuleURI
+    else:
+        origModuleURI = ""
+    sisRoot = sisxmlparser.SISRootType()
+    sisRoot.schemaVersion='3.0'
+    sisRoot.Source=parseArgs.namespace
+    sisRoot.Sender=parseArgs.namespace
+    sisRoot.Module='sta2extsta.py'
+    sisRoot.ModuleURI='https://github.com/crotwell/2extStationXML'
+    sisRoot.Created=datetime.datetime.now()
+
+    if not hasattr(rootobj, 'comments'):
+        sisRoot.comments = []
+    else:
+        sisRoot.comments = rootobj.comments
+    sisRoot.comments.append("From: "+origModuleURI)
+    profile = state.profile
+
+# one walk removes channels not matching --onlysta/--onlychan, fixes
+# gain-ranged gain channels, cleans unit names (ie count instead of COUNTS)
+# and finds all unique responses so only check identical channels once
+    if VERBOSE: print("filter, clean units and find unique responses in xml")
+    uniqPass = uniqResponses.UniqueResponsesPass()
+    with profile.stage('inventoryPasses'):
+        passChanges = inventoryPasses.runPasses(rootobj, [SelectChannelsPass(parseArgs),
+                                                          GainStageFixupPass(),
+                                                          cleanUnitNames.CleanUnitNamesPass(),
+                                                          uniqPass])
+    uniqResponse = uniqPass.result()
+    cleanChanges = passChanges['cleanUnitNames']
+    for name, changes in passChanges.items():
+        profile.count(name+'Changes', changes['numChanges'])
+        if VERBOSE: print("%s: %d changes"%(name, changes['numChanges']))
+    if VERBOSE:
+      for k, v in cleanChanges.items():
+        if k != 'numChanges':
+            print("Rename unit: %s => %s"%(k, v))
+    profile.count('uniqueResponses', len(uniqResponse))
+# for each unique response, see if it is in the NRL so we use NRL instead of
+# a in file named response
+    if VERBOSE: print("look for responses in NRL...this could take a while")
+    with profile.stage('checkRespListInNRL'):
+        uniqWithNRL, uniqIndex = state.matchNRL(uniqResponse)
+# validate the input once, the toSIS* helpers below copy it without
+# validating each network, station and channel again
+    rootobj.checktree()
+
+
+    for n in rootobj.Network:
+      print("%s "%(n.code,))
+      sisNet = None
+      for s in n.Station:
+        print("    %s   "%(s.code, ))
+        setDefaultOperator(s, parseArgs.operator)
+        allChanCodes = {}
+        staChanToProcess = []
+        for c in s.Channel:
+          if parseArgs.delcurrent and isCurrent(c):
+             print("        %s.%s --delcurrent: delete channel ends after now %s "%(c.locationCode, c.code, checkNRL.getChanCodeId(n,s,c),))
+          else:
+             staChanToProcess.append(c)
+
+        tempChan = []
+        for c in staChanToProcess:
+            print("        %s.%s "%(c.locationCode, c.code,))
+            sisChan = toSISChannel(c)
+            key = "%s.%s"%(c.locationCode, c.code)
+            if not key in allChanCodes:
+                allChanCodes[key] = []
+            allChanCodes[key].append(sisChan)
+            profile.start('fixResponseNRL')
+            fixResponseNRL(n, s, sisChan, c.Response, uniqIndex, sisNamespace, state.nrl)
+            profile.stop('fixResponseNRL')
+            profile.count('channels')
+            tempChan.append(sisChan)
+        if len(tempChan) > 0:
+            if sisNet is None:
+                sisNet = toSISNetwork(n)
+                sisNet.Station = [] # to be added later
+                if not hasattr(sisRoot, 'Network'):
+                    sisRoot.Network = []
+                sisRoot.Network.append(sisNet)
+            sisSta = toSISStation(s)
+            sisNet.Station.append(sisSta)
+            sisSta.Channel = tempChan
+
+        for key, epochList in allChanCodes.items():
+          epochList.sort(key=getStartDate)
+
+
+
+    profile.start('hardwareResponse')
+    # save old stage as named and added so only add each unique stage once
+    # this is only for logger stages as sensor is taken care of in fixResponseNRL
+    prevAddedFilterStage = uniqResponses.StageRegistry()
+
+    respGroup = sisxmlparser.ResponseDictGroupType()
+    respGroup.ResponseDict = []
+    for prototypeChan, namedResponse, chanCodeList, sss, lll in uniqWithNRL:
+        if not hasattr(namedResponse, 'Stage'):
+            # no stages, so do not need to add
+            continue
+        if VERBOSE: print("add to hardware, prototype: "+prototypeChan)
+        if len(sss) == 0:
+            # add stage 1 as sensor
+            sensor = sisxmlparser.ResponseDictType()
+            if hasattr(namedResponse.Stage[0], "PolesZeros"):
+                sensor.PolesZeros = toSISPolesZeros(namedResponse.Stage[0].PolesZeros, sisNamespace)
+                sensor.PolesZeros.name = "S_"+prototypeChan
+            elif hasattr(namedResponse.Stage[0], "Coefficients"):
+                sensor.Coefficients = toSISCoefficients(namedResponse.Stage[0].Coefficients, sisNamespace)
+                sensor.Coefficients.name = "S_"+prototypeChan
+            elif isSimpleSOHSingleStage(namedResponse):
+                sensor = None
+            elif hasattr(namedResponse.Stage[0], "Polynomial"):
+                sensor.Polynomial = toSISPolynomial(namedResponse.Stage[0].Polynomial, sisNamespace)
+                sensor.Polynomial.name = "S_"+prototypeChan
+            else:
+                print("WARNING: sensor response for %s doesnot have PolesZeros"%(prototypeChan,))
+                return None
+            if sensor is not None:
+                respGroup.ResponseDict.append(sensor)
+
+        if len(lll) == 0:
+            # add later stages as logger
+            logger = sisxmlparser.ResponseDictType()
+            logger.FilterSequence = sisxmlparser.FilterSequenceType()
+            logger.FilterSequence.name = "L_"+prototypeChan
+            logger.FilterSequence.SISNamespace = sisNamespace
+            logger.FilterSequence.FilterStage = []
+            loggerStartStage = 2
+            # array index is 0-base, stage number is 1-base, so -1
+            # first logger stage should be AtoD stage and SIS wants
+            # that separate from the filter chain
+            if not (isPreampStage(namedResponse, loggerStartStage)[0] and isAtoDStage(namedResponse, loggerStartStage+1)[0] or isAtoDStage(namedResponse, loggerStartStage)[0]):
+               raise Exception("ERROR: expecting preamp then AtoD or AtoD stage, which should have Coefficients, but not found. %d %s"%(loggerStartStage, prototypeChan))
+
+            # now deal with actual filter chain
+            respDictSeqNum = 1
+            for s in namedResponse.Stage[loggerStartStage -1 : ]:
+                # do not output preamp or atod as part of filter seq.
+                if s.number == loggerStartStage and isPreampStage(namedResponse, loggerStartStage)[0]:
+                    continue
+                if s.number == loggerStartStage and isAtoDStage(namedResponse, loggerStartStage)[0]:
+                    continue
+                if s.number == loggerStartStage+1 and isAtoDStage(namedResponse, loggerStartStage+1)[0]:
+                    continue
+
+                filterStage = sisxmlparser.FilterStageType()
+                filterStage.SequenceNumber = respDictSeqNum
+                respDictSeqNum += 1
+
+                if hasattr(s, "Decimation"):
+                   filterStage.Decimation = s.Decimation
                 else:
-                    print("WARNING: sensor response for %s doesnot have PolesZeros"%(prototypeChan,))
-                    return
-                if sensor is not None:
-                    respGroup.ResponseDict.append(sensor)
-
-            if len(lll) == 0:
-                # add later stages as logger
-                logger = sisxmlparser.ResponseDictType()
-                logger.FilterSequence = sisxmlparser.FilterSequenceType()
-                logger.FilterSequence.name = "L_"+prototypeChan
-                logger.FilterSequence.SISNamespace = sisNamespace
-                logger.FilterSequence.FilterStage = []
-                loggerStartStage = 2
-                # array index is 0-base, stage number is 1-base, so -1
-                # first logger stage should be AtoD stage and SIS wants
-                # that separate from the filter chain
-                if not (isPreampStage(namedResponse, loggerStartStage)[0] and isAtoDStage(namedResponse, loggerStartStage+1)[0] or isAtoDStage(namedResponse, loggerStartStage)[0]):
-                   raise Exception("ERROR: expecting preamp then AtoD or AtoD stage, which should have Coefficients, but not found. %d %s"%(loggerStartStage, prototypeChan))
-
-                # now deal with actual filter chain
-                respDictSeqNum = 1
-                for s in namedResponse.Stage[loggerStartStage -1 : ]:
-                    # do not output preamp or atod as part of filter seq.
-                    if s.number == loggerStartStage and isPreampStage(namedResponse, loggerStartStage)[0]:
-                        continue
-                    if s.number == loggerStartStage and isAtoDStage(namedResponse, loggerStartStage)[0]:
-                        continue
-                    if s.number == loggerStartStage+1 and isAtoDStage(namedResponse, loggerStartStage+1)[0]:
-                        continue
-
-                    filterStage = sisxmlparser.FilterStageType()
-                    filterStage.SequenceNumber = respDictSeqNum
-                    respDictSeqNum += 1
-
-                    if hasattr(s, "Decimation"):
-                       filterStage.Decimation = s.Decimation
-                    else:
-                       print("No decimation in %s stage %d but it is required"%(prototypeChan, s.number))
-                    if hasattr(s, "StageGain"):
-                       filterStage.Gain = s.StageGain
-                    filterStage.Filter = sisxmlparser.FilterIDType()
-
-                    # search to see if we have already added this filter stage
-                    found = False
-                    for oldName, oldStage in prevAddedFilterStage.items():
-                       if uniqResponses.areSameStage(s, oldStage)[0]:
-                           found=True
-                           break
-
-                    if not found:
-                       filterStage.Filter.Name = "FS_%d_%s"%(s.number, prototypeChan)
-                       rd = createResponseDict(prototypeChan, s, sisNamespace)
-                       if rd is not None:
-                           respGroup.ResponseDict.append(rd)
-                           prevAddedFilterStage[filterStage.Filter.Name] = s
-                    else:
-                       filterStage.Filter.Name = oldName
-                    filterStage.Filter.SISNamespace = sisNamespace
-                    # set type
-                    if hasattr(s, "PolesZeros"):
-                       filterStage.Filter.Type = "PolesZeros"
-                    elif hasattr(s, "FIR"):
-                       filterStage.Filter.Type = "FIR"
-                    elif hasattr(s, "Coefficients"):
-                       filterStage.Filter.Type = "Coefficients"
-                    else:
-                       raise SISError("stage does not have PZ, FIR or Coef: %s stage %s   \n%s"%(prototypeChan, s.number, s.exportdict(ignorewarning=True)))
+                   print("No decimation in %s stage %d but it is required"%(prototypeChan, s.number))
+                if hasattr(s, "StageGain"):
+                   filterStage.Gain = s.StageGain
+                filterStage.Filter = sisxmlparser.FilterIDType()
+
+                # search to see if we have already added this filter stage
+                oldName = prevAddedFilterStage.find(s)
+
+                if oldName is None:
+                   filterStage.Filter.Name = "FS_%d_%s"%(s.number, prototypeChan)
+                   rd = createResponseDict(prototypeChan, s, sisNamespace)
+                   if rd is not None:
+                       respGroup.ResponseDict.append(rd)
+                       prevAddedFilterStage.add(filterStage.Filter.Name, s)
+                else:
+                   filterStage.Filter.Name = oldName
+                filterStage.Filter.SISNamespace = sisNamespace
+                # set type
+                if hasattr(s, "PolesZeros"):
+                   filterStage.Filter.Type = "PolesZeros"
+                elif hasattr(s, "FIR"):
+                   filterStage.Filter.Type = "FIR"
+                elif hasattr(s, "Coefficients"):
+                   filterStage.Filter.Type = "Coefficients"
+                else:
+                   raise SISError("stage does not have PZ, FIR or Coef: %s stage %s   \n%s"%(prototypeChan, s.number, s.exportdict(ignorewarning=True)))
 
-                    logger.FilterSequence.FilterStage.append(filterStage)
-                if len(logger.FilterSequence.FilterStage) > 0:
-                   # only add if not empty
-                   respGroup.ResponseDict.append(logger)
+                logger.FilterSequence.FilterStage.append(filterStage)
+            if len(logger.FilterSequence.FilterStage) > 0:
+               # only add if not empty
+               respGroup.ResponseDict.append(logger)
 
 
 # add named non-NRL responses to HardwareResponse but not if respGroup is empty
-        if len(respGroup.ResponseDict) > 0:
-            if not hasattr(sisRoot, "HardwareResponse"):
-                sisRoot.HardwareResponse = sisxmlparser.HardwareResponseType()
-            if not hasattr(sisRoot.HardwareResponse, "ResponseDictGroup"):
-                sisRoot.HardwareResponse.ResponseDictGroup = respGroup
+    if len(respGroup.ResponseDict) > 0:
+        if not hasattr(sisRoot, "HardwareResponse"):
+            sisRoot.HardwareResponse = sisxmlparser.HardwareResponseType()
+        if not hasattr(sisRoot.HardwareResponse, "ResponseDictGroup"):
+            sisRoot.HardwareResponse.ResponseDictGroup = respGroup
+        else:
+            raise SISError ("sisRoot already has HardwareResponse.ResponseDictGroup!")
+    profile.stop('hardwareResponse')
+    return sisRoot
+
+def convertIncremental(rootobj, parseArgs, state):
+    '''
+    convert like convert, but channel epochs unchanged since the run that
+    wrote the --state file are taken from it instead of being converted
+    again. Returns (sisRoot, new incremental state to save once the output
+    is written), sisRoot is None if the conversion stopped.
+    '''
+    profile = state.profile
+    with profile.stage('filter'):
+        selectChannels(rootobj, parseArgs)
+    # hash before convert, which changes units in the input
+    with profile.stage('hashChannels'):
+        hashes = incrementalState.channelHashes(rootobj)
+    oldState = incrementalState.loadState(parseArgs.state, incrementalState.optionsKey(parseArgs, state.nrl))
+    reused = {}
+    numChan = 0
+    for n in rootobj.Network:
+        for s in n.Station:
+            for c in s.Channel:
+                numChan += 1
+                chanCodeId = checkNRL.getChanCodeId(n, s, c)
+                entry = oldState['channels'].get(chanCodeId)
+                if entry is not None and hashes[chanCodeId] == entry['sha256'] and not (parseArgs.delcurrent and isCurrent(c)):
+                    reused[chanCodeId] = entry
+    print("incremental: %d of %d channel epochs unchanged"%(len(reused), numChan))
+    profile.count('channelsReused', len(reused))
+    sisRoot = convert(incrementalState.reducedRoot(rootobj, reused), parseArgs, state)
+    if sisRoot is None:
+        return None, None
+
+    profile.start('assemble')
+    newNets = {}
+    newStas = {}
+    newChans = {}
+    for sisNet in getattr(sisRoot, 'Network', []):
+        newNets[(sisNet.code, getattr(sisNet, 'startDate', None))] = sisNet
+        for sisSta in sisNet.Station:
+            newStas[(sisNet.code, getattr(sisNet, 'startDate', None), sisSta.code, getattr(sisSta, 'startDate', None))] = sisSta
+            for sisChan in sisSta.Channel:
+                newChans.setdefault(checkNRL.getChanCodeId(sisNet, sisSta, sisChan), []).append(sisChan)
+
+    # ResponseDicts of new channels, renamed if a reused channel uses the
+    # same name for a different one
+    newDicts = []
+    if hasattr(sisRoot, 'HardwareResponse') and hasattr(sisRoot.HardwareResponse, 'ResponseDictGroup'):
+        newDicts = sisRoot.HardwareResponse.ResponseDictGroup.ResponseDict
+    reusedNames = []
+    for entry in reused.values():
+        for name in entry['responseDicts']:
+            if name not in reusedNames:
+                reusedNames.append(name)
+    taken = set(reusedNames).union([shardOutput.responseDictName(rd) for rd in newDicts])
+    renamed = True
+    while renamed:
+        renamed = False
+        for rd in newDicts:
+            name = shardOutput.responseDictName(rd)
+            if name in oldState['responseDicts'] and name in reusedNames \
+                    and incrementalState.fragmentXML(rd, 'sis:ResponseDict', parseArgs.compact) != oldState['responseDicts'][name]:
+                i = 1
+                while "%s_%d"%(name, i) in taken:
+                    i += 1
+                newName = "%s_%d"%(name, i)
+                taken.add(newName)
+                if VERBOSE: print("incremental: rename ResponseDict %s to %s"%(name, newName))
+                incrementalState.renameResponseDict(rd, newName, sisRoot)
+                renamed = True
+                break
+    newDictXML = dict([(shardOutput.responseDictName(rd), incrementalState.fragmentXML(rd, 'sis:ResponseDict', parseArgs.compact)) for rd in newDicts])
+    byName = dict([(shardOutput.responseDictName(rd), rd) for rd in newDicts])
+    dictOrder = [shardOutput.responseDictName(rd) for rd in newDicts]
+
+    # put reused and new channels together in input order
+    nets = []
+    channels = {}
+    for n in rootobj.Network:
+        sisNet = newNets.get((n.code, getattr(n, 'startDate', None)))
+        stations = []
+        for s in n.Station:
+            sisSta = newStas.get((n.code, getattr(n, 'startDate', None), s.code, getattr(s, 'startDate', None)))
+            chans = []
+            for c in s.Channel:
+                chanCodeId = checkNRL.getChanCodeId(n, s, c)
+                if chanCodeId in reused:
+                    entry = reused[chanCodeId]
+                    chans.append(sisxmlparser.XMLFragment(entry['xml']))
+                    channels[chanCodeId] = entry
+                elif len(newChans.get(chanCodeId, [])) > 0:
+                    sisChan = newChans[chanCodeId].pop(0)
+                    chans.append(sisChan)
+                    if hashes[chanCodeId] is not None:
+                        usedNames = shardOutput.referencedResponseDictNames(sisChan, byName)
+                        channels[chanCodeId] = {'sha256': hashes[chanCodeId],
+                                                'xml': incrementalState.fragmentXML(sisChan, 'Channel', parseArgs.compact),
+                                                'responseDicts': [name for name in dictOrder if name in usedNames]}
+            if len(chans) == 0:
+                continue
+            if sisSta is None:
+                setDefaultOperator(s, parseArgs.operator)
+                staCopy = copy.copy(s)
+                staCopy.Channel = []
+                # not in the root convert validated if all its channels are reused
+                staCopy.checktree()
+                sisSta = toSISStation(staCopy)
+            sisSta.Channel = chans
+            stations.append(sisSta)
+        if len(stations) == 0:
+            continue
+        if sisNet is None:
+            netCopy = copy.copy(n)
+            netCopy.Station = []
+            netCopy.checktree()
+            sisNet = toSISNetwork(netCopy)
+        sisNet.Station = stations
+        nets.append(sisNet)
+    if len(nets) > 0:
+        sisRoot.Network = nets
+    elif hasattr(sisRoot, 'Network'):
+        del sisRoot.Network
+
+    dictList = list(newDicts)
+    for name in reusedNames:
+        if name not in newDictXML:
+            dictList.append(sisxmlparser.XMLFragment(oldState['responseDicts'][name]))
+    if len(dictList) > 0:
+        if not hasattr(sisRoot, "HardwareResponse"):
+            sisRoot.HardwareResponse = sisxmlparser.HardwareResponseType()
+        if not hasattr(sisRoot.HardwareResponse, "ResponseDictGroup"):
+            sisRoot.HardwareResponse.ResponseDictGroup = sisxmlparser.ResponseDictGroupType()
+        sisRoot.HardwareResponse.ResponseDictGroup.ResponseDict = dictList
+
+    newState = incrementalState.emptyState(oldState['options'])
+    newState['channels'] = channels
+    for entry in channels.values():
+        for name in entry['responseDicts']:
+            if name in newDictXML:
+                newState['responseDicts'][name] = newDictXML[name]
             else:
-                raise SISError ("sisRoot already has HardwareResponse.ResponseDictGroup!")
+                newState['responseDicts'][name] = oldState['responseDicts'][name]
+    profile.stop('assemble')
+    return sisRoot, newState
+
+def writeOutput(sisRoot, parseArgs, outfile, profile=pipelineProfile.NULL_PROFILE):
+    '''
+    validate and write sisRoot to outfile, a file name or an open file, or
+    shards into directory outfile with --shard-by
+    '''
+    with profile.stage('export'):
+        numBytes = _writeOutput(sisRoot, parseArgs, outfile, profile.enabled)
+    profile.count('bytesWritten', numBytes)
+
+def _writeOutput(sisRoot, parseArgs, outfile, countBytes):
+    '''returns bytes written if countBytes, otherwise 0'''
+# Sharded output, one document per network or station plus manifest
+    if parseArgs.shardby:
+        manifest, results = shardOutput.writeShards(sisRoot, parseArgs.shardby, outfile, parseArgs.shardsuffix,
+                                          workers=parseArgs.exportworkers, ignorewarning=parseArgs.ignorewarning,
+                                          compact=parseArgs.compact, compresslevel=parseArgs.compresslevel)
+        print("%d shards, %d written, %d unchanged"%(len(results), len([r for r in results if r[4]]), len([r for r in results if not r[4]])))
+        if countBytes:
+            return sum([os.path.getsize(r[1]) for r in results])
+        return 0
+# Validate the whole tree in one pass, reporting every error, right before
+# export so it sees the tree as written.
+    errors = sisRoot.validatetree(parseArgs.ignorewarning)
+    if len(errors) > 0 and not parseArgs.ignorewarning:
+        for e in errors:
+            print("ERROR: %s"%(e,))
+        raise errors[0]
 # Finally after the instance is built export it.
-        sisRoot.exportxml(parseArgs.outfile, ignorewarning=parseArgs.ignorewarning)
+    toClose = None
+    if hasattr(outfile, 'write'):
+        out = outfile
+    else:
+        out = compressedFile.openOutput(outfile, parseArgs.compresslevel)
+        if out is not sys.stdout:
+            toClose = out
+    counter = None
+    if countBytes and toClose is None:
+        out = counter = pipelineProfile.CountingWriter(out)
+    try:
+        sisRoot.exportxml(out, ignorewarning=parseArgs.ignorewarning, compact=parseArgs.compact, backend=parseArgs.serializer, workers=parseArgs.exportworkers, validate=False)
+    finally:
+        if toClose is not None:
+            toClose.close()
+    if not countBytes:
+        return 0
+    if counter is not None:
+        return counter.numBytes
+    # size on disk, after compression
+    return os.path.getsize(outfile)
+
+
+def writeProfile(profile, state, filename):
+    '''add the NRL and comparison counters of this process to profile and write it'''
+    profile.count('nrlFilesParsed', checkNRL.COUNTERS['respFilesParsed'])
+    profile.count('sensorComparisons', checkNRL.COUNTERS['sensorComparisons'])
+    profile.count('loggerComparisons', checkNRL.COUNTERS['loggerComparisons'])
+    profile.count('responseComparisons', uniqResponses.COUNTERS['responseComparisons'])
+    profile.count('cacheHits', state.numCacheHits)
+    if instrumentation.isEnabled():
+        profile.addSection('instrumentation', instrumentation.report())
+    profile.write(filename)
+    print("profile written to %s"%(filename,))
+
+def main():
+    global VERBOSE
+    parseArgs = initArgParser()
+    if parseArgs.verbose:
+        VERBOSE=True
+        for k, v in vars(parseArgs).items():
+            print("    Args: %s %s"%(k, v))
+    if parseArgs.shardby and (parseArgs.outfile is None or parseArgs.outfile == '-'):
+        print("ERROR: --shard-by needs an output directory with -o")
+        return
+    if parseArgs.shardby and parseArgs.state:
+        print("ERROR: --state can not be used with --shard-by, shards are already only rewritten if changed")
+        return
+    if parseArgs.verbose:
+        shardOutput.setVerbose(True)
+    if parseArgs.instrument:
+        instrumentation.enable()
+    profile = pipelineProfile.NULL_PROFILE
+    if parseArgs.profile:
+        profile = pipelineProfile.PipelineProfile()
+    if parseArgs.stationxml:
+        if parseArgs.overlapvalidate:
+            validation = xerces_validate_async(parseArgs.stationxml)
+        else:
+            with profile.stage('validate'):
+                valid = xerces_validate(parseArgs.stationxml)
+            if not valid:
+                return
+
+        # Parse an xml file
+        isExtStaXml = False
+        with profile.stage('parse'):
+            try:
+                rootobj = sisxmlparser.parse(parseArgs.stationxml, isExtStaXml, intern=parseArgs.intern)
+            except Exception:
+                # invalid xml may fail to parse, report validation errors instead
+                if parseArgs.overlapvalidate and not validation.result():
+                    return
+                raise
+        if parseArgs.overlapvalidate:
+            with profile.stage('validate'):
+                valid = validation.result()
+            if not valid:
+                return
+        with profile.stage('loadNRL'):
+            state = loadConversionState(parseArgs)
+        if state is None:
+            return
+        state.profile = profile
+        if parseArgs.state:
+            sisRoot, incState = convertIncremental(rootobj, parseArgs, state)
+        else:
+            sisRoot = convert(rootobj, parseArgs, state)
+        if sisRoot is None:
+            return
+        writeOutput(sisRoot, parseArgs, parseArgs.outfile, profile)
+        if parseArgs.state:
+            with profile.stage('saveState'):
+                incrementalState.saveState(parseArgs.state, incState)
+        if parseArgs.profile:
+            writeProfile(profile, state, parseArgs.profile)
+        if instrumentation.isEnabled():
+            instrumentation.printReport()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,194 @@
+#! /usr/bin/python
+'''
+Convert many StationXML files to ExtendedStationXML in one process. The NRL
+is walked and its sample rate index loaded once for all inputs, and a unique
+response already matched against the NRL for one file is not matched again
+for the next. Output is one ExtStationXML per input, or with --merge a single
+document for all of them.
+
+With --workers the files are converted in that many forked processes, which
+share the NRL index loaded before they start.
+'''
+import compressedFile as compressedFile
+import shardOutput as shardOutput
+import sisxmlparser3_0 as sisxmlparser
+import sta2extsta as sta2extsta
+from xerces_validate import xerces_validate_many, reportErrors
+
+import argparse
+import concurrent.futures
+import glob
+import multiprocessing
+import os
+import sys
+
+VERBOSE = False
+
+DEFAULT_SUFFIX = '.extsta.xml'
+
+# args and ConversionState shared with forked workers, set before they fork
+_parseArgs = None
+_state = None
+
+def setVerbose(b):
+    global VERBOSE
+    VERBOSE = b
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Convert many StationXML files to ExtendedStationXML, loading the NRL once.')
+  parser.add_argument('inputs', nargs='+', help="input FDSN StationXML files or glob patterns like 'xml/*.xml'")
+  sta2extsta.addConversionArgs(parser)
+  parser.add_argument('--outdir', default='.', help="directory for the output of each input")
+  parser.add_argument('--suffix', default=DEFAULT_SUFFIX, help="output file name is the input name with .xml replaced by this, ie .extsta.xml.gz to compress")
+  parser.add_argument('--merge', action='store_true', help="convert all inputs into one document written to -o instead")
+  compressedFile.addOutputArgs(parser)
+  parser.add_argument('--workers', type=int, default=1, help="convert this many files at once, each in its own process")
+  parser.set_defaults(shardby=None, shardsuffix='.xml', exportworkers=1)
+  return parser.parse_args()
+
+def expandInputs(patterns):
+    '''files matching each glob pattern, sorted within a pattern, each only once'''
+    out = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern))
+        if len(matches) == 0:
+            # not a pattern, or no match, let validation report a missing file
+            matches = [pattern]
+        for f in matches:
+            if f not in out:
+                out.append(f)
+    return out
+
+def outputFilename(inputFile, outdir, suffix):
+    name = os.path.basename(inputFile)
+    for compression, magic, ext in compressedFile.COMPRESSIONS:
+        if name.endswith(ext):
+            name = name[:-len(ext)]
+    if name.endswith('.xml'):
+        name = name[:-len('.xml')]
+    return os.path.join(outdir, name+suffix)
+
+def outputCollisions(jobs):
+    '''dict of output file to the inputs writing it, for outputs written by more than one'''
+    byOutput = {}
+    for stationxml, outFile in jobs:
+        byOutput.setdefault(os.path.normpath(outFile), []).append(stationxml)
+    return dict((outFile, inputs) for outFile, inputs in byOutput.items() if len(inputs) > 1)
+
+def mergeRoots(rootList):
+    '''
+    single FDSN root with the networks of all roots in rootList, in order.
+    Comments and header come from the first.
+    '''
+    merged = rootList[0]
+    if not hasattr(merged, 'Network'):
+        merged.Network = []
+    for rootobj in rootList[1:]:
+        merged.Network.extend(getattr(rootobj, 'Network', []))
+    return merged
+
+def convertFile(inputFile, outFile):
+    '''
+    convert inputFile with the shared state and write it to outFile.
+    Returns (inputFile, outFile, number of channels), channels is None if
+    the conversion stopped. An error in one file is printed and does not
+    stop the others.
+    '''
+    try:
+        rootobj = sisxmlparser.parse(inputFile, False, intern=_parseArgs.intern)
+        sisRoot = sta2extsta.convert(rootobj, _parseArgs, _state)
+    except Exception as e:
+        print("%s: %s"%(inputFile, e))
+        return inputFile, outFile, None
+    if sisRoot is None:
+        return inputFile, outFile, None
+    try:
+        sta2extsta.writeOutput(sisRoot, _parseArgs, outFile)
+    except Exception as e:
+        print("%s: %s"%(inputFile, e))
+        return inputFile, outFile, None
+    return inputFile, outFile, shardOutput.numChannels(sisRoot)
+
+def main():
+    global _parseArgs, _state
+    parseArgs = initArgParser()
+    if parseArgs.verbose:
+        setVerbose(True)
+        sta2extsta.VERBOSE = True
+        for k, v in vars(parseArgs).items():
+            print("    Args: %s %s"%(k, v))
+    inputs = expandInputs(parseArgs.inputs)
+    workers = max(1, parseArgs.workers)
+    if not parseArgs.merge:
+        # refuse before any work if two inputs, ie a/sta.xml and b/sta.xml, would overwrite one output
+        collisions = outputCollisions([(stationxml, outputFilename(stationxml, parseArgs.outdir, parseArgs.suffix)) for stationxml in inputs])
+        if len(collisions) > 0:
+            for outFile, collidingInputs in sorted(collisions.items()):
+                print("ERROR: %s would be written by each of %s"%(outFile, " ".join(collidingInputs)))
+            print("ERROR: inputs with the same file name need separate runs with different --outdir")
+            return 1
+
+    # validate up front, the java validator pool is started once for all files
+    print("Validating %d files..."%(len(inputs),))
+    validInputs = []
+    inputOrder = dict((stationxml, i) for i, stationxml in enumerate(inputs))
+    for stationxml, errors in sorted(xerces_validate_many(inputs, poolSize=workers).items(), key=lambda e: inputOrder[e[0]]):
+        if len(errors) > 0:
+            print("%s:"%(stationxml,))
+            reportErrors(errors)
+        else:
+            validInputs.append(stationxml)
+    # non zero exit status if any input is invalid or fails to convert
+    status = 0 if len(validInputs) == len(inputs) else 1
+    if len(validInputs) == 0:
+        return 1
+
+    state = sta2extsta.loadConversionState(parseArgs)
+    if state is None:
+        return 1
+    if VERBOSE: print("load NRL")
+    state.warm()
+    _parseArgs = parseArgs
+    _state = state
+
+    if parseArgs.merge:
+        rootList = [sisxmlparser.parse(stationxml, False, intern=parseArgs.intern) for stationxml in validInputs]
+        sisRoot = sta2extsta.convert(mergeRoots(rootList), parseArgs, state)
+        if sisRoot is None:
+            return 1
+        sta2extsta.writeOutput(sisRoot, parseArgs, parseArgs.outfile)
+        return status
+
+    jobs = [(stationxml, outputFilename(stationxml, parseArgs.outdir, parseArgs.suffix)) for stationxml in validInputs]
+    if not os.path.isdir(parseArgs.outdir):
+        os.makedirs(parseArgs.outdir)
+    if workers > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        print("WARNING: workers need fork to share the NRL, converting one file at a time")
+        workers = 1
+    if workers == 1:
+        results = [convertFile(stationxml, outFile) for stationxml, outFile in jobs]
+    else:
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            futures = [executor.submit(convertFile, stationxml, outFile) for stationxml, outFile in jobs]
+            results = []
+            for (stationxml, outFile), f in zip(jobs, futures):
+                try:
+                    results.append(f.result())
+                except Exception as e:
+                    # ie the worker process died, convertFile catches errors in the conversion
+                    print("%s: %s"%(stationxml, e))
+                    results.append((stationxml, outFile, None))
+    for stationxml, outFile, numChan in results:
+        if numChan is None:
+            print("FAILED %s"%(stationxml,))
+            status = 1
+        else:
+            print("%s => %s  %d channels"%(stationxml, outFile, numChan))
+    if workers == 1:
+        print("NRL match cache: %d unique responses reused"%(state.numCacheHits,))
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
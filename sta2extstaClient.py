@@ -0,0 +1,115 @@
+#! /usr/bin/python
+'''
+Send a StationXML file to a running sta2extstaDaemon.py and write the
+ExtStationXML it returns.
+'''
+import compressedFile as compressedFile
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import sys
+import urllib.parse
+
+DEFAULT_HOST = 'localhost'
+DEFAULT_PORT = 8642
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    '''HTTPConnection to a Unix socket'''
+
+    def __init__(self, path, timeout=None):
+        http.client.HTTPConnection.__init__(self, 'localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Convert StationXML to ExtendedStationXML with a running sta2extstaDaemon.py')
+  parser.add_argument('-s', '--stationxml', help="input FDSN StationXML file, may be compressed")
+  compressedFile.addOutputArgs(parser)
+  parser.add_argument('--host', default=DEFAULT_HOST, help="daemon host")
+  parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="daemon port")
+  parser.add_argument('--socket', help="daemon Unix socket, instead of host and port")
+  parser.add_argument('--timeout', type=float, default=600, help="seconds to wait for the conversion")
+  parser.add_argument('--status', action='store_true', help="print the daemon status instead of converting")
+  parser.add_argument('--namespace', help="SIS namespace to use for named responses, default is the daemon's")
+  parser.add_argument('--operator', help="SIS operator to use for stations, default is the daemon's")
+  parser.add_argument('--onlychan', help="only channels with codes matching regular expression")
+  parser.add_argument('--onlysta', help="only stations with codes matching regular expression")
+  parser.add_argument('--delcurrent', action='store_true', help="remove channels that are currently operating")
+  parser.add_argument('--ignorewarning', action='store_true')
+  parser.add_argument('--compact', action='store_true', help="output xml without indentation or line breaks")
+  parser.add_argument('--serializer', choices=['python', 'lxml'], help="daemon side xml serializer")
+  return parser.parse_args()
+
+def connect(parseArgs):
+    if parseArgs.socket:
+        return UnixHTTPConnection(parseArgs.socket, timeout=parseArgs.timeout)
+    return http.client.HTTPConnection(parseArgs.host, parseArgs.port, timeout=parseArgs.timeout)
+
+def jobQuery(parseArgs):
+    '''query string for the conversion options given on the command line'''
+    query = {}
+    for k in ('namespace', 'operator', 'onlychan', 'onlysta', 'serializer'):
+        v = getattr(parseArgs, k)
+        if v is not None:
+            query[k] = v
+    for k in ('delcurrent', 'ignorewarning', 'compact'):
+        if getattr(parseArgs, k):
+            query[k] = '1'
+    return urllib.parse.urlencode(query)
+
+def convert(conn, stationxml, query=''):
+    '''
+    post the bytes of file stationxml to the daemon,
+    returns (http status, response body as str)
+    '''
+    with open(stationxml, 'rb') as f:
+        body = f.read()
+    path = '/convert'
+    if len(query) > 0:
+        path += '?'+query
+    conn.request('POST', path, body, {'Content-Type': 'application/xml'})
+    response = conn.getresponse()
+    return response.status, response.read().decode('utf-8')
+
+def main():
+    parseArgs = initArgParser()
+    conn = connect(parseArgs)
+    try:
+        if parseArgs.status:
+            conn.request('GET', '/status')
+            response = conn.getresponse()
+            print(json.dumps(json.loads(response.read().decode('utf-8')), indent=2))
+            return
+        if not parseArgs.stationxml:
+            print("ERROR: need -s stationxml or --status")
+            return 1
+        if not os.path.exists(parseArgs.stationxml):
+            print("ERROR: can't fine stationxml file %s"%(parseArgs.stationxml,))
+            return 1
+        status, text = convert(conn, parseArgs.stationxml, jobQuery(parseArgs))
+    except (ConnectionError, FileNotFoundError) as e:
+        print("ERROR: can't reach sta2extstaDaemon: %s"%(e,))
+        return 1
+    finally:
+        conn.close()
+    if status != 200:
+        print("ERROR: %d %s"%(status, text))
+        return 1
+    outfile = compressedFile.openOutput(parseArgs.outfile, parseArgs.compresslevel)
+    try:
+        outfile.write(text)
+    finally:
+        if outfile is not sys.stdout:
+            outfile.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
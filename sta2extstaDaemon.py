@@ -0,0 +1,218 @@
+#! /usr/bin/python
+'''
+Long running sta2extsta that loads the NRL once and keeps it, the NRL match
+cache and the compiled schemas in memory between conversions. Jobs are
+posted over HTTP on localhost or on a Unix socket, see sta2extstaClient.py.
+
+POST /convert with the StationXML, optionally compressed, as the body.
+Conversion options go in the query string, ie
+/convert?namespace=ABC&onlychan=BH.&compact=1, and the ExtStationXML is
+returned. Invalid input gets a 400 with the validation errors, a failed
+conversion a 422 with the reason. GET /status returns counters as json.
+
+Jobs run one at a time, the shared match cache is not thread safe.
+'''
+import sisxmlparser3_0 as sisxmlparser
+import sta2extsta as sta2extsta
+from sta2extstaClient import DEFAULT_HOST, DEFAULT_PORT
+from xerces_validate import xerces_validate_many
+
+import argparse
+import copy
+import http.server
+import io
+import json
+import os
+import signal
+import socketserver
+import sys
+import tempfile
+import time
+import urllib.parse
+
+VERBOSE = False
+
+# query string options a job may set, with how to read them
+JOB_OPTIONS = {'namespace': str,
+               'operator': str,
+               'onlychan': str,
+               'onlysta': str,
+               'delcurrent': bool,
+               'ignorewarning': bool,
+               'compact': bool,
+               'serializer': str,
+              }
+
+def setVerbose(b):
+    global VERBOSE
+    VERBOSE = b
+
+def initArgParser():
+  parser = argparse.ArgumentParser(description='Serve sta2extsta conversions with the NRL loaded once.')
+  sta2extsta.addConversionArgs(parser)
+  parser.add_argument('--host', default=DEFAULT_HOST, help="address to listen on, only localhost is sensible")
+  parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="port to listen on")
+  parser.add_argument('--socket', help="listen on this Unix socket instead of a port")
+  parser.add_argument('--javaworkers', type=int, default=1, help="number of java validators to keep running once input lxml can not validate is seen")
+  parser.set_defaults(shardby=None, shardsuffix='.xml', exportworkers=1, compresslevel=None)
+  return parser.parse_args()
+
+def boolOption(value):
+    return value.lower() in ('1', 'true', 'yes', '')
+
+def jobArgs(defaultArgs, query):
+    '''
+    copy of defaultArgs with the JOB_OPTIONS given in query, a dict from
+    urllib.parse.parse_qs. Raises ValueError for an unknown option.
+    '''
+    args = copy.copy(defaultArgs)
+    for k, v in query.items():
+        if k not in JOB_OPTIONS:
+            raise ValueError("unknown option %s, known are %s"%(k, ", ".join(sorted(JOB_OPTIONS.keys()))))
+        if JOB_OPTIONS[k] is bool:
+            setattr(args, k, boolOption(v[-1]))
+        else:
+            setattr(args, k, v[-1])
+    if args.serializer not in sisxmlparser.EXPORT_BACKENDS:
+        raise ValueError("serializer must be one of %s"%(sisxmlparser.EXPORT_BACKENDS,))
+    return args
+
+class ConversionDaemon(object):
+    '''the warm ConversionState plus job counters'''
+
+    def __init__(self, parseArgs, state):
+        self.parseArgs = parseArgs
+        self.state = state
+        self.started = time.time()
+        self.numJobs = 0
+        self.numFailed = 0
+        self.totalSeconds = 0.0
+
+    def status(self):
+        return {'nrl': str(self.state.nrl),
+                'matcher': self.state.matcher,
+                'uptime': time.time()-self.started,
+                'jobs': self.numJobs,
+                'failed': self.numFailed,
+                'seconds': self.totalSeconds,
+                'cachedResponses': self.state.numCached,
+                'cacheHits': self.state.numCacheHits,
+                'cacheEvictions': self.state.numCacheEvictions,
+               }
+
+    def convert(self, body, query):
+        '''
+        convert StationXML bytes, returns (http status, content type, bytes)
+        '''
+        start = time.time()
+        self.numJobs += 1
+        try:
+            args = jobArgs(self.parseArgs, query)
+        except ValueError as e:
+            self.numFailed += 1
+            return 400, 'text/plain', str(e).encode('utf-8')
+        # validator and parser read files, so spool the body, which may be compressed
+        with tempfile.NamedTemporaryFile(suffix='.xml') as tmp:
+            tmp.write(body)
+            tmp.flush()
+            errors = xerces_validate_many([tmp.name], poolSize=self.parseArgs.javaworkers)[tmp.name]
+            if len(errors) > 0:
+                self.numFailed += 1
+                return 400, 'text/plain', ("invalid stationxml document, errors:\n"+"\n".join([str(e) for e in errors])).encode('utf-8')
+            try:
+                rootobj = sisxmlparser.parse(tmp.name, False, intern=args.intern)
+                sisRoot = sta2extsta.convert(rootobj, args, self.state)
+                if sisRoot is None:
+                    raise Exception("conversion stopped, see daemon output")
+                out = io.StringIO()
+                sta2extsta.writeOutput(sisRoot, args, out)
+            except Exception as e:
+                self.numFailed += 1
+                return 422, 'text/plain', ("%s: %s"%(type(e).__name__, e)).encode('utf-8')
+        seconds = time.time()-start
+        self.totalSeconds += seconds
+        if VERBOSE: print("job %d converted in %.3f s"%(self.numJobs, seconds))
+        return 200, 'application/xml', out.getvalue().encode('utf-8')
+
+class ConversionHandler(http.server.BaseHTTPRequestHandler):
+
+    def address_string(self):
+        # Unix socket clients have no address
+        if isinstance(self.client_address, tuple) and len(self.client_address) > 0:
+            return self.client_address[0]
+        return 'local'
+
+    def log_message(self, format, *args):
+        if VERBOSE:
+            http.server.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+    def reply(self, status, contentType, content):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path == '/status':
+            self.reply(200, 'application/json', json.dumps(self.server.daemon.status(), indent=2).encode('utf-8'))
+        else:
+            self.reply(404, 'text/plain', b"GET /status or POST /convert")
+
+    def do_POST(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != '/convert':
+            self.reply(404, 'text/plain', b"POST /convert")
+            return
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+        query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+        self.reply(*self.server.daemon.convert(body, query))
+
+class ConversionHTTPServer(http.server.HTTPServer):
+    def __init__(self, address, daemon):
+        self.daemon = daemon
+        http.server.HTTPServer.__init__(self, address, ConversionHandler)
+
+class ConversionUnixServer(socketserver.UnixStreamServer):
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        socketserver.UnixStreamServer.__init__(self, path, ConversionHandler)
+
+def main():
+    parseArgs = initArgParser()
+    if parseArgs.verbose:
+        setVerbose(True)
+        sta2extsta.VERBOSE = True
+        for k, v in vars(parseArgs).items():
+            print("    Args: %s %s"%(k, v))
+    state = sta2extsta.loadConversionState(parseArgs)
+    if state is None:
+        return
+    print("load NRL %s"%(parseArgs.nrl,))
+    state.warm()
+    daemon = ConversionDaemon(parseArgs, state)
+    if parseArgs.socket:
+        if os.path.exists(parseArgs.socket):
+            os.remove(parseArgs.socket)
+        server = ConversionUnixServer(parseArgs.socket, daemon)
+        print("listening on %s"%(parseArgs.socket,))
+    else:
+        server = ConversionHTTPServer((parseArgs.host, parseArgs.port), daemon)
+        print("listening on http://%s:%d"%(parseArgs.host, parseArgs.port))
+    sys.stdout.flush()
+    # clean up the socket on kill as well as on ctrl-c
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if parseArgs.socket and os.path.exists(parseArgs.socket):
+            os.remove(parseArgs.socket)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
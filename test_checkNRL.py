@@ -0,0 +1,40 @@
+'''
+python -m unittest test_checkNRL
+'''
+import checkNRL as checkNRL
+
+import unittest
+
+def sameRoots(rootsA, rootsB):
+    return checkNRL.checkMultiple(checkNRL.canonicalRootsChecklist("pole", rootsA, rootsB))[0]
+
+class CanonicalRootsChecklistTest(unittest.TestCase):
+
+    def testSameOrder(self):
+        poles = [(-0.037004, 0.037004), (-0.037004, -0.037004), (-251.33, 0.0)]
+        self.assertTrue(sameRoots(poles, list(poles)))
+
+    def testReorderedPoles(self):
+        poles = [(-0.037004, 0.037004), (-0.037004, -0.037004), (-251.33, 0.0), (-131.04, -467.29), (-131.04, 467.29)]
+        reordered = [(-131.04, 467.29), (-131.04, -467.29), (-251.33, 0.0), (-0.037004, -0.037004), (-0.037004, 0.037004)]
+        self.assertTrue(sameRoots(poles, reordered))
+
+    def testRoundingBoundarySameOrder(self):
+        # within tolerance, but 1.2349 and 1.2351 round to different 3 digit values
+        polesA = [(-1.2349, 0.0), (-1.2380, 0.0)]
+        polesB = [(-1.2351, 0.0), (-1.2378, 0.0)]
+        self.assertTrue(sameRoots(polesA, polesB))
+
+    def testRoundingBoundaryReordered(self):
+        polesA = [(-1.2349, 0.0), (-1.2380, 0.0)]
+        polesB = [(-1.2378, 0.0), (-1.2351, 0.0)]
+        self.assertTrue(sameRoots(polesA, polesB))
+
+    def testDifferentPoles(self):
+        polesA = [(-1.2349, 0.0), (-1.2380, 0.0)]
+        polesB = [(-1.2349, 0.0), (-1.2480, 0.0)]
+        self.assertFalse(sameRoots(polesA, polesB))
+
+
+if __name__ == "__main__":
+    unittest.main()
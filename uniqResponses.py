@@ -3,7 +3,9 @@
 find unique responses in fdsn stationxml file
 '''
 import checkNRL as checkNRL
+import inventoryPasses as inventoryPasses
 import sisxmlparser3_0 as sisxmlparser
+from instrumentation import instrumented
 
 import datetime
 import os
@@ -12,6 +14,9 @@ import sys
 
 VERBOSE=False
 
+# totals for this process, reported by sta2extsta.py --profile
+COUNTERS = {'responseComparisons': 0}
+
 def setVerbose(b):
     VERBOSE = b
 
@@ -37,13 +42,9 @@ def samePolesZeros(pzA, pzB):
     ])
     if not result[0]:
          return result
-    checklist = []
-    for zi in range(len(zerosA)):
-         checklist.append(("%d zero real"%(zi,), float(pzA.Zero[zi].Real.ValueOf), float(pzB.Zero[zi].Real.ValueOf), 0.001))
-         checklist.append(("%d zero imag"%(zi,), float(pzA.Zero[zi].Imaginary.ValueOf), float(pzB.Zero[zi].Imaginary.ValueOf), 0.001))
-    for pi in range(len(polesA)):
-         checklist.append(("%d pole real"%(pi,), float(pzA.Pole[pi].Real.ValueOf), float(pzB.Pole[pi].Real.ValueOf), 0.001))
-         checklist.append(("%d pole imag"%(pi,), float(pzA.Pole[pi].Imaginary.ValueOf), float(pzB.Pole[pi].Imaginary.ValueOf), 0.001))
+    # pole/zero order in the xml does not matter, see canonicalRootsChecklist
+    checklist = checkNRL.canonicalRootsChecklist("zero", checkNRL.staxmlRoots(zerosA), checkNRL.staxmlRoots(zerosB))
+    checklist += checkNRL.canonicalRootsChecklist("pole", checkNRL.staxmlRoots(polesA), checkNRL.staxmlRoots(polesB))
     result = checkNRL.checkMultiple(checklist)
     return result
 
@@ -111,6 +112,7 @@ def sameGain(stageA, stageB):
 
 
 
+@instrumented
 def areSameStage(stageA, stageB):
     result = areSameStageType(stageA, stageB)
     if not result[0]:
@@ -141,7 +143,9 @@ def areSameStageByIndex(respA, respB, stageIndex):
         return result
     return True, "ok"
 
+@instrumented
 def areSameResponse(respA, respB):
+    COUNTERS['responseComparisons'] += 1
     stageA = getattr(respA, 'Stage', [])
     stageB = getattr(respB, 'Stage', [])
     if VERBOSE: print("areSameResponse: ")
@@ -157,34 +161,106 @@ def areSameResponse(respA, respB):
             return result
     return True, "ok"
 
-def uniqueResponses(staxml):
-    uniqResponse = []
-    for n in staxml.Network:
-      for s in n.Station:
-        for c in s.Channel:
-          chanCode = checkNRL.getChanCodeId(n, s, c)
-          foundMatch = None
-          if VERBOSE: print("chanCode %s "%(chanCode, ))
-#          print "chanCode %s numStage = %d"%(chanCode, len(c.Response.Stage),)
-          for uResp in uniqResponse:
-#              try:
-              result = areSameResponse(c.Response, uResp[1])
-#              except:
-#                e =  sys.exc_info()[0]
-#                print "Error comparing %s, %s"%(uResp[0], e)
-#                result = False, " %s"%(e,)
-#                return
-              if VERBOSE: print("areSame %s: %s"%(result[0], result[1],))
-              if result[0]:
-                  foundMatch = uResp
-                  break
-          if foundMatch is None:
-              uniqResponse.append( ( chanCode, c.Response, [ chanCode] ) )
-              if VERBOSE: print("no match %d"%(len(uniqResponse),))
-          else:
-              foundMatch[2].append(chanCode)
-              if VERBOSE: print("found match %s  %s"%(chanCode, foundMatch[0]))
-    return uniqResponse
+def stageKey(stage):
+    '''
+    hashable key for a stage, stages that areSameStage must have the same key,
+    so only fields areSameStage compares exactly are used, not values
+    compared with a tolerance
+    '''
+    if hasattr(stage, 'PolesZeros'):
+        pz = stage.PolesZeros
+        key = ('PolesZeros', pz.PzTransferFunctionType, len(getattr(pz, 'Zero', [])), len(getattr(pz, 'Pole', [])))
+    elif hasattr(stage, 'Coefficients'):
+        key = ('Coefficients', stage.Coefficients.CfTransferFunctionType, len(getattr(stage.Coefficients, 'Numerator', [])), len(getattr(stage.Coefficients, 'Denominator', [])))
+    elif hasattr(stage, 'FIR'):
+        key = ('FIR', stage.FIR.Symmetry, len(getattr(stage.FIR, 'NumeratorCoefficient', [])))
+    elif hasattr(stage, 'Polynomial'):
+        key = ('Polynomial',)
+    else:
+        key = (None,)
+    if hasattr(stage, 'Decimation'):
+        key = key + (stage.Decimation.Factor,)
+    return key + (hasattr(stage, 'StageGain'),)
+
+def responseKey(resp):
+    '''hashable key for a response, responses that areSameResponse must have the same key'''
+    return tuple([stageKey(stage) for stage in getattr(resp, 'Stage', [])])
+
+class StageRegistry(object):
+    '''
+    named stages bucketed by stageKey, so finding an already added stage
+    only runs areSameStage against the stages with the same structure.
+    '''
+    def __init__(self):
+        self.buckets = {}
+        self.numStages = 0
+
+    def find(self, stage):
+        '''name of the first added stage that areSameStage as stage, or None'''
+        for name, oldStage in self.buckets.get(stageKey(stage), []):
+            if areSameStage(stage, oldStage)[0]:
+                return name
+        return None
+
+    def add(self, name, stage):
+        self.buckets.setdefault(stageKey(stage), []).append((name, stage))
+        self.numStages += 1
+
+class UniqueResponsesPass(inventoryPasses.InventoryPass):
+    '''
+    collects the unique responses, uniqResponse is a list of tuples
+    (chanCode, response, chanCodeList). Does not change the tree.
+    '''
+    name = 'uniqueResponses'
+
+    def __init__(self, changes=None):
+        inventoryPasses.InventoryPass.__init__(self, changes)
+        self.uniqResponse = []
+        # unique responses bucketed by responseKey so only plausible matches are compared
+        self.uniqByKey = {}
+
+    def visitChannel(self, n, s, c, chanCode):
+        uniqResponse = self.uniqResponse
+        uniqByKey = self.uniqByKey
+        foundMatch = None
+        if VERBOSE: print("chanCode %s "%(chanCode, ))
+#        print "chanCode %s numStage = %d"%(chanCode, len(c.Response.Stage),)
+        key = responseKey(c.Response)
+        if not key in uniqByKey:
+            uniqByKey[key] = []
+        for uResp in uniqByKey[key]:
+#            try:
+            result = areSameResponse(c.Response, uResp[1])
+#            except:
+#              e =  sys.exc_info()[0]
+#              print "Error comparing %s, %s"%(uResp[0], e)
+#              result = False, " %s"%(e,)
+#              return
+            if VERBOSE: print("areSame %s: %s"%(result[0], result[1],))
+            if result[0]:
+                foundMatch = uResp
+                break
+        if foundMatch is None:
+            uniqResponse.append( ( chanCode, c.Response, [ chanCode] ) )
+            uniqByKey[key].append(uniqResponse[-1])
+            if VERBOSE: print("no match %d"%(len(uniqResponse),))
+        else:
+            foundMatch[2].append(chanCode)
+            if VERBOSE: print("found match %s  %s"%(chanCode, foundMatch[0]))
+
+    def result(self, withIndex=False):
+        if withIndex:
+            return self.uniqResponse, checkNRL.chanCodeIndex(self.uniqResponse)
+        return self.uniqResponse
+
+def uniqueResponses(staxml, withIndex=False):
+    '''
+    returns list of tuples (chanCode, response, chanCodeList), one per unique
+    response, or if withIndex the list and a dict of chanCodeId to its tuple
+    '''
+    uniqPass = UniqueResponsesPass()
+    inventoryPasses.runPasses(staxml, [uniqPass])
+    return uniqPass.result(withIndex)
 
 def usage():
     print("python uniqueResponses <staxml>")
@@ -202,7 +278,7 @@ def main():
     print("Find unique responses")
     uniq = uniqueResponses(staxml)
     print("NRL check unique responses")
-    nrledUniq = checkNRL.checkRespListInNRL('nrl', uniq, 'logger_samp_rate.sort')
+    nrledUniq = checkNRL.checkRespListInNRL('nrl', uniq)
     numChans = 0
     print("found %d uniq responses "%(len(uniq), ))
     for x in nrledUniq:
@@ -5,6 +5,7 @@ Utah's response data files.
 '''
 import sta2extsta as sta2extsta
 import checkNRL as checkNRL
+import nrlSource as nrlSource
 import sisxmlparser3_0 as sisxmlparser
 import uniqResponses as uniqResponses
 import cleanUnitNames as cleanUnitNames
@@ -37,7 +38,7 @@ def initArgParser():
     parser = argparse.ArgumentParser(description='Convert Utah Resp dir to ExtendedStationXML.')
     parser.add_argument('-s', '--stationxml', required=True, help="input FDSN StationXML file, often retrieved from http://service.iris.edu/fdsnws/station/1/")
     parser.add_argument('-d', '--dir', required=True, help="input directory with Utah resp files")
-    parser.add_argument('--nrl', default='nrl', help="replace matching responses with links to NRL")
+    parser.add_argument('--nrl', default='nrl', help="replace matching responses with links to NRL, either a directory or a zip archive of the NRL")
     parser.add_argument('--namespace', default='Testing', help="SIS namespace to use for named responses, see http://anss-sis.scsn.org/sis/master/namespace/")
     parser.add_argument('--operator', default='Testing', help="SIS operator to use for stations, see http://anss-sis.scsn.org/sis/master/org/")
     parser.add_argument('--delcurrent', action="store_true", help="remove channels that are currently operating. Only do this if you want to go back and manually via the web interface add hardware for current epochs.")
@@ -100,89 +101,65 @@ def subtractZero(utahResp):
         raise e
     return out
 
+def utahRoots(pzList):
+    return [(float(pz[0]), float(pz[1])) for pz in pzList]
+
+def sensorChecklist(utahResp, b53):
+    '''compare utah poles and zeros to a NRL b53, in any order'''
+    checklist = checkNRL.canonicalRootsChecklist("zero", utahRoots(utahResp['ZEROS']), checkNRL.respRoots(b53.get('10-13', [])))
+    checklist += checkNRL.canonicalRootsChecklist("pole", utahRoots(utahResp['POLES']), checkNRL.respRoots(b53.get('15-18', [])))
+    return checklist
+
 def findSensors(nrlDir, utahResp):
     out = []
     sensorLine = utahResp['Seismometer']
     manuf = sensorLine[0]
     if manuf == 'Trillium':
         manuf = 'nanometrics'
-    # nrl sorts poles/zeros by positive imag first, then neg imaginary
-    for idx in range(len(utahResp['ZEROS'])-1):
-        if utahResp['ZEROS'][idx][0] == utahResp['ZEROS'][idx+1][0] \
-        and utahResp['ZEROS'][idx][1] == "-{}".format(utahResp['ZEROS'][idx+1][1]):
-            tmp = utahResp['ZEROS'][idx]
-            utahResp['ZEROS'][idx] = utahResp['ZEROS'][idx+1]
-            utahResp['ZEROS'][idx+1] = tmp
-
-    for idx in range(len(utahResp['POLES'])-1):
-        if utahResp['POLES'][idx][0] == utahResp['POLES'][idx+1][0] \
-        and utahResp['POLES'][idx][1] == "-{}".format(utahResp['POLES'][idx+1][1]):
-            tmp = utahResp['POLES'][idx]
-            utahResp['POLES'][idx] = utahResp['POLES'][idx+1]
-            utahResp['POLES'][idx+1] = tmp
-
+    # nrl and utah may list poles/zeros in different order, ie conjugate
+    # pairs, checkNRL.canonicalRootsChecklist pairs them whatever the order
     velUtahResp = subtractZero(utahResp)
     accUtahResp = subtractZero(velUtahResp)
-    if VERBOSE: print("walk {} for sensor {} {}".format(nrlDir,sensorLine[0], sensorLine[1]))
-    for root, dirs, files in os.walk("{}/sensors/{}/".format(nrlDir,manuf.lower())):
-      if '.svn' in dirs:
-        dirs.remove('.svn')
-      for respfile in files:
-        if respfile.startswith("RESP"):
-            if VERBOSE: print("try {}".format(respfile))
-            nrlResp = checkNRL.loadResp(os.path.join(root, respfile))
-            b53 = checkNRL.findRespBlockette(nrlResp, 1, '053')
-            if b53 is not None:
-                accResult = checkNRL.checkMultiple( [
-                  ("num zeros", len(accUtahResp['ZEROS']), int(b53['09'])),
-                  ("num poles", len(accUtahResp['POLES']), int(b53['14']))
-                  #("A0 norm factor", utahResp['CONSTANT'], float(b53['07']), 0.001)
-                ])
-                if accResult[0]:
-                    checklist = []
-                    zeros = accUtahResp['ZEROS']
-                    poles = accUtahResp['POLES']
-                    for zi in range(len(zeros)):
-                        checklist.append(("%d zero real"%(zi,), float(zeros[zi][0]), float(b53['10-13'][zi][1]), 0.001))
-                        checklist.append(("%d zero imag"%(zi,), float(zeros[zi][1]), float(b53['10-13'][zi][2]), 0.001))
-                    for pi in range(len(poles)):
-                        checklist.append(("%d pole real"%(pi,), float(poles[pi][0]), float(b53['15-18'][pi][1]), 0.001))
-                        checklist.append(("%d pole imag"%(pi,), float(poles[pi][1]), float(b53['15-18'][pi][2]), 0.001))
-                    accResult = checkNRL.checkMultiple(checklist)
-
-                if accResult[0]:
-                    out.append({'type': 'acc', 'filename': respfile, 'nrlResp': nrlResp})
-                else:
-                    #print(result)
-                    try:
-                        #print("Try sub zero {} {}: {}".format(len(utahResp['ZEROS']), len(velUtahResp['ZEROS']), velUtahResp))
-                        velResult = checkNRL.checkMultiple( [
-                          ("num zeros", len(velUtahResp['ZEROS']), int(b53['09'])),
-                          ("num poles", len(velUtahResp['POLES']), int(b53['14']))
-                          #("A0 norm factor", velUtahResp['CONSTANT'], float(b53['07']), 0.001)
-                        ])
-                        if int(b53['09']) != 0 and int(b53['09']) != len(b53['10-13']):
-                            raise Exception('b53 has wrong number zeros: {} {}'.format(int(b53['09']), len(b53['10-13'])))
-                        if velResult[0]:
-                            checklist = []
-                            zeros = velUtahResp['ZEROS']
-                            poles = velUtahResp['POLES']
-                            for zi in range(len(zeros)):
-                                checklist.append(("%d zero real"%(zi,), float(zeros[zi][0]), float(b53['10-13'][zi][1]), 0.001))
-                                checklist.append(("%d zero imag"%(zi,), float(zeros[zi][1]), float(b53['10-13'][zi][2]), 0.001))
-                            for pi in range(len(poles)):
-                                checklist.append(("%d pole real"%(pi,), float(poles[pi][0]), float(b53['15-18'][pi][1]), 0.001))
-                                checklist.append(("%d pole imag"%(pi,), float(poles[pi][1]), float(b53['15-18'][pi][2]), 0.001))
-                            velResult = checkNRL.checkMultiple(checklist)
-
-                        if velResult[0]:
-                            out.append({'type':'vel', 'filename': respfile, 'nrlResp': nrlResp})
-                        else:
-                            #print(velResult)
-                            pass
-                    except Exception as e:
-                        print("Skip subtractZero for {}, {}".format(utahResp['filename'], e))
-                        raise e
+    source = nrlSource.openNRL(nrlDir)
+    if VERBOSE: print("walk {} for sensor {} {}".format(source,sensorLine[0], sensorLine[1]))
+    for path in source.walk("sensors/{}".format(manuf.lower())):
+        respfile = os.path.basename(path)
+        if VERBOSE: print("try {}".format(respfile))
+        nrlResp = checkNRL.loadResp(path, source)
+        b53 = checkNRL.findRespBlockette(nrlResp, 1, '053')
+        if b53 is not None:
+            accResult = checkNRL.checkMultiple( [
+              ("num zeros", len(accUtahResp['ZEROS']), int(b53['09'])),
+              ("num poles", len(accUtahResp['POLES']), int(b53['14']))
+              #("A0 norm factor", utahResp['CONSTANT'], float(b53['07']), 0.001)
+            ])
+            if accResult[0]:
+                accResult = checkNRL.checkMultiple(sensorChecklist(accUtahResp, b53))
+
+            if accResult[0]:
+                out.append({'type': 'acc', 'filename': respfile, 'nrlResp': nrlResp})
+            else:
+                #print(result)
+                try:
+                    #print("Try sub zero {} {}: {}".format(len(utahResp['ZEROS']), len(velUtahResp['ZEROS']), velUtahResp))
+                    velResult = checkNRL.checkMultiple( [
+                      ("num zeros", len(velUtahResp['ZEROS']), int(b53['09'])),
+                      ("num poles", len(velUtahResp['POLES']), int(b53['14']))
+                      #("A0 norm factor", velUtahResp['CONSTANT'], float(b53['07']), 0.001)
+                    ])
+                    if int(b53['09']) != 0 and int(b53['09']) != len(b53['10-13']):
+                        raise Exception('b53 has wrong number zeros: {} {}'.format(int(b53['09']), len(b53['10-13'])))
+                    if velResult[0]:
+                        velResult = checkNRL.checkMultiple(sensorChecklist(velUtahResp, b53))
+
+                    if velResult[0]:
+                        out.append({'type':'vel', 'filename': respfile, 'nrlResp': nrlResp})
+                    else:
+                        #print(velResult)
+                        pass
+                except Exception as e:
+                    print("Skip subtractZero for {}, {}".format(utahResp['filename'], e))
+                    raise e
 
     return out
 
@@ -239,12 +216,12 @@ def main():
                     s.Channel = tempChan
 
         # sample rate index for loggers
-        spsIndex = os.path.join(parseArgs.nrl, "logger_sample_rate.sort")
-        if not os.path.exists(spsIndex):
+        nrl = nrlSource.openNRL(parseArgs.nrl)
+        loggerRateIndex = checkNRL.loadSampleRateIndex(nrl)
+        if loggerRateIndex is None:
             print("ERROR: can't fine sps index file for NRL. Should be logger_sample_rate.sort inside NRL directory")
             print("python checkNRL.py --samplerate --nrl <path_to_nrl>")
             return
-        loggerRateIndex = checkNRL.loadRespfileSampleRate(spsIndex)
 
         for n in rootobj.Network:
             for s in n.Station:
@@ -255,7 +232,7 @@ def main():
                         print("No Utah resp files found for {}.{} {}".format(s.code, c.code, c.startDate))
                     for u in utah:
                         print("Try: {} {}".format(u['filename'], u['Seismometer']))
-                        possibleSensors = findSensors(parseArgs.nrl, u)
+                        possibleSensors = findSensors(nrl, u)
                         if len(possibleSensors) == 0:
                             print("No possible NRL sensors found for {} {}".format(checkNRL.getChanCodeId(n, s, c), len(possibleSensors)))
                         for p in possibleSensors:
@@ -1,13 +1,309 @@
+import atexit
+import concurrent.futures
 import os
+import queue
+import shutil
 import subprocess
+import tempfile
+import threading
+
+import compressedFile
+
+from lxml import etree
 
 SCHEMA_FILE = "sis_extension_3.0.xsd"
+FDSN_SCHEMA_FILE = "fdsn-station-1.1.xsd"
+SIS_NS = "http://anss-sis.scsn.org/xml/ext-stationxml/3.0"
+
+# validate in process with lxml when the schema compiles, Java is the
+# fallback for schemas lxml can't handle, ie XSD 1.1 features in the sis schema
+USE_LXML = True
+
+_compiledSchemas = {}
+# an XMLSchema keeps the errors of its last validate in error_log, so validate
+# and reading error_log are done holding this, ie xerces_validate_async runs
+# in a thread next to validation in the main thread
+_schemaLock = threading.Lock()
+
+XERCES_DIR = 'xerces-2_12_2-xml-schema-1.1'
+WORKER_CLASS = 'XercesValidateWorker'
+WORKER_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), WORKER_CLASS+'.java')
+
+# shared pool of java workers, see startPool
+_pool = None
+
+class ValidationError(object):
+    '''one schema error, with line and column in the document'''
+    def __init__(self, line, column, message):
+        self.line = line
+        self.column = column
+        self.message = message
+
+    def __str__(self):
+        return "%s:%s %s"%(self.line, self.column, self.message)
+
+def loadSchema(schemaFile):
+    '''
+    returns lxml XMLSchema for schemaFile, compiled once per process and
+    reused, or None if the file is missing or lxml can't compile it.
+    '''
+    with _schemaLock:
+        if schemaFile not in _compiledSchemas:
+            schema = None
+            if os.path.exists(schemaFile):
+                try:
+                    schema = etree.XMLSchema(etree.parse(schemaFile))
+                except etree.XMLSchemaParseError as e:
+                    print("INFO: lxml can't compile %s, fall back to java: %s"%(schemaFile, e))
+            _compiledSchemas[schemaFile] = schema
+        return _compiledSchemas[schemaFile]
+
+def usesSISNamespace(doc):
+    for el in doc.iter(tag=etree.Element):
+        if SIS_NS in el.nsmap.values():
+            return True
+    return False
+
+def lxml_validate(stationxml):
+    '''
+    validates stationxml in process, returns list of ValidationError, empty
+    if valid, or None if there is no compiled schema for the document.
+    Plain FDSN StationXML is checked with the FDSN schema, documents using
+    the sis namespace with the sis extension schema.
+    '''
+    try:
+        with compressedFile.xmlSource(stationxml) as source:
+            doc = etree.parse(source)
+    except etree.XMLSyntaxError as e:
+        return [ValidationError(err.line, err.column, err.message) for err in e.error_log]
+    if usesSISNamespace(doc):
+        schema = loadSchema(SCHEMA_FILE)
+    else:
+        schema = loadSchema(FDSN_SCHEMA_FILE)
+    if schema is None:
+        return None
+    with _schemaLock:
+        if schema.validate(doc):
+            return []
+        return [ValidationError(err.line, err.column, err.message) for err in schema.error_log]
+
+def xercesClasspath():
+    classpath = '.:xmlvalidator'
+    jarList = ['xercesImpl.jar',
+               'xml-apis.jar',
+               'serializer.jar',
+               'org.eclipse.wst.xml.xpath2.processor_1.2.0.jar']
+    for j in jarList:
+        classpath = classpath+':'+XERCES_DIR+"/"+j
+    return classpath
+
+def printValidatorMissing():
+    print("""
+ERROR: Can't find validator: %s %s
+
+        wget http://mirror.cc.columbia.edu/pub/software/apache//xerces/j/binaries/Xerces-J-bin.2.12.2-xml-schema-1.1.tar.gz
+        tar zxf Xerces-J-bin.2.12.2-xml-schema-1.1.tar.gz
+        wget http://maui.gps.caltech.edu/SIStrac/raw-attachment/wiki/SIS/Code/validator.tar.gz
+        tar ztf validator.tar.gz
+
+We assume the directories validator and xerces-2_12_2-xml-schema-1.1
+are in current directory for validation.
+        """%(os.path.exists('xerces-2_12_2-xml-schema-1.1') , os.path.exists('validator/ValidateStationXml.class')))
+
+def compileWorker():
+    '''
+    javac XercesValidateWorker.java into xmlvalidator if the class is missing
+    or out of date, returns False if there is no validator or javac fails
+    '''
+    if not os.path.exists(XERCES_DIR):
+        printValidatorMissing()
+        return False
+    classFile = os.path.join('xmlvalidator', WORKER_CLASS+'.class')
+    if not os.path.exists(classFile) or os.path.getmtime(classFile) < os.path.getmtime(WORKER_SOURCE):
+        try:
+            subprocess.check_call(['javac', '-cp', xercesClasspath(), '-d', 'xmlvalidator', WORKER_SOURCE])
+        except (OSError, subprocess.CalledProcessError) as e:
+            print("ERROR: can't compile %s: %s"%(WORKER_SOURCE, e))
+            printValidatorMissing()
+            return False
+    return True
+
+class XercesWorker(object):
+    '''
+    one long lived JVM running XercesValidateWorker, the schema is compiled
+    once when started and each validate call is a round trip over stdin/stdout.
+    '''
+    def __init__(self, schemaFile=SCHEMA_FILE):
+        self.proc = subprocess.Popen(['java', '-cp', xercesClasspath(), WORKER_CLASS, schemaFile],
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                     universal_newlines=True, bufsize=1)
+
+    def validate(self, stationxml):
+        '''returns list of ValidationError, empty if valid'''
+        self.proc.stdin.write(os.path.abspath(stationxml)+"\n")
+        self.proc.stdin.flush()
+        errors = []
+        while True:
+            line = self.proc.stdout.readline()
+            if line == '':
+                # wait so poll sees the exit and the pool replaces this worker
+                raise Exception("xerces validator worker exited, return code %s"%(self.proc.wait(),))
+            split = line.rstrip("\n").split("\t", 2)
+            if split[0] == 'DONE':
+                return errors
+            errors.append(ValidationError(int(split[0]), int(split[1]), split[2]))
+
+    def close(self):
+        self.proc.stdin.close()
+        self.proc.wait()
+
+class XercesPool(object):
+    '''
+    small pool of XercesWorker JVMs, started as needed up to size, so
+    many files are validated without JVM startup and schema compile per file.
+    The worker class must already be compiled, see compileWorker.
+    '''
+    def __init__(self, size=2, schemaFile=SCHEMA_FILE):
+        self.size = size
+        self.schemaFile = schemaFile
+        self.workers = []
+        self.idle = queue.Queue()
+        self.lock = threading.Lock()
+
+    def _acquire(self):
+        with self.lock:
+            if self.idle.empty() and len(self.workers) < self.size:
+                worker = XercesWorker(self.schemaFile)
+                self.workers.append(worker)
+                return worker
+        return self._restartIfExited(self.idle.get())
+
+    def _restartIfExited(self, worker):
+        '''worker, or a new one in its place if its JVM has exited'''
+        if worker.proc.poll() is None:
+            return worker
+        with self.lock:
+            self.workers.remove(worker)
+            worker = XercesWorker(self.schemaFile)
+            self.workers.append(worker)
+        return worker
+
+    def validate(self, stationxml):
+        '''
+        returns list of ValidationError, empty if valid. If the JVM can't be
+        started or dies the list has that one error, so the other files of
+        a validateMany are still validated, the dead JVM is replaced.
+        '''
+        try:
+            worker = self._acquire()
+        except OSError as e:
+            return [ValidationError(0, 0, "can't start java validator: %s"%(e,))]
+        try:
+            return worker.validate(stationxml)
+        except Exception as e:
+            return [ValidationError(0, 0, "java validator failed: %s"%(e,))]
+        finally:
+            self.idle.put(worker)
+
+    def validateMany(self, fileList):
+        '''returns dict of file to list of ValidationError, validated concurrently on the pool'''
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.size) as executor:
+            return dict(zip(fileList, executor.map(self.validate, fileList)))
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.workers = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def startPool(size=2):
+    '''
+    start the shared java worker pool used by xerces_validate for documents
+    lxml can't validate. Worth it when validating many files in one process.
+    Returns None if the java validator is missing.
+    '''
+    global _pool
+    if _pool is None:
+        if not compileWorker():
+            return None
+        _pool = XercesPool(size)
+        atexit.register(stopPool)
+    return _pool
+
+def stopPool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+def xerces_validate_many(fileList, poolSize=2):
+    '''
+    validate many files, returns dict of file to list of ValidationError.
+    Files lxml can validate are done in process, the rest on the java pool.
+    '''
+    out = {}
+    javaList = []
+    for stationxml in fileList:
+        errors = lxml_validate(stationxml) if USE_LXML else None
+        if errors is None:
+            javaList.append(stationxml)
+        else:
+            out[stationxml] = errors
+    if len(javaList) > 0:
+        pool = startPool(poolSize)
+        if pool is None:
+            for stationxml in javaList:
+                out[stationxml] = [ValidationError(0, 0, "can't validate without the java validator")]
+        else:
+            out.update(pool.validateMany(javaList))
+    return out
+
+def xerces_validate_async(stationxml):
+    '''
+    start xerces_validate in a background thread, so the caller can parse
+    the same file meanwhile. Returns a Future whose result is the bool from
+    xerces_validate.
+    '''
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(xerces_validate, stationxml)
+    executor.shutdown(wait=False)
+    return future
+
+def reportErrors(errors):
+    if len(errors) > 0:
+        print("  ERROR: invalid stationxml document, errors:")
+        for err in errors:
+            print("    %s"%(err,))
+        return False
+    print("  OK")
+    return True
 
 def xerces_validate(stationxml):
     if not os.path.exists(stationxml):
         print("ERROR: can't fine stationxml file %s"%(stationxml,))
         return False
 
+    if USE_LXML:
+        errors = lxml_validate(stationxml)
+        if errors is not None:
+            print("Validating xml...")
+            return reportErrors(errors)
+
+    if compressedFile.sniffCompression(stationxml) is not None:
+        # the java validator needs an uncompressed file
+        with tempfile.NamedTemporaryFile('w', suffix='.xml') as tmp:
+            with compressedFile.openInput(stationxml) as infile:
+                shutil.copyfileobj(infile, tmp)
+            tmp.flush()
+            return java_validate(tmp.name)
+    return java_validate(stationxml)
+
+def java_validate(stationxml):
     # validate with SIS validator
     # http://wiki.anss-sis.scsn.org/SIStrac/wiki/SIS/Code
 
@@ -20,18 +316,12 @@ wget -O sis_extension_3.0.xsd https://anss-sis.scsn.org/xml/ext-stationxml/3.0/s
         return False
 
 
-    if os.path.exists('xerces-2_12_2-xml-schema-1.1') and os.path.exists('xmlvalidator/ValidateStationXml.class'):
+    if os.path.exists(XERCES_DIR) and os.path.exists('xmlvalidator/ValidateStationXml.class'):
         print("Validating xml...")
+        if _pool is not None:
+            return reportErrors(_pool.validate(stationxml))
         try:
-            classpath = '.:xmlvalidator'
-            xercesDir = 'xerces-2_12_2-xml-schema-1.1'
-            jarList = ['xercesImpl.jar',
-                       'xml-apis.jar',
-                       'serializer.jar',
-                       'org.eclipse.wst.xml.xpath2.processor_1.2.0.jar']
-            for j in jarList:
-                classpath = classpath+':'+xercesDir+"/"+j
-
+            classpath = xercesClasspath()
             # 'xmlvalidator:xerces-2_12_0-xml-schema-1.1/xercesImpl.jar:xerces-2_11_0-xml-schema-1.1-beta/xml-apis.jar:xerces-2_11_0-xml-schema-1.1-beta/serializer.jar:xerces-2_11_0-xml-schema-1.1-beta/org.eclipse.wst.xml.xpath2.processor_1.1.0.jar:.'
             validateOut = subprocess.check_output(['java', '-cp', classpath, 'ValidateStationXml', '-s', SCHEMA_FILE, '-i', stationxml])
         except subprocess.CalledProcessError as e:
@@ -44,16 +334,5 @@ wget -O sis_extension_3.0.xsd https://anss-sis.scsn.org/xml/ext-stationxml/3.0/s
             print("  OK")
             return True
     else:
-        print("""
-ERROR: Can't find validator: %s %s
-
-        wget http://mirror.cc.columbia.edu/pub/software/apache//xerces/j/binaries/Xerces-J-bin.2.12.2-xml-schema-1.1.tar.gz
-        tar zxf Xerces-J-bin.2.12.2-xml-schema-1.1.tar.gz
-        wget http://maui.gps.caltech.edu/SIStrac/raw-attachment/wiki/SIS/Code/validator.tar.gz
-        tar ztf validator.tar.gz
-
-We assume the directories validator and xerces-2_12_2-xml-schema-1.1
-are in current directory for validation.
-        """%(os.path.exists('xerces-2_12_2-xml-schema-1.1') , os.path.exists('validator/ValidateStationXml.class')))
-
+        printValidatorMissing()
         return False